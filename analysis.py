@@ -0,0 +1,304 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+
+import settings
+from charts import render_charts
+from clustering import CLUSTER_FEATURES, ClusteringModel
+from datasets import DatasetNotFound, dataset_store
+from history import history_store
+from ingest import aggregate_chunks, aggregate_transacoes, read_campanhas, read_transacoes
+from metrics import StageClock
+from params import PIPELINE_VERSION, AnalysisParams
+from pipeline_cache import StageCache
+from registry import model_registry
+from regression import LinearModel, RegressionStats
+
+# Clientes de alto valor listados no resultado (a lista completa sai de /reports/{id}/clients)
+HIGH_VALUE_LIMIT = 10
+
+
+def _no_progress(stage):
+    pass
+
+
+def cluster_clientes(clientes, params, bundle):
+    # Modos score/update: aplica (ou atualiza) a clusterização de uma versão registrada
+    X = clientes[CLUSTER_FEATURES]
+    if params.model_mode == 'update':
+        # O pacote carregado fica no LRU do registro; a atualização trabalha sobre uma cópia
+        model = copy.deepcopy(bundle['clustering'])
+        X_scaled, labels = model.partial_fit(X)
+    else:
+        model = bundle['clustering']
+        X_scaled, labels = model.predict(X)
+    return model, X_scaled, labels
+
+
+def load_dataset(dataset_id):
+    # Agregados de um dataset já convertido: guardados como o primeiro estágio do
+    # pipeline (ver pipeline_cache.py); só são recalculados, a partir das colunas, na
+    # primeira análise
+    stage_cache = dataset_store.stage_cache(dataset_id)
+    agregados = stage_cache.get('aggregates', lambda: aggregate_chunks(dataset_store.read(dataset_id)))
+    return agregados, {'id': dataset_id, 'source': 'dataset'}, stage_cache
+
+
+def load_transacoes(transacoes_path, dataset_id=None):
+    # As transações são lidas em blocos e reduzidas a agregados por cliente/campanha.
+    # Um upload já convertido (dataset_id = hash do CSV) é lido do formato colunar;
+    # senão o CSV é convertido no mesmo passo da leitura (ver datasets.py)
+    if dataset_id is not None:
+        try:
+            return load_dataset(dataset_id)
+        except DatasetNotFound:
+            pass
+    if dataset_id is None or not settings.DATASET_STORE:
+        return aggregate_transacoes(transacoes_path), None, None
+
+    writer = dataset_store.writer(dataset_id)
+    try:
+        agregados = aggregate_chunks(writer.write_through(read_transacoes(transacoes_path)))
+        stored = writer.commit(csv_bytes=os.path.getsize(transacoes_path)) is not None
+    except BaseException:
+        writer.abort()
+        raise
+    if not stored:
+        return agregados, {'id': None, 'source': 'csv'}, None
+    # Os estágios desta análise já ficam guardados com o novo dataset
+    stage_cache = dataset_store.stage_cache(dataset_id)
+    stage_cache.put('aggregates', agregados)
+    return agregados, {'id': dataset_id, 'source': 'csv'}, stage_cache
+
+
+def run_analysis(transacoes_path, campanhas_path, params=AnalysisParams(), dataset_id=None, progress=_no_progress):
+    # Executado no pool de workers: tudo aqui é CPU-bound e síncrono.
+    # As medições de cada estágio voltam junto com o resultado (results['timings'])
+    clock = StageClock(progress)
+    clock('load')
+    agregados, dataset, stage_cache = load_transacoes(transacoes_path, dataset_id)
+    results = analyze_aggregates(agregados, campanhas_path, params, clock, stage_cache)
+    if stage_cache is not None:
+        dataset['stages'] = stage_cache.status
+    results['dataset'] = dataset
+    results['timings'] = clock.finish(rows=agregados.rows)
+    return results
+
+
+def run_dataset_analysis(dataset_id, campanhas_path, params=AnalysisParams(), progress=_no_progress):
+    # Análise de um dataset já convertido, sem novo upload das transações
+    clock = StageClock(progress)
+    clock('load')
+    agregados, dataset, stage_cache = load_dataset(dataset_id)
+    results = analyze_aggregates(agregados, campanhas_path, params, clock, stage_cache)
+    results['dataset'] = dict(dataset, stages=stage_cache.status)
+    results['timings'] = clock.finish(rows=agregados.rows)
+    return results
+
+
+def run_history_analysis(history_name, campanhas_path, params=AnalysisParams(), progress=_no_progress):
+    # Mesma análise sobre um histórico já agregado (ver history.py): nenhuma transação é relida
+    clock = StageClock(progress)
+    clock('load')
+    agregados, info = history_store.load(history_name)
+    results = analyze_aggregates(agregados, campanhas_path, params, clock)
+    results['history'] = {key: info[key] for key in ('name', 'revision', 'lotes', 'transacoes')}
+    results['timings'] = clock.finish(rows=0)
+    return results
+
+
+def fit_clientes(clientes, params, stage_cache):
+    # Escala, clusterização e PCA do modo fit, como estágios encadeados: com um dataset
+    # cada saída fica guardada, e mudar só os parâmetros da clusterização reaproveita
+    # a escala e o PCA (ver pipeline_cache.py)
+    X = clientes[CLUSTER_FEATURES]
+    # Um modelo registrado com "auto" é sempre MiniBatchKMeans: só ele aceita model_mode=update
+    algorithm = params.cluster_algorithm
+    if algorithm == 'auto' and params.model_name:
+        algorithm = 'minibatch'
+
+    def scale():
+        scaler = StandardScaler()
+        return scaler, scaler.fit_transform(X)
+
+    def cluster():
+        model = ClusteringModel(params.n_clusters, algorithm)
+        return model, model.fit_scaled(scaler, X_scaled, auto_k=params.auto_k, k_method=params.k_method)
+
+    def project():
+        pca = PCA(n_components=2)
+        return pca, pca.fit_transform(X_scaled)
+
+    scaler, X_scaled = stage_cache.get('scaled', scale, after=('aggregates',))
+    cluster_params = {key: getattr(params, key) for key in ('n_clusters', 'auto_k', 'k_method')}
+    cluster_params['cluster_algorithm'] = algorithm
+    model, labels = stage_cache.get('clusters', cluster, params=cluster_params, after=('scaled',))
+    pca, projection = stage_cache.get('pca', project, after=('scaled',))
+    return model, labels, pca, projection
+
+
+def cluster_type(row, params):
+    if row['frequencia_compras'] > params.loyal_min_frequency and row['total_gasto'] > params.loyal_min_spend:
+        return "Cliente fiel e de alto valor"
+    if row['ultima_compra'] > params.inactive_min_days:
+        return "Cliente inativo"
+    return "Cliente de valor médio e recorrência moderada"
+
+
+def analyze_aggregates(agregados, campanhas_path, params=AnalysisParams(), progress=_no_progress, stage_cache=None):
+    campanhas = read_campanhas(campanhas_path)
+    # Sem dataset os estágios são sempre calculados (nada é guardado)
+    stage_cache = stage_cache or StageCache()
+
+    # Resultados da análise e dados de cada gráfico (renderizados juntos no final)
+    results = {'history': None, 'dataset': None}
+    chart_data = {}
+
+    # 1. Clusterização de Clientes
+    progress('clustering')
+    clientes = agregados.clientes_frame()
+
+    # No modo score os modelos da versão registrada só são aplicados (transform/predict)
+    bundle = None
+    if params.model_mode != 'fit':
+        bundle = model_registry.load(params.model_name, params.model_version)
+
+    if bundle is None:
+        cluster_model, labels, pca, projection = fit_clientes(clientes, params, stage_cache)
+    else:
+        cluster_model, clientes_scaled, labels = cluster_clientes(clientes, params, bundle)
+        pca = bundle['pca']
+        projection = pca.transform(clientes_scaled)
+    clientes['cluster'] = labels
+    clientes[['pca1', 'pca2']] = projection
+    results['clustering'] = cluster_model.describe()
+
+    # Gráfico de clusters
+    chart_data['clusters'] = clientes[['pca1', 'pca2', 'cluster']]
+
+    # Diagnóstico por cluster
+    cluster_diagnostico = clientes.groupby('cluster')[CLUSTER_FEATURES].mean().round(2)
+    results['cluster_info'] = []
+
+    for idx, row in cluster_diagnostico.iterrows():
+        results['cluster_info'].append({
+            'cluster': idx,
+            'type': cluster_type(row, params),
+            'frequencia': row['frequencia_compras'],
+            'gasto': row['total_gasto'],
+            'ultima_compra': row['ultima_compra']
+        })
+
+    # 2. Análise de Preferência por Campanhas
+    progress('campaigns')
+    # Atributos das campanhas buscados uma única vez pelo índice (nome da campanha)
+    preferencia_campanhas = agregados.campanhas_frame().join(campanhas, on='campanha')
+
+    preferencia_campanhas['gasto_medio_por_cliente'] = preferencia_campanhas['total_gasto'] / preferencia_campanhas['cliente_id']
+    preferencia_campanhas['roi_estimado'] = preferencia_campanhas['total_gasto'] / preferencia_campanhas['custo_campanha']
+
+    results['campaigns'] = preferencia_campanhas[[
+        'campanha', 'cliente_id', 'transacoes', 'valor_compra', 'total_gasto',
+        'gasto_medio_por_cliente', 'roi_estimado'
+    ]].rename(columns={'cliente_id': 'clientes'}).to_dict('records')
+
+    # Gráficos de gasto médio por cliente e de ROI estimado por campanha
+    chart_data['campaign_spend'] = preferencia_campanhas[['campanha', 'gasto_medio_por_cliente']]
+    chart_data['campaign_roi'] = preferencia_campanhas[['campanha', 'roi_estimado']]
+
+    # 3. Regressão Linear para avaliar impacto das campanhas
+    progress('regression')
+    # Os atributos da campanha são constantes dentro de cada campanha: a regressão por transação
+    # sai das estatísticas suficientes por campanha (nº de transações, soma e soma dos quadrados
+    # do gasto), acumuladas na leitura em blocos, com memória constante
+    features = ['custo_campanha', 'alcance', 'conversao']
+    campanhas_reg = preferencia_campanhas.dropna(subset=features)
+
+    if params.model_mode == 'score':
+        reg_model = bundle['regression']
+    else:
+        stats = RegressionStats.from_groups(
+            campanhas_reg[features],
+            campanhas_reg['transacoes'],
+            campanhas_reg['total_gasto'],
+            campanhas_reg['total_gasto_sq'],
+        )
+        reg_model = LinearModel().fit_stats(stats)
+    coef_df = pd.DataFrame({'Variavel': features, 'Coeficiente': reg_model.coef_})
+
+    chart_data['regression'] = coef_df
+
+    if params.regression_se:
+        # Modelos registrados antes dos erros padrão não os têm
+        stderr = getattr(reg_model, 'stderr_', None)
+        coef_df = coef_df.assign(ErroPadrao=stderr if stderr is not None else None)
+    results['regression_info'] = coef_df.sort_values(by='Coeficiente', ascending=False).to_dict('records')
+
+    # 4. Análise de CLV (Customer Lifetime Value)
+    progress('clv')
+    # Só as colunas do gráfico, com o segmento calculado de forma vetorizada
+    clv = agregados.clv['total_gasto']
+    thresh_clv = clv.quantile(params.clv_quantile)
+    results['clv_threshold'] = thresh_clv
+    chart_data['clv'] = pd.DataFrame({
+        'clv': clv.to_numpy(),
+        'segmento_valor': np.where(clv.to_numpy() >= thresh_clv, 'Alto Valor', 'Demais'),
+    })
+
+    # 5. Clientes de Alto Valor (gasto total >= params.high_value_min_spend)
+    # Os HIGH_VALUE_LIMIT de maior gasto, da tabela por cliente (um por cliente, já com o cluster);
+    # a lista completa é servida por /reports/{id}/clients
+    clientes_alto_gasto = clientes.loc[
+        clientes['total_gasto'] >= params.high_value_min_spend,
+        ['cliente_id', *CLUSTER_FEATURES, 'cluster'],
+    ].nlargest(HIGH_VALUE_LIMIT, 'total_gasto')
+    results['high_value_clients'] = clientes_alto_gasto.to_dict('records')
+    results['high_value_min_spend'] = params.high_value_min_spend
+
+    # 6. Recomendações de Marketing
+    results['recommendations'] = [
+        "Priorizar campanhas com ROI elevado, como aquelas que entregaram maior retorno por real investido.",
+        "Reavaliar ou reformular campanhas com ROI baixo, focando em novos formatos ou incentivos como brindes, frete grátis, etc.",
+        "Investir mais em campanhas com alto gasto médio por cliente, pois indicam maior valor percebido.",
+        "Oferecer experiências exclusivas e personalizadas para clientes de alto valor, como eventos VIP ou convites para lançamentos de produtos.",
+        "Criar um programa de fidelidade premium com recompensas e benefícios exclusivos.",
+        "Desenvolver um sistema de recomendação de produtos baseado no histórico de compra de cada cliente."
+    ]
+
+    # Registra uma nova versão com os modelos ajustados/atualizados nesta análise
+    results['model'] = None
+    if params.model_name and params.model_mode != 'score':
+        version = model_registry.register(
+            params.model_name,
+            {'clustering': cluster_model, 'pca': pca, 'regression': reg_model},
+            metadata={
+                'mode': params.model_mode,
+                'base_version': params.model_version,
+                'clientes': len(clientes),
+                'clustering': cluster_model.describe(),
+                'pipeline_version': PIPELINE_VERSION,
+            },
+        )
+        results['model'] = {'name': params.model_name, 'version': version, 'mode': params.model_mode}
+    elif params.model_mode == 'score':
+        results['model'] = {'name': params.model_name, 'version': params.model_version, 'mode': 'score'}
+
+    # Tabela por cliente (cluster, segmento do CLV e coordenadas do PCA) com tipos compactos, para as APIs
+    clientes['segmento'] = pd.Categorical(
+        np.where(clientes['total_gasto'].to_numpy() >= thresh_clv, 'Alto Valor', 'Demais'),
+        categories=['Alto Valor', 'Demais'])
+    results['clientes'] = clientes.astype({'cluster': 'int8', 'pca1': 'float32', 'pca2': 'float32'})
+    results['clientes_count'] = len(clientes)
+
+    # 7. Gráficos, renderizados em paralelo (chart_format=None pula a renderização)
+    results['chart_format'] = params.chart_format
+    results['charts'] = {}
+    if params.chart_format is not None:
+        progress('render')
+        results['charts'] = render_charts(chart_data, params.chart_format)
+
+    return results
@@ -0,0 +1,375 @@
+"""Análise em lote de vários pares de CSVs (transações + campanhas), sem o servidor.
+
+Uso:
+    python batch.py dados/ --output resultados/
+    python batch.py manifesto.csv --output resultados/ --workers 4 --chart-format svg
+
+A entrada é um diretório ou um manifesto. No diretório, cada arquivo cujo nome
+contém "transacoes" forma um par com o arquivo de mesmo nome trocando
+"transacoes" por "campanhas" (ex.: ``loja1/transacoes.csv`` e
+``loja1/campanhas.csv``, ou ``loja1_transacoes.csv`` e ``loja1_campanhas.csv``).
+O manifesto é um CSV com as colunas ``nome,transacoes,campanhas`` (caminhos
+relativos ao manifesto).
+
+Cada par roda o mesmo pipeline do servidor (analysis.run_analysis) em um pool de
+processos e grava em ``<output>/<nome>/``: ``resultado.json`` (o mesmo resumo de
+/api/analyze), os gráficos e, opcionalmente, a tabela de clientes. Pares cuja
+saída já corresponde às entradas e aos parâmetros atuais são pulados (ver
+``.batch.json``). Ao final é impresso um resumo da vazão.
+"""
+import argparse
+import csv
+import dataclasses
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import serialize
+from clustering import ALGORITHMS, K_METHODS
+from params import CHART_FORMATS, PIPELINE_VERSION, AnalysisParams, InvalidParams
+from params import check_finite, check_quantile, parse_n_clusters
+
+# Registro, na saída de cada par, das entradas e parâmetros que a geraram
+STAMP = '.batch.json'
+RESULT = 'resultado.json'
+
+# Nomes de pares usados como subdiretórios da saída
+_PAIR_NAME = re.compile(r'^[A-Za-z0-9_.-]+(/[A-Za-z0-9_.-]+)*$')
+
+Pair = namedtuple('Pair', 'name transacoes campanhas')
+
+
+class BatchError(Exception):
+    pass
+
+
+def _check_pair_name(name):
+    if not _PAIR_NAME.match(name) or '..' in name.split('/'):
+        raise BatchError(f"Nome de par inválido: {name!r}")
+    return name
+
+
+def pairs_from_directory(root):
+    pairs = []
+    for directory, _, files in os.walk(root):
+        for filename in sorted(files):
+            stem, extension = os.path.splitext(filename)
+            if extension.lower() != '.csv' or 'transacoes' not in stem:
+                continue
+            # Troca a última ocorrência: "transacoes_2024_transacoes" vira "transacoes_2024_campanhas"
+            head, _, tail = stem.rpartition('transacoes')
+            campanhas = os.path.join(directory, f"{head}campanhas{tail}{extension}")
+            if not os.path.isfile(campanhas):
+                continue
+            relative = os.path.relpath(directory, root)
+            parts = [] if relative == '.' else relative.split(os.sep)
+            rest = f"{head}{tail}".strip('_-. ')
+            if rest:
+                parts.append(rest)
+            name = '/'.join(parts) or os.path.basename(os.path.abspath(root))
+            pairs.append(Pair(_check_pair_name(name), os.path.join(directory, filename), campanhas))
+    return pairs
+
+
+def pairs_from_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        missing = {'nome', 'transacoes', 'campanhas'} - set(reader.fieldnames or ())
+        if missing:
+            raise BatchError(f"Manifesto sem as colunas: {', '.join(sorted(missing))}")
+        return [
+            Pair(
+                _check_pair_name(row['nome'].strip()),
+                os.path.join(base, row['transacoes'].strip()),
+                os.path.join(base, row['campanhas'].strip()),
+            )
+            for row in reader
+        ]
+
+
+def discover_pairs(source):
+    pairs = pairs_from_directory(source) if os.path.isdir(source) else pairs_from_manifest(source)
+    names = [pair.name for pair in pairs]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise BatchError(f"Pares com o mesmo nome: {', '.join(duplicated)}")
+    for pair in pairs:
+        for path in (pair.transacoes, pair.campanhas):
+            if not os.path.isfile(path):
+                raise BatchError(f"{pair.name}: arquivo não encontrado: {path}")
+    return pairs
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_state(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _read_stamp(directory):
+    try:
+        with open(os.path.join(directory, STAMP)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, value):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+
+
+def _output_dir(output, pair):
+    return os.path.join(output, *pair.name.split('/'))
+
+
+def _settings_key(params, table_format):
+    return {'version': PIPELINE_VERSION, 'params': dataclasses.asdict(params), 'clientes': table_format}
+
+
+def _usable_stamp(directory, settings_key):
+    stamp = _read_stamp(directory)
+    if stamp is None or stamp.get('settings') != settings_key or not os.path.exists(os.path.join(directory, RESULT)):
+        return None
+    return stamp
+
+
+def _unchanged(pair, stamp):
+    # Tamanho e mtime iguais aos registrados: a saída é atual sem reler os arquivos
+    inputs = {'transacoes': _file_state(pair.transacoes), 'campanhas': _file_state(pair.campanhas)}
+    return all(stamp['inputs'][role]['size'] == state['size'] and stamp['inputs'][role]['mtime_ns'] == state['mtime_ns']
+               for role, state in inputs.items())
+
+
+def _is_current(pair, directory, settings_key):
+    # Atual se a saída foi gerada com os mesmos parâmetros e as mesmas entradas. Com
+    # tamanho ou mtime diferentes compara o conteúdo (sha256) e, se for o mesmo (ex.:
+    # arquivo copiado de novo), só atualiza o registro
+    stamp = _usable_stamp(directory, settings_key)
+    if stamp is None:
+        return False, None
+    if _unchanged(pair, stamp):
+        return True, None
+    inputs = {'transacoes': _file_state(pair.transacoes), 'campanhas': _file_state(pair.campanhas)}
+    digests = {'transacoes': _sha256(pair.transacoes), 'campanhas': _sha256(pair.campanhas)}
+    if any(stamp['inputs'][role]['sha256'] != digest for role, digest in digests.items()):
+        return False, digests
+    for role, state in inputs.items():
+        stamp['inputs'][role].update(state)
+    _write_json(os.path.join(directory, STAMP), stamp)
+    return True, digests
+
+
+def _write_outputs(directory, results, table_format):
+    charts = {}
+    for name, body in results['charts'].items():
+        filename = f"{name}.{results['chart_format']}"
+        with open(os.path.join(directory, filename), 'wb') as f:
+            f.write(body.encode() if isinstance(body, str) else body)
+        charts[name] = filename
+    summary = serialize.results_summary(results, charts=charts or None)
+    summary['timings'] = results['timings']
+    with open(os.path.join(directory, RESULT), 'wb') as f:
+        f.write(serialize.dumps(summary))
+    if table_format is not None:
+        with open(os.path.join(directory, f"clientes.{table_format}"), 'wb') as f:
+            f.write(serialize.encode_table(results['clientes'], table_format))
+
+
+def process_pair(pair, output, params, table_format=None, force=False):
+    # Executado no pool: devolve o status do par e as medições para o resumo
+    from analysis import run_analysis
+
+    directory = _output_dir(output, pair)
+    settings_key = _settings_key(params, table_format)
+    started = time.perf_counter()
+    try:
+        digests = None
+        if not force:
+            current, digests = _is_current(pair, directory, settings_key)
+            if current:
+                return {'name': pair.name, 'status': 'skipped'}
+        if digests is None:
+            digests = {'transacoes': _sha256(pair.transacoes), 'campanhas': _sha256(pair.campanhas)}
+        inputs = {
+            'transacoes': dict(_file_state(pair.transacoes), path=pair.transacoes, sha256=digests['transacoes']),
+            'campanhas': dict(_file_state(pair.campanhas), path=pair.campanhas, sha256=digests['campanhas']),
+        }
+        results = run_analysis(pair.transacoes, pair.campanhas, params)
+
+        # Grava em um diretório temporário e só então troca a saída anterior: uma
+        # interrupção não deixa uma saída incompleta marcada como atual
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{os.path.basename(directory)}-", dir=parent)
+        try:
+            _write_outputs(staging, results, table_format)
+            _write_json(os.path.join(staging, STAMP), {'settings': settings_key, 'inputs': inputs})
+            shutil.rmtree(directory, ignore_errors=True)
+            os.rename(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+    except Exception as exc:
+        return {'name': pair.name, 'status': 'error', 'error': str(exc) or exc.__class__.__name__}
+    return {
+        'name': pair.name,
+        'status': 'done',
+        'seconds': time.perf_counter() - started,
+        'rows': results['timings']['rows'],
+        'bytes': inputs['transacoes']['size'],
+    }
+
+
+def _report_outcome(outcome, report):
+    if outcome['status'] == 'done':
+        report(f"ok      {outcome['name']}  {outcome['seconds']:.2f} s  {outcome['rows']} linhas")
+    elif outcome['status'] == 'skipped':
+        report(f"atual   {outcome['name']}")
+    else:
+        report(f"erro    {outcome['name']}: {outcome['error']}")
+
+
+def run_batch(pairs, output, params, workers=None, table_format=None, force=False, report=print):
+    started = time.perf_counter()
+    outcomes = []
+    pending = []
+    settings_key = _settings_key(params, table_format)
+    for pair in pairs:
+        # Saídas atuais pela verificação rápida (sem hash) nem chegam ao pool
+        stamp = None if force else _usable_stamp(_output_dir(output, pair), settings_key)
+        if stamp is not None and _unchanged(pair, stamp):
+            outcomes.append({'name': pair.name, 'status': 'skipped'})
+            _report_outcome(outcomes[-1], report)
+        else:
+            pending.append(pair)
+
+    if pending:
+        # Os pares maiores começam primeiro: o último a terminar tende a ser um pequeno
+        pending.sort(key=lambda pair: os.path.getsize(pair.transacoes), reverse=True)
+        context = multiprocessing.get_context('spawn')
+        workers = min(len(pending), workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(process_pair, pair, output, params, table_format, force) for pair in pending]
+            for future in as_completed(futures):
+                outcomes.append(future.result())
+                _report_outcome(outcomes[-1], report)
+    return summarize(outcomes, time.perf_counter() - started)
+
+
+def summarize(outcomes, seconds):
+    done = [outcome for outcome in outcomes if outcome['status'] == 'done']
+    rows = sum(outcome['rows'] for outcome in done)
+    size = sum(outcome['bytes'] for outcome in done)
+    return {
+        'pairs': len(outcomes),
+        'done': len(done),
+        'skipped': sum(outcome['status'] == 'skipped' for outcome in outcomes),
+        'errors': sum(outcome['status'] == 'error' for outcome in outcomes),
+        'seconds': seconds,
+        'rows': rows,
+        'bytes': size,
+        'pairs_per_minute': len(done) * 60 / seconds if seconds else 0.0,
+        'rows_per_second': rows / seconds if seconds else 0.0,
+        'mb_per_second': size / 2 ** 20 / seconds if seconds else 0.0,
+    }
+
+
+def print_summary(summary, out=sys.stdout):
+    print(
+        f"\n{summary['pairs']} pares: {summary['done']} analisados, {summary['skipped']} já atuais, "
+        f"{summary['errors']} com erro em {summary['seconds']:.1f} s",
+        file=out,
+    )
+    if summary['done']:
+        print(
+            f"vazão: {summary['pairs_per_minute']:.1f} pares/min, {summary['rows_per_second']:,.0f} linhas/s, "
+            f"{summary['mb_per_second']:.1f} MB/s",
+            file=out,
+        )
+
+
+def _checked(check, convert=str):
+    # Validações de params.py como tipos do argparse (mesmas regras do servidor)
+    def parse(value):
+        try:
+            return check(convert(value))
+        except InvalidParams as exc:
+            raise argparse.ArgumentTypeError(str(exc))
+    # Nome usado pelo argparse na mensagem de valores que nem convertem ("invalid float value")
+    parse.__name__ = convert.__name__
+    return parse
+
+
+def _number(name):
+    return _checked(lambda value: check_finite(name, value), float)
+
+
+def _quantile(name):
+    return _checked(lambda value: check_quantile(name, value), float)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='diretório com os pares de CSVs ou manifesto (nome,transacoes,campanhas)')
+    parser.add_argument('--output', '-o', required=True, help='diretório das saídas (um subdiretório por par)')
+    parser.add_argument('--workers', '-j', type=int, default=None, help='processos em paralelo (padrão: nº de CPUs)')
+    parser.add_argument('--force', action='store_true', help='refaz também os pares com saída atual')
+    parser.add_argument('--chart-format', default='png', choices=[*CHART_FORMATS, 'none'])
+    parser.add_argument('--clientes', default='none', choices=[*serialize.TABLE_FORMATS, 'none'],
+                        help='grava também a tabela de clientes neste formato')
+    parser.add_argument('--n-clusters', type=_checked(parse_n_clusters), default='3')
+    parser.add_argument('--k-method', default='silhouette', choices=K_METHODS)
+    parser.add_argument('--cluster-algorithm', default='auto', choices=ALGORITHMS)
+    parser.add_argument('--regression-se', action='store_true')
+    parser.add_argument('--loyal-min-frequency', type=_number('loyal_min_frequency'), default=12.0)
+    parser.add_argument('--loyal-min-spend', type=_number('loyal_min_spend'), default=5000.0)
+    parser.add_argument('--inactive-min-days', type=_number('inactive_min_days'), default=250.0)
+    parser.add_argument('--clv-quantile', type=_quantile('clv_quantile'), default=0.75)
+    parser.add_argument('--high-value-min-spend', type=_number('high_value_min_spend'), default=60000.0)
+    args = parser.parse_args(argv)
+
+    params = AnalysisParams(
+        chart_format=None if args.chart_format == 'none' else args.chart_format,
+        n_clusters=args.n_clusters[0],
+        auto_k=args.n_clusters[1],
+        k_method=args.k_method,
+        cluster_algorithm=args.cluster_algorithm,
+        regression_se=args.regression_se,
+        loyal_min_frequency=args.loyal_min_frequency,
+        loyal_min_spend=args.loyal_min_spend,
+        inactive_min_days=args.inactive_min_days,
+        clv_quantile=args.clv_quantile,
+        high_value_min_spend=args.high_value_min_spend,
+    )
+    try:
+        pairs = discover_pairs(args.source)
+    except (BatchError, OSError) as exc:
+        parser.error(str(exc))
+    if not pairs:
+        parser.error(f"nenhum par de transações/campanhas encontrado em {args.source}")
+
+    table_format = None if args.clientes == 'none' else args.clientes
+    summary = run_batch(pairs, args.output, params, args.workers, table_format, args.force)
+    print_summary(summary)
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
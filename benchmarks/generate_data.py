@@ -0,0 +1,83 @@
+"""Gera arquivos sintéticos de transações e campanhas para benchmarks.
+
+Uso: python benchmarks/generate_data.py --rows 10M --output-dir /tmp/dados
+
+Os arquivos têm o formato dos uploads (transacoes.csv e campanhas.csv). As
+colunas por cliente (frequência, gasto total, última compra) são constantes
+para o mesmo cliente, como nos dados reais; o arquivo é escrito em blocos, então
+50M de linhas não precisam caber em memória.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+CAMPANHAS = ['Black Friday', 'Natal', 'Dia das Maes', 'Verao']
+_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+
+def parse_rows(value):
+    # Aceita "10k", "50M" ou um inteiro
+    value = str(value).strip().lower().replace('_', '')
+    if value and value[-1] in _SUFFIXES:
+        return int(float(value[:-1]) * _SUFFIXES[value[-1]])
+    return int(value)
+
+
+def campaign_names(n_campanhas):
+    if n_campanhas <= len(CAMPANHAS):
+        return CAMPANHAS[:n_campanhas]
+    return CAMPANHAS + [f"Campanha {i}" for i in range(len(CAMPANHAS) + 1, n_campanhas + 1)]
+
+
+def generate(output_dir, rows, n_clientes=None, n_campanhas=len(CAMPANHAS), seed=0, chunk_rows=1_000_000):
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    transacoes_path = os.path.join(output_dir, 'transacoes.csv')
+    campanhas_path = os.path.join(output_dir, 'campanhas.csv')
+    # Cerca de 5 transações por cliente, por padrão
+    n_clientes = n_clientes or max(rows // 5, 10)
+    nomes = np.array(campaign_names(n_campanhas))
+
+    # Atributos de cada cliente (índice = cliente_id - 1)
+    frequencia = rng.poisson(12, n_clientes).astype('int32') + 1
+    total_gasto = np.round(rng.lognormal(10, 1, n_clientes), 2)
+    ultima_compra = rng.integers(0, 366, n_clientes, dtype='int32')
+
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        cliente = rng.integers(0, n_clientes, n)
+        pd.DataFrame({
+            'cliente_id': cliente + 1,
+            'frequencia_compras': frequencia[cliente],
+            'total_gasto': total_gasto[cliente],
+            'ultima_compra': ultima_compra[cliente],
+            'campanha': nomes[rng.integers(0, len(nomes), n)],
+            'valor_compra': rng.uniform(10, 500, n).round(2),
+        }).to_csv(transacoes_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+    pd.DataFrame({
+        'nome_campanha': nomes,
+        'custo_campanha': rng.integers(2_000, 20_000, len(nomes)),
+        'alcance': rng.integers(10_000, 100_000, len(nomes)),
+        'conversao': rng.uniform(0.01, 0.08, len(nomes)).round(3),
+    }).to_csv(campanhas_path, index=False)
+    return transacoes_path, campanhas_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=parse_rows, default='100k', help='nº de transações (ex.: 10k, 1M, 50M)')
+    parser.add_argument('--clients', type=parse_rows, help='nº de clientes distintos (padrão: rows/5)')
+    parser.add_argument('--campaigns', type=int, default=len(CAMPANHAS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default='.')
+    args = parser.parse_args()
+    paths = generate(args.output_dir, args.rows, args.clients, args.campaigns, args.seed)
+    print('\n'.join(paths), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Compara o núcleo da análise antigo (DataFrame inteiro em memória) com o atual.
+
+Uso: python benchmarks/hot_path.py --rows 10M [--output resultado.json]
+
+Cada variante roda em um processo novo, para que o pico de memória (ru_maxrss)
+de uma não contamine a outra. Os gráficos ficam de fora: o foco é a leitura,
+os agregados, os merges e a montagem dos resultados.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from generate_data import generate, parse_rows
+
+# Módulos da aplicação (raiz do repositório)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_core(transacoes_path, campanhas_path):
+    # Núcleo do analyze_data original, sem os gráficos
+    from sklearn.cluster import KMeans
+    from sklearn.decomposition import PCA
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import StandardScaler
+
+    transacoes = pd.read_csv(transacoes_path)
+    campanhas = pd.read_csv(campanhas_path)
+    clientes = transacoes.groupby('cliente_id').agg({
+        'frequencia_compras': 'max', 'total_gasto': 'max', 'ultima_compra': 'max'
+    }).reset_index()
+    clientes_scaled = StandardScaler().fit_transform(clientes[['frequencia_compras', 'total_gasto', 'ultima_compra']])
+    clientes['cluster'] = KMeans(n_clusters=3, n_init=10, random_state=42).fit_predict(clientes_scaled)
+    clientes[['pca1', 'pca2']] = PCA(n_components=2).fit_transform(clientes_scaled)
+    clientes.groupby('cluster')[['frequencia_compras', 'total_gasto', 'ultima_compra']].mean().round(2)
+
+    transacoes = pd.merge(transacoes, clientes[['cliente_id', 'cluster']], on='cliente_id', how='left')
+    preferencia = transacoes.groupby('campanha').agg({
+        'cliente_id': 'nunique', 'valor_compra': 'sum', 'frequencia_compras': 'sum', 'total_gasto': 'sum'
+    }).reset_index()
+    preferencia = pd.merge(preferencia, campanhas, left_on='campanha', right_on='nome_campanha', how='left')
+    preferencia['roi_estimado'] = preferencia['total_gasto'] / preferencia['custo_campanha']
+
+    transacoes_reg = transacoes.merge(campanhas, left_on='campanha', right_on='nome_campanha', how='left')
+    features = ['custo_campanha', 'alcance', 'conversao']
+    LinearRegression().fit(transacoes_reg[features], transacoes_reg['total_gasto'])
+
+    clientes_clv = transacoes[['cliente_id', 'total_gasto']].drop_duplicates()
+    clientes_clv.rename(columns={'total_gasto': 'clv'}, inplace=True)
+    thresh_clv = clientes_clv['clv'].quantile(0.75)
+    clientes_clv['segmento_valor'] = clientes_clv['clv'].apply(lambda x: 'Alto Valor' if x >= thresh_clv else 'Demais')
+
+    high_value = transacoes[transacoes['total_gasto'] >= 60000].to_dict('records')
+    return {'clv_threshold': thresh_clv, 'high_value_clients': high_value[:10]}
+
+
+def current_core(transacoes_path, campanhas_path):
+    from analysis import AnalysisParams, run_analysis
+    return run_analysis(transacoes_path, campanhas_path, AnalysisParams(chart_format=None))
+
+
+VARIANTS = {'legacy': legacy_core, 'current': current_core}
+
+
+def _measure(name, transacoes_path, campanhas_path, queue):
+    start = time.perf_counter()
+    results = VARIANTS[name](transacoes_path, campanhas_path)
+    elapsed = time.perf_counter() - start
+    queue.put({
+        'variant': name,
+        'seconds': round(elapsed, 3),
+        # ru_maxrss está em KiB no Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'clv_threshold': float(results['clv_threshold']),
+        'high_value_ids': [client['cliente_id'] for client in results['high_value_clients']],
+    })
+
+
+def run_variant(name, transacoes_path, campanhas_path):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(name, transacoes_path, campanhas_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=parse_rows, default='10M')
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--output', help='grava os resultados em JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Gerando {args.rows} transações...", file=sys.stderr)
+        paths = generate(directory, args.rows)
+        runs = [run_variant(name, *paths) for name in args.variants]
+
+    for run in runs:
+        print(f"{run['variant']:>8}: {run['seconds']:8.2f} s  pico RSS {run['peak_rss_mb']:9.1f} MB")
+    if len(runs) == 2:
+        same = all(run['clv_threshold'] == runs[0]['clv_threshold']
+                   and run['high_value_ids'] == runs[0]['high_value_ids'] for run in runs)
+        print(f"Resultados equivalentes: {'sim' if same else 'NÃO'}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'rows': args.rows, 'runs': runs}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
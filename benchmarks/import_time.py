@@ -0,0 +1,60 @@
+"""Mede o tempo de importação do servidor (main.py) e confere o que ele carrega.
+
+Uso: python benchmarks/import_time.py [--repeat 5] [--max-seconds 0.5]
+
+Cada medida roda em um interpretador novo. A importação de main não deve
+carregar pandas, numpy, scikit-learn ou matplotlib: eles ficam para os workers
+(ver tasks.py e settings.PRELOAD). Sai com código 1 se algum deles for carregado
+ou se a mediana passar de --max-seconds; serve como verificação em CI.
+Para o detalhe por módulo: python -X importtime -c "import main".
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('pandas', 'numpy', 'sklearn', 'scipy', 'matplotlib', 'seaborn', 'joblib')
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_once():
+    output = subprocess.run(
+        [sys.executable, '-c', _PROBE], cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=0.5, help='limite para a mediana')
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.repeat)]
+    median = statistics.median(run['seconds'] for run in runs)
+    loaded = sorted({module for run in runs for module in run['loaded']})
+    print(f"import main: mediana {median:.3f} s, mín {min(run['seconds'] for run in runs):.3f} s ({args.repeat} execuções)")
+
+    failed = False
+    if loaded:
+        print(f"ERRO: módulos pesados carregados na importação: {', '.join(loaded)}")
+        failed = True
+    if median > args.max_seconds:
+        print(f"ERRO: mediana acima de {args.max_seconds} s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Mede o tempo e a memória de cada estágio do pipeline de análise.
+
+Uso:
+    python benchmarks/run_pipeline.py --rows 1M --repeat 3 --output bench.json
+    python benchmarks/run_pipeline.py --transacoes t.csv --campanhas c.csv
+    python benchmarks/run_pipeline.py --rows 1M --compare bench.json
+
+Cada repetição roda em um processo novo (sem caches de gráficos ou modelos
+aquecidos). Os estágios medidos são: leitura do CSV, agregação, clusterização
+(com escala, KMeans e PCA em separado), campanhas, regressão, CLV, cada gráfico,
+a renderização de todos os gráficos e a montagem do HTML. Para cada estágio
+ficam registrados a duração, o RSS ao final e o pico de RSS do processo.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from generate_data import generate, parse_rows
+
+# Módulos da aplicação (raiz do repositório)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _rss_mb():
+    # RSS atual (Linux); None em outros sistemas
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+
+
+def _peak_rss_mb():
+    # ru_maxrss está em KiB no Linux e em bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, name, seconds, **extra):
+        self.stages[name] = dict(seconds=round(seconds, 4), rss_mb=_rss_mb(), peak_rss_mb=_peak_rss_mb(), **extra)
+
+    def measure(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        value = fn(*args, **kwargs)
+        self.record(name, time.perf_counter() - start)
+        return value
+
+
+def run_once(transacoes_path, campanhas_path, chart_format):
+    import analysis
+    import charts
+    import clustering
+    import main as app_main
+    from cache import ResultCache
+    from ingest import TransactionAggregates, read_transacoes
+    from sklearn.decomposition import PCA
+    from sklearn.preprocessing import StandardScaler
+
+    # Sem cache de gráficos: cada renderização é medida de verdade
+    charts.chart_cache = ResultCache(0)
+    timer = StageTimer()
+
+    # Leitura do CSV e agregação são intercaladas bloco a bloco; os tempos são somados
+    parse = aggregate = 0.0
+    agregados = TransactionAggregates()
+    reader = iter(read_transacoes(transacoes_path))
+    while True:
+        start = time.perf_counter()
+        chunk = next(reader, None)
+        parse += time.perf_counter() - start
+        if chunk is None:
+            break
+        start = time.perf_counter()
+        agregados.update(chunk)
+        aggregate += time.perf_counter() - start
+    timer.record('csv_parse', parse, rows=agregados.rows, bytes=os.path.getsize(transacoes_path))
+    timer.record('aggregate', aggregate, clientes=len(agregados.clientes))
+
+    # Sub-etapas da clusterização, com os mesmos estimadores do pipeline
+    params = analysis.AnalysisParams(chart_format=chart_format)
+    X = agregados.clientes_frame()[clustering.CLUSTER_FEATURES]
+    X_scaled = timer.measure('clustering.scale', StandardScaler().fit_transform, X)
+    algorithm = clustering.resolve_algorithm(params.cluster_algorithm, len(X_scaled))
+    timer.measure('clustering.kmeans', clustering._estimator(algorithm, params.n_clusters).fit_predict, X_scaled)
+    timer.measure('clustering.pca', PCA(n_components=2).fit_transform, X_scaled)
+
+    # Estágios do pipeline marcados pelo callback de progresso; os gráficos são
+    # renderizados um a um (em série) para medir cada um isoladamente
+    current = []
+    chart_data = {}
+
+    def progress(stage):
+        now = time.perf_counter()
+        if current and current[0] != 'render':
+            timer.record(current[0], now - current[1])
+        current[:] = [stage, now]
+
+    def render_each(data, fmt):
+        chart_data.update(data)
+        return {name: timer.measure(f"chart.{name}", charts.render_chart, name, data[name], fmt)
+                for name in charts.CHART_NAMES}
+
+    analysis.render_charts = render_each
+    progress('campanhas_csv')
+    results = analysis.analyze_aggregates(agregados, campanhas_path, params, progress)
+    progress(None)
+
+    timer.measure('charts', charts.render_charts, chart_data, chart_format)
+    timer.measure('html_embedded', app_main.render_report, results)
+    timer.measure('html_urls', app_main.render_report, results, report_id='benchmark')
+    return timer.stages
+
+
+def _child(transacoes_path, campanhas_path, chart_format, queue):
+    start = time.perf_counter()
+    stages = run_once(transacoes_path, campanhas_path, chart_format)
+    queue.put({'total_seconds': round(time.perf_counter() - start, 3), 'peak_rss_mb': _peak_rss_mb(), 'stages': stages})
+
+
+def run_isolated(transacoes_path, campanhas_path, chart_format):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(transacoes_path, campanhas_path, chart_format, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def summarize(runs):
+    summary = {}
+    for name in runs[0]['stages']:
+        seconds = [run['stages'][name]['seconds'] for run in runs]
+        summary[name] = {'min': min(seconds), 'median': round(statistics.median(seconds), 4)}
+    totals = [run['total_seconds'] for run in runs]
+    summary['total'] = {'min': min(totals), 'median': round(statistics.median(totals), 4)}
+    return summary
+
+
+def print_report(report, baseline=None):
+    header = f"{'estágio':<22}{'mediana (s)':>12}{'mín (s)':>10}{'pico RSS (MB)':>15}"
+    if baseline:
+        header += f"{'anterior (s)':>14}{'razão':>8}"
+    print(header)
+    last_run = report['runs'][-1]
+    for name, values in report['summary'].items():
+        peak = last_run['stages'][name]['peak_rss_mb'] if name in last_run['stages'] else last_run['peak_rss_mb']
+        line = f"{name:<22}{values['median']:>12.4f}{values['min']:>10.4f}{peak:>15.1f}"
+        previous = (baseline or {}).get('summary', {}).get(name)
+        if previous:
+            ratio = values['median'] / previous['median'] if previous['median'] else float('nan')
+            line += f"{previous['median']:>14.4f}{ratio:>8.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=parse_rows, default='100k', help='gera dados sintéticos com este nº de linhas')
+    parser.add_argument('--transacoes', help='CSV de transações existente (em vez de gerar)')
+    parser.add_argument('--campanhas', help='CSV de campanhas existente')
+    parser.add_argument('--chart-format', default='png', choices=['png', 'svg', 'json'])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='grava o relatório em JSON')
+    parser.add_argument('--compare', help='relatório JSON anterior para comparação')
+    args = parser.parse_args()
+    if bool(args.transacoes) != bool(args.campanhas):
+        parser.error('--transacoes e --campanhas devem ser usados juntos')
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.transacoes:
+            paths = (args.transacoes, args.campanhas)
+        else:
+            print(f"Gerando {args.rows} transações...", file=sys.stderr)
+            paths = generate(directory, args.rows)
+        runs = [run_isolated(*paths, args.chart_format) for _ in range(args.repeat)]
+
+    report = {
+        'meta': {
+            'rows': runs[0]['stages']['csv_parse']['rows'],
+            'clientes': runs[0]['stages']['aggregate']['clientes'],
+            'input_bytes': runs[0]['stages']['csv_parse']['bytes'],
+            'chart_format': args.chart_format,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'summary': summarize(runs),
+        'runs': runs,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import settings
+
+
+def cache_key(digests, params=None, version=1):
+    # Chave por conteúdo: hash dos arquivos enviados + parâmetros da análise
+    payload = json.dumps(
+        {'files': list(digests), 'params': params or {}, 'version': version},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """LRU limitado em bytes para os resultados da análise, com camada opcional em disco.
+
+    Os valores são guardados serializados (pickle): o tamanho de cada entrada é
+    exato e a mesma representação é gravada na camada em disco.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(data)
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, data)
+        return pickle.loads(data)
+
+    def peek(self, key):
+        # Leitura sem afetar os contadores (ex.: servir gráficos de um relatório já gerado)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        if data is None:
+            data = self._read_disk(key)
+        return None if data is None else pickle.loads(data)
+
+    def put(self, key, value):
+        # Devolve True se o valor ficou guardado em alguma das camadas
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            stored = self._store(key, data)
+        return self._write_disk(key, data) or stored
+
+    def _store(self, key, data):
+        if len(data) > self.max_bytes:
+            return False
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+        return key in self._entries
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pickle")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Atualiza o mtime: a limpeza do disco remove primeiro os menos usados
+        try:
+            os.utime(self._disk_path(key))
+        except OSError:
+            pass
+        return data
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return False
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._trim_disk()
+        return os.path.exists(path)
+
+    def _trim_disk(self):
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.pickle'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'disk_enabled': bool(self.disk_dir),
+            }
+
+
+result_cache = ResultCache(
+    settings.RESULT_CACHE_MAX_BYTES,
+    disk_dir=settings.RESULT_CACHE_DIR,
+    disk_max_bytes=settings.RESULT_CACHE_DISK_MAX_BYTES,
+)
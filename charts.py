@@ -0,0 +1,148 @@
+import hashlib
+import io
+
+# settings antes do matplotlib: fixa o backend Agg e o diretório do cache de fontes (ver settings.py)
+import settings
+
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.figure import Figure
+
+import serialize
+from cache import ResultCache
+from params import CHART_FORMATS
+
+# Versão do desenho dos gráficos; incrementar ao mudar a aparência (invalida o cache)
+CHART_VERSION = 2
+
+CHART_NAMES = ('clusters', 'campaign_spend', 'campaign_roi', 'regression', 'clv')
+
+FORMATS = CHART_FORMATS
+
+# Cache por processo (cada worker tem o seu) dos bytes já renderizados
+chart_cache = ResultCache(settings.CHART_CACHE_MAX_BYTES)
+
+
+def _draw_clusters(ax, data):
+    sns.scatterplot(data=data, x='pca1', y='pca2', hue='cluster', palette='Set2', ax=ax)
+    ax.set_title('Clusters de Clientes')
+
+
+def _draw_campaign_spend(ax, data):
+    sns.barplot(data=data, x='campanha', y='gasto_medio_por_cliente', ax=ax)
+    ax.set_title('Gasto Médio por Cliente por Campanha')
+    ax.tick_params(axis='x', labelrotation=45)
+
+
+def _draw_campaign_roi(ax, data):
+    sns.barplot(data=data, x='campanha', y='roi_estimado', ax=ax)
+    ax.set_title('ROI Estimado por Campanha')
+    ax.tick_params(axis='x', labelrotation=45)
+
+
+def _draw_regression(ax, data):
+    sns.barplot(data=data, x='Variavel', y='Coeficiente', ax=ax)
+    ax.set_title('Impacto das Campanhas no Total Gasto')
+    ax.set_ylabel('Coeficiente da Regressão')
+
+
+def _draw_clv(ax, data):
+    sns.histplot(data=data, x='clv', hue='segmento_valor', bins=30, kde=True, palette='Set2', ax=ax)
+    ax.set_title('Distribuição do CLV por Segmento')
+    ax.set_xlabel('Customer Lifetime Value')
+    ax.set_ylabel('Frequência')
+
+
+def _bar_spec(title, data, x, y):
+    return {
+        'type': 'bar',
+        'title': title,
+        'x': data[x].astype(str).tolist(),
+        'y': data[y].astype(float).tolist(),
+    }
+
+
+def _spec_clusters(data):
+    # Para renderização no cliente basta uma amostra dos pontos
+    if len(data) > settings.CHART_JSON_MAX_POINTS:
+        data = data.sample(settings.CHART_JSON_MAX_POINTS, random_state=42)
+    return {
+        'type': 'scatter',
+        'title': 'Clusters de Clientes',
+        'series': [
+            {'name': str(cluster), 'x': group['pca1'].round(4).tolist(), 'y': group['pca2'].round(4).tolist()}
+            for cluster, group in data.groupby('cluster')
+        ],
+    }
+
+
+def _spec_campaign_spend(data):
+    return _bar_spec('Gasto Médio por Cliente por Campanha', data, 'campanha', 'gasto_medio_por_cliente')
+
+
+def _spec_campaign_roi(data):
+    return _bar_spec('ROI Estimado por Campanha', data, 'campanha', 'roi_estimado')
+
+
+def _spec_regression(data):
+    return _bar_spec('Impacto das Campanhas no Total Gasto', data, 'Variavel', 'Coeficiente')
+
+
+def _spec_clv(data):
+    # Histograma pré-calculado com os mesmos 30 intervalos do gráfico em imagem
+    edges = np.histogram_bin_edges(data['clv'], bins=30)
+    return {
+        'type': 'histogram',
+        'title': 'Distribuição do CLV por Segmento',
+        'bins': edges.tolist(),
+        'series': [
+            {'name': segmento, 'counts': np.histogram(group['clv'], bins=edges)[0].tolist()}
+            for segmento, group in data.groupby('segmento_valor')
+        ],
+    }
+
+
+# nome -> (tamanho da figura, desenho em imagem, especificação JSON)
+_CHARTS = {
+    'clusters': ((10, 6), _draw_clusters, _spec_clusters),
+    'campaign_spend': ((12, 6), _draw_campaign_spend, _spec_campaign_spend),
+    'campaign_roi': ((12, 6), _draw_campaign_roi, _spec_campaign_roi),
+    'regression': ((12, 6), _draw_regression, _spec_regression),
+    'clv': ((12, 6), _draw_clv, _spec_clv),
+}
+
+
+def _chart_key(name, data, fmt):
+    digest = hashlib.sha256(f"{name}:{fmt}:{CHART_VERSION}:{list(data.columns)}".encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def render_chart(name, data, fmt='png'):
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato de gráfico desconhecido: {fmt}")
+    key = _chart_key(name, data, fmt)
+    body = chart_cache.get(key)
+    if body is not None:
+        return body
+
+    figsize, draw, spec = _CHARTS[name]
+    if fmt == 'json':
+        body = serialize.dumps(spec(data))
+    else:
+        # API orientada a objetos: cada gráfico tem sua própria Figure, sem estado global do pyplot
+        fig = Figure(figsize=figsize)
+        draw(fig.subplots(), data)
+        img = io.BytesIO()
+        fig.savefig(img, format=fmt, bbox_inches='tight')
+        body = img.getvalue()
+
+    chart_cache.put(key, body)
+    return body
+
+
+def render_charts(chart_data, fmt='png'):
+    # Renderiza os gráficos em série; devolve {nome: bytes}. O desenho (Agg/seaborn) segura o
+    # GIL: threads não renderizam mais rápido. O paralelismo vem das análises no pool de workers
+    return {name: render_chart(name, chart_data[name], fmt) for name in CHART_NAMES}
@@ -0,0 +1,190 @@
+import os
+import re
+import sqlite3
+import tempfile
+
+import settings
+
+# O id de um relatório é a chave do cache de resultados (sha256 em hexadecimal)
+_REPORT_ID = re.compile(r'^[0-9a-f]{64}$')
+
+# Um cliente por linha: cliente_id é único. A ordem de inserção (rowid) desempata as ordenações
+_SCHEMA = """
+CREATE TABLE clientes (
+    cliente_id UNIQUE NOT NULL,
+    cluster INTEGER NOT NULL,
+    segmento TEXT NOT NULL,
+    total_gasto REAL NOT NULL,
+    frequencia_compras INTEGER NOT NULL,
+    ultima_compra INTEGER NOT NULL,
+    pca1 REAL NOT NULL,
+    pca2 REAL NOT NULL
+);
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Criados depois da carga (mais rápido que mantê-los durante os inserts). Cada ordenação tem um
+# índice próprio e outro precedido do cluster: as páginas saem do índice, sem varrer a tabela
+SORT_COLUMNS = ('total_gasto', 'frequencia_compras', 'ultima_compra', 'cliente_id', 'cluster')
+_INDEXES = """
+CREATE INDEX clientes_total_gasto ON clientes (total_gasto);
+CREATE INDEX clientes_frequencia ON clientes (frequencia_compras);
+CREATE INDEX clientes_ultima_compra ON clientes (ultima_compra);
+CREATE INDEX clientes_cluster_total_gasto ON clientes (cluster, total_gasto);
+CREATE INDEX clientes_cluster_frequencia ON clientes (cluster, frequencia_compras);
+CREATE INDEX clientes_cluster_ultima_compra ON clientes (cluster, ultima_compra);
+"""
+
+COLUMNS = ['cliente_id', 'cluster', 'segmento', 'total_gasto', 'frequencia_compras', 'ultima_compra', 'pca1', 'pca2']
+
+# Segmentos do CLV (ver analysis.py); o filtro por segmento vira uma faixa de total_gasto
+SEGMENTOS = ('Alto Valor', 'Demais')
+
+
+class ReportNotIndexed(Exception):
+    pass
+
+
+class InvalidClientQuery(ValueError):
+    pass
+
+
+def _rows(frame, columns):
+    # Valores Python nativos (o sqlite3 não aceita os escalares do numpy)
+    return zip(*(frame[column].tolist() for column in columns))
+
+
+def parse_sort(sort):
+    # "-total_gasto" -> ('total_gasto', 'DESC')
+    column = sort[1:] if sort.startswith('-') else sort
+    if column not in SORT_COLUMNS:
+        raise InvalidClientQuery(f"sort deve ser um de: {', '.join(SORT_COLUMNS)} (com '-' para ordem decrescente)")
+    return column, 'DESC' if sort.startswith('-') else 'ASC'
+
+
+class ClientIndex:
+    """Tabela por cliente de cada relatório, em um SQLite indexado (``<root>/<id>.sqlite``).
+
+    Guarda o resultado por cliente da análise (cluster, segmento do CLV, gasto e
+    coordenadas do PCA), um cliente por linha. As consultas paginadas de
+    /reports/{id}/clients filtram e ordenam pelos índices e leem só as linhas da
+    página. A tabela é criada no pool de workers, na primeira consulta ao relatório,
+    e continua disponível mesmo depois que o relatório sai do cache de resultados.
+    Acima de ``max_bytes`` as tabelas menos consultadas são removidas.
+    """
+
+    def __init__(self, root, max_bytes=0):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, report_id):
+        if not _REPORT_ID.match(report_id or ''):
+            raise ReportNotIndexed(f"Relatório não encontrado: {report_id}")
+        return os.path.join(self.root, f"{report_id}.sqlite")
+
+    def exists(self, report_id):
+        try:
+            return os.path.exists(self._path(report_id))
+        except ReportNotIndexed:
+            return False
+
+    def build(self, report_id, clientes, clv_threshold):
+        # Executado no pool de workers. Gravado em um arquivo temporário e renomeado:
+        # construções concorrentes do mesmo relatório ficam com a última (o conteúdo é o mesmo)
+        path = self._path(report_id)
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{report_id[:16]}-", suffix='.tmp', dir=self.root)
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(tmp_path, isolation_level=None)
+            try:
+                conn.execute("PRAGMA journal_mode=OFF")
+                conn.execute("PRAGMA synchronous=OFF")
+                conn.executescript(_SCHEMA)
+                conn.execute("BEGIN")
+                conn.executemany(
+                    f"INSERT INTO clientes ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    _rows(clientes.astype({'segmento': object}), COLUMNS),
+                )
+                conn.execute("INSERT INTO meta VALUES ('clv_threshold', ?)", (float(clv_threshold),))
+                conn.execute("COMMIT")
+                conn.executescript(_INDEXES)
+                conn.execute("ANALYZE")
+            finally:
+                conn.close()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep=report_id)
+        return {'id': report_id, 'clientes': len(clientes), 'bytes': os.path.getsize(path)}
+
+    def query(self, report_id, cluster=None, segmento=None, min_gasto=None, max_gasto=None,
+              sort='-total_gasto', page=1, page_size=50):
+        # Página de clientes e o total que atende aos filtros
+        column, direction = parse_sort(sort)
+        if segmento is not None and segmento not in SEGMENTOS:
+            raise InvalidClientQuery(f"segmento deve ser um de: {', '.join(SEGMENTOS)}")
+        path = self._path(report_id)
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        except sqlite3.OperationalError:
+            raise ReportNotIndexed(f"Relatório não encontrado: {report_id}")
+        try:
+            where, args = [], []
+            if cluster is not None:
+                where.append("cluster = ?")
+                args.append(cluster)
+            if min_gasto is not None:
+                where.append("total_gasto >= ?")
+                args.append(min_gasto)
+            if max_gasto is not None:
+                where.append("total_gasto <= ?")
+                args.append(max_gasto)
+            if segmento is not None:
+                # Mesma regra da análise: "Alto Valor" a partir do limiar do CLV
+                threshold = conn.execute("SELECT value FROM meta WHERE key = 'clv_threshold'").fetchone()[0]
+                where.append("total_gasto >= ?" if segmento == 'Alto Valor' else "total_gasto < ?")
+                args.append(threshold)
+            where_sql = f" WHERE {' AND '.join(where)}" if where else ''
+
+            total = conn.execute(f"SELECT COUNT(*) FROM clientes{where_sql}", args).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM clientes{where_sql} "
+                f"ORDER BY {column} {direction}, rowid {direction} LIMIT ? OFFSET ?",
+                args + [page_size, (page - 1) * page_size],
+            ).fetchall()
+        finally:
+            conn.close()
+        # O mtime marca a última consulta (ver evict)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return total, [dict(zip(COLUMNS, row)) for row in rows]
+
+    def evict(self, keep=None):
+        if not self.max_bytes:
+            return
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.sqlite') and _REPORT_ID.match(entry.name[:-len('.sqlite')]):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name != f"{keep}.sqlite":
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except OSError:
+                    continue
+                total -= size
+
+
+client_index = ClientIndex(settings.CLIENT_INDEX_DIR, settings.CLIENT_INDEX_MAX_BYTES)
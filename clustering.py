@@ -0,0 +1,134 @@
+import settings
+
+# numpy e scikit-learn são importados nas funções: o servidor só precisa das constantes
+# e de ClusteringError; os ajustes rodam nos workers
+CLUSTER_FEATURES = ['frequencia_compras', 'total_gasto', 'ultima_compra']
+ALGORITHMS = ('auto', 'kmeans', 'minibatch')
+K_METHODS = ('silhouette', 'elbow')
+
+
+class ClusteringError(ValueError):
+    pass
+
+
+def _estimator(algorithm, n_clusters):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if algorithm == 'minibatch':
+        return MiniBatchKMeans(
+            n_clusters=n_clusters,
+            batch_size=settings.CLUSTER_BATCH_SIZE,
+            n_init=3,
+            random_state=42,
+        )
+    return KMeans(n_clusters=n_clusters, n_init=10, random_state=42)
+
+
+def resolve_algorithm(algorithm, n_rows):
+    # "auto" troca para MiniBatchKMeans quando o número de clientes é grande
+    if algorithm == 'auto':
+        return 'minibatch' if n_rows >= settings.CLUSTER_MINIBATCH_THRESHOLD else 'kmeans'
+    return algorithm
+
+
+def _sample(X, size):
+    import numpy as np
+
+    if len(X) <= size:
+        return X
+    rng = np.random.default_rng(42)
+    return X[rng.choice(len(X), size, replace=False)]
+
+
+def select_k(X_scaled, k_min=None, k_max=None, method='silhouette'):
+    # Escolhe k ajustando MiniBatchKMeans em uma amostra para cada k candidato
+    import numpy as np
+    from sklearn.metrics import silhouette_score
+
+    k_min = k_min or settings.CLUSTER_K_MIN
+    k_max = k_max or settings.CLUSTER_K_MAX
+    sample = _sample(X_scaled, settings.CLUSTER_K_SAMPLE)
+    k_max = min(k_max, len(sample) - 1)
+    if k_max < k_min:
+        raise ClusteringError("Clientes insuficientes para escolher o número de clusters")
+
+    scores = {}
+    for k in range(k_min, k_max + 1):
+        estimator = _estimator('minibatch', k).fit(sample)
+        if method == 'silhouette':
+            scores[k] = float(silhouette_score(sample, estimator.labels_))
+        else:
+            scores[k] = float(estimator.inertia_)
+
+    if method == 'silhouette':
+        best = max(scores, key=scores.get)
+    else:
+        # Cotovelo: k com a maior curvatura (segunda diferença) da inércia
+        ks = sorted(scores)
+        if len(ks) < 3:
+            best = ks[0]
+        else:
+            inertia = np.array([scores[k] for k in ks])
+            curvature = inertia[:-2] - 2 * inertia[1:-1] + inertia[2:]
+            best = ks[int(np.argmax(curvature)) + 1]
+    return best, scores
+
+
+class ClusteringModel:
+    """Scaler e estimador de clusters ajustados juntos.
+
+    Um modelo registrado (ver registry.py) pode ser reaplicado a novos uploads com
+    ``predict`` ou atualizado com ``partial_fit`` (apenas MiniBatchKMeans). Nas
+    atualizações o scaler fica congelado, para que os centros continuem no mesmo espaço.
+    """
+
+    def __init__(self, n_clusters=3, algorithm='auto'):
+        if algorithm not in ALGORITHMS:
+            raise ClusteringError(f"Algoritmo de clusterização desconhecido: {algorithm}")
+        self.n_clusters = n_clusters
+        self.algorithm = algorithm
+        self.scaler = None
+        self.estimator = None
+        self.k_scores = None
+
+    def fit(self, X, auto_k=False, k_method='silhouette'):
+        from sklearn.preprocessing import StandardScaler
+
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+        return X_scaled, self.fit_scaled(scaler, X_scaled, auto_k, k_method)
+
+    def fit_scaled(self, scaler, X_scaled, auto_k=False, k_method='silhouette'):
+        # Ajuste sobre dados já padronizados por scaler (reaproveitados entre análises de um dataset)
+        self.scaler = scaler
+        if auto_k:
+            self.n_clusters, self.k_scores = select_k(X_scaled, method=k_method)
+        elif self.n_clusters > len(X_scaled):
+            raise ClusteringError(
+                f"n_clusters={self.n_clusters} é maior que o número de clientes ({len(X_scaled)})")
+        self.algorithm = resolve_algorithm(self.algorithm, len(X_scaled))
+        self.estimator = _estimator(self.algorithm, self.n_clusters)
+        return self.estimator.fit_predict(X_scaled)
+
+    def transform(self, X):
+        return self.scaler.transform(X)
+
+    def predict(self, X):
+        X_scaled = self.transform(X)
+        return X_scaled, self.estimator.predict(X_scaled)
+
+    def partial_fit(self, X):
+        if not hasattr(self.estimator, 'partial_fit'):
+            raise ClusteringError("Somente modelos MiniBatchKMeans podem ser atualizados incrementalmente")
+        X_scaled = self.transform(X)
+        batch_size = settings.CLUSTER_BATCH_SIZE
+        for start in range(0, len(X_scaled), batch_size):
+            self.estimator.partial_fit(X_scaled[start:start + batch_size])
+        return X_scaled, self.estimator.predict(X_scaled)
+
+    def describe(self):
+        return {
+            'algorithm': self.algorithm,
+            'n_clusters': int(self.n_clusters),
+            'k_scores': self.k_scores,
+        }
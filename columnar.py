@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ingest import TRANSACOES_COLUMNS, TRANSACOES_DTYPES
+
+# Formato colunar das transações (ver datasets.py): um arquivo binário por coluna,
+# sem cabeçalho, lido com np.memmap. Os tipos vêm dos metadados do dataset.
+# campanha é gravada como códigos de um dicionário global; cliente_id fica inteiro
+# (ou float, com ausentes) quando o CSV é numérico, senão também vira códigos.
+CODE_DTYPE = 'int32'
+NUMERIC_COLUMNS = [column for column in TRANSACOES_DTYPES if column != 'campanha']
+
+
+class MixedColumnTypes(ValueError):
+    pass
+
+
+def _column_path(directory, column):
+    return os.path.join(directory, f"{column}.bin")
+
+
+def _dictionary_path(directory, column):
+    return os.path.join(directory, f"{column}.dict.npy")
+
+
+def _cliente_id_kind(values):
+    if values.dtype.kind in 'iu':
+        return 'int64'
+    if values.dtype.kind == 'f':
+        return 'float64'
+    return 'dictionary'
+
+
+class ColumnWriter:
+    """Grava os blocos lidos do CSV, coluna a coluna, em ``directory``."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.rows = 0
+        self.cliente_id_kind = None
+        self._dictionaries = {'campanha': {}, 'cliente_id': {}}
+        self._files = {column: open(_column_path(directory, column), 'wb') for column in TRANSACOES_COLUMNS}
+
+    def _encode(self, column, values):
+        # Códigos globais: os valores de cada bloco são fatorados e remapeados para o dicionário
+        # (o código -1 de ausentes cai no último elemento do mapeamento, que também é -1)
+        codes, uniques = pd.factorize(values)
+        dictionary = self._dictionaries[column]
+        mapping = [dictionary.setdefault(value, len(dictionary)) for value in uniques]
+        return np.array(mapping + [-1], dtype=CODE_DTYPE)[codes]
+
+    def append(self, chunk):
+        kind = _cliente_id_kind(chunk['cliente_id'])
+        if self.cliente_id_kind is None:
+            self.cliente_id_kind = kind
+        elif kind != self.cliente_id_kind:
+            raise MixedColumnTypes("cliente_id tem tipos diferentes ao longo do arquivo")
+
+        if kind == 'dictionary':
+            cliente_id = self._encode('cliente_id', chunk['cliente_id'].astype(object))
+        else:
+            cliente_id = chunk['cliente_id'].to_numpy(kind)
+        cliente_id.tofile(self._files['cliente_id'])
+        self._encode('campanha', chunk['campanha'].astype(object)).tofile(self._files['campanha'])
+        for column in NUMERIC_COLUMNS:
+            chunk[column].to_numpy(TRANSACOES_DTYPES[column]).tofile(self._files[column])
+        self.rows += len(chunk)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+    def finish(self):
+        # Fecha os arquivos e devolve a descrição das colunas (gravada nos metadados)
+        self.close()
+        columns = dict(TRANSACOES_DTYPES, campanha=CODE_DTYPE)
+        columns['cliente_id'] = CODE_DTYPE if self.cliente_id_kind == 'dictionary' else self.cliente_id_kind
+        if self.cliente_id_kind == 'dictionary':
+            np.save(_dictionary_path(self.directory, 'cliente_id'), np.array(list(self._dictionaries['cliente_id']), dtype=str))
+        return {
+            'rows': self.rows,
+            'columns': columns,
+            'cliente_id_encoding': 'dictionary' if self.cliente_id_kind == 'dictionary' else 'plain',
+            'campanhas': list(self._dictionaries['campanha']),
+        }
+
+
+class ColumnReader:
+    """Colunas de um dataset mapeadas em memória.
+
+    Os memmaps são abertos na criação: uma remoção concorrente do diretório não
+    afeta uma leitura já iniciada.
+    """
+
+    def __init__(self, directory, meta):
+        self.rows = meta['rows']
+        self.columns = {
+            column: np.memmap(_column_path(directory, column), dtype=dtype, mode='r', shape=(self.rows,))
+            for column, dtype in meta['columns'].items()
+        }
+        self.clientes = None
+        if meta['cliente_id_encoding'] == 'dictionary':
+            # NaN ao final: o código -1 (ausente) indexa o último elemento
+            self.clientes = np.append(np.load(_dictionary_path(directory, 'cliente_id')).astype(object), np.nan)
+        self.campanhas = pd.Index(meta['campanhas'], dtype=object)
+
+    def frame(self, rows, index):
+        # Linhas (fatia ou índices) no mesmo formato de ingest.read_transacoes
+        cliente_id = np.asarray(self.columns['cliente_id'][rows])
+        if self.clientes is not None:
+            cliente_id = self.clientes[cliente_id]
+        frame = {column: np.asarray(self.columns[column][rows]) for column in NUMERIC_COLUMNS}
+        frame['cliente_id'] = cliente_id
+        frame['campanha'] = pd.Categorical.from_codes(self.columns['campanha'][rows], categories=self.campanhas)
+        return pd.DataFrame(frame, columns=TRANSACOES_COLUMNS, index=index)
+
+    def chunks(self, chunksize):
+        for start in range(0, self.rows, chunksize):
+            stop = min(start + chunksize, self.rows)
+            yield self.frame(slice(start, stop), pd.RangeIndex(start, stop))
+
+    def sample_by_campanha(self, target_rows, min_rows, rng, chunksize):
+        # Amostra estratificada por campanha: conta as linhas de cada campanha (só a coluna
+        # de códigos é percorrida) e sorteia cada linha com a taxa da sua campanha,
+        # proporcional ao tamanho, mas com ao menos ~min_rows linhas por campanha.
+        # Devolve as linhas sorteadas (na ordem do arquivo) e o tamanho de cada campanha
+        codes = self.columns['campanha']
+        sizes = np.zeros(len(self.campanhas) + 1, dtype='int64')
+        for start in range(0, self.rows, chunksize):
+            sizes += np.bincount(codes[start:start + chunksize] + 1, minlength=len(sizes))
+        wanted = np.maximum(target_rows * sizes / max(1, self.rows), min_rows)
+        rates = np.minimum(1.0, wanted / np.maximum(sizes, 1))
+        found = []
+        for start in range(0, self.rows, chunksize):
+            chunk = codes[start:start + chunksize]
+            found.append(start + np.flatnonzero(rng.random(len(chunk)) < rates[chunk + 1]))
+        rows = np.concatenate(found) if found else np.array([], dtype='int64')
+        # Posição 0: linhas sem campanha (código -1)
+        return self.frame(rows, pd.Index(rows)), pd.Series(sizes[1:], index=self.campanhas)
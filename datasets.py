@@ -0,0 +1,252 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import settings
+
+# O id de um dataset é o sha256 do CSV de transações (o mesmo usado na chave do cache)
+_DATASET_ID = re.compile(r'^[0-9a-f]{64}$')
+
+# Versão do formato em disco; datasets de outra versão são ignorados (e recriados)
+FORMAT_VERSION = 2
+
+
+class DatasetNotFound(Exception):
+    pass
+
+
+class InvalidDatasetId(ValueError):
+    pass
+
+
+def check_dataset_id(dataset_id):
+    if not _DATASET_ID.match(dataset_id or ''):
+        raise InvalidDatasetId("Id de dataset inválido (sha256 do arquivo de transações, em hexadecimal)")
+    return dataset_id
+
+
+def _disk_bytes(path):
+    # Colunas, campanhas e saídas dos estágios (ver pipeline_cache.py)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+class DatasetWriter:
+    """Conversão de um CSV de transações para o formato colunar, bloco a bloco.
+
+    Grava em um diretório temporário dentro do store; ``commit`` grava os
+    metadados e renomeia o diretório para o id (atômico: conversões concorrentes
+    do mesmo arquivo ficam com o primeiro que terminar). Executado nos workers.
+    """
+
+    def __init__(self, store, dataset_id):
+        from columnar import ColumnWriter
+
+        self.store = store
+        self.dataset_id = check_dataset_id(dataset_id)
+        os.makedirs(store.root, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=f".{dataset_id[:16]}-", dir=store.root)
+        self.columns = ColumnWriter(self.directory)
+        self.failed = False
+
+    def write_through(self, chunks):
+        # Repassa os blocos ao chamador gravando cada um. Um bloco que não pode ser
+        # gravado (ex.: cliente_id com tipos diferentes) só cancela a conversão
+        from columnar import MixedColumnTypes
+
+        for chunk in chunks:
+            if not self.failed:
+                try:
+                    self.columns.append(chunk)
+                except MixedColumnTypes:
+                    self.abort()
+                    self.failed = True
+            yield chunk
+
+    def commit(self, csv_bytes=None):
+        if self.failed:
+            return None
+        meta = self.columns.finish()
+        if not meta['rows']:
+            self.abort()
+            from params import InvalidTransacoes
+
+            raise InvalidTransacoes("Arquivo de transações vazio")
+        meta.update(
+            id=self.dataset_id,
+            format=FORMAT_VERSION,
+            bytes=sum(entry.stat().st_size for entry in os.scandir(self.directory)),
+            csv_bytes=csv_bytes,
+            created_at=time.time(),
+        )
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        target = self.store._path(self.dataset_id)
+        if self.store._read_meta(target) is not None:
+            # Já convertido por outro worker
+            self.abort()
+            return self.store.info(self.dataset_id)
+        shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.rename(self.directory, target)
+        except OSError:
+            self.abort()
+            return self.store.info(self.dataset_id)
+        self.store.evict(keep=self.dataset_id)
+        return meta
+
+    def abort(self):
+        self.columns.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class DatasetStore:
+    """Transações convertidas para um formato colunar, reaproveitadas entre análises.
+
+    Cada dataset é um diretório ``<root>/<id>`` com um arquivo binário por
+    coluna (tipos compactos, campanha codificada em dicionário) e um
+    ``meta.json``. A leitura mapeia os arquivos em memória (np.memmap): nenhuma
+    linha é reinterpretada como texto e as páginas lidas ficam no cache do sistema,
+    compartilhadas entre os workers. O diretório também guarda, opcionalmente, o
+    CSV de campanhas e as saídas dos estágios caros do pipeline (ver
+    pipeline_cache.py). Acima de ``max_bytes`` os datasets menos usados são removidos.
+    """
+
+    def __init__(self, root, max_bytes=0):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, dataset_id):
+        return os.path.join(self.root, check_dataset_id(dataset_id))
+
+    def _read_meta(self, path):
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get('format') == FORMAT_VERSION else None
+
+    def info(self, dataset_id):
+        meta = self._read_meta(self._path(dataset_id))
+        if meta is None:
+            raise DatasetNotFound(f"Dataset não encontrado: {dataset_id}")
+        return meta
+
+    def exists(self, dataset_id):
+        return self._read_meta(self._path(dataset_id)) is not None
+
+    def datasets(self):
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        datasets = []
+        for name in names:
+            if _DATASET_ID.match(name):
+                meta = self._read_meta(os.path.join(self.root, name))
+                if meta is not None:
+                    datasets.append({key: meta[key] for key in ('id', 'rows', 'bytes', 'csv_bytes', 'created_at')})
+        return sorted(datasets, key=lambda meta: meta['created_at'])
+
+    def writer(self, dataset_id):
+        return DatasetWriter(self, dataset_id)
+
+    def convert(self, path, dataset_id):
+        # Executado no pool de workers; uploads já convertidos não são relidos
+        from ingest import read_transacoes
+
+        if self.exists(dataset_id):
+            return dict(self.info(dataset_id), created=False)
+        writer = self.writer(dataset_id)
+        try:
+            for _ in writer.write_through(read_transacoes(path)):
+                pass
+        except BaseException:
+            writer.abort()
+            raise
+        if writer.failed:
+            from params import InvalidTransacoes
+
+            raise InvalidTransacoes(
+                "cliente_id tem tipos diferentes ao longo do arquivo (ex.: inteiros e ids ausentes); "
+                "o dataset não pode ser convertido")
+        return dict(writer.commit(csv_bytes=os.path.getsize(path)), created=True)
+
+    def _reader(self, dataset_id):
+        from columnar import ColumnReader
+
+        path = self._path(dataset_id)
+        meta = self._read_meta(path)
+        if meta is None:
+            raise DatasetNotFound(f"Dataset não encontrado: {dataset_id}")
+        try:
+            reader = ColumnReader(path, meta)
+            # O mtime dos metadados marca o último uso (ver evict)
+            os.utime(os.path.join(path, 'meta.json'))
+        except FileNotFoundError:
+            # Removido no meio tempo
+            raise DatasetNotFound(f"Dataset não encontrado: {dataset_id}")
+        return reader
+
+    def read(self, dataset_id, chunksize=None):
+        # Blocos no formato de ingest.read_transacoes, lidos dos arquivos mapeados em memória
+        return self._reader(dataset_id).chunks(chunksize or settings.INGEST_CHUNK_ROWS)
+
+    def sample_by_campanha(self, dataset_id, target_rows, min_rows, rng):
+        # Amostra estratificada por campanha e o tamanho de cada campanha (ver mode=preview)
+        return self._reader(dataset_id).sample_by_campanha(target_rows, min_rows, rng, settings.INGEST_CHUNK_ROWS)
+
+    def attach_campanhas(self, dataset_id, path, digest):
+        # Guarda o CSV de campanhas com o dataset: as análises seguintes dispensam o upload
+        target = self._path(dataset_id)
+        meta = self.info(dataset_id)
+        shutil.copyfile(path, os.path.join(target, 'campanhas.csv.tmp'))
+        os.replace(os.path.join(target, 'campanhas.csv.tmp'), os.path.join(target, 'campanhas.csv'))
+        meta['campanhas_sha256'] = digest
+        with open(os.path.join(target, 'meta.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(target, 'meta.json.tmp'), os.path.join(target, 'meta.json'))
+        return meta
+
+    def campanhas(self, dataset_id):
+        # Caminho e hash do CSV de campanhas guardado (None se não houver)
+        meta = self.info(dataset_id)
+        if not meta.get('campanhas_sha256'):
+            return None, None
+        return os.path.join(self._path(dataset_id), 'campanhas.csv'), meta['campanhas_sha256']
+
+    def stage_cache(self, dataset_id):
+        from pipeline_cache import StageCache
+
+        return StageCache(os.path.join(self._path(dataset_id), 'stages'), settings.DATASET_STAGE_VARIANTS)
+
+    def evict(self, keep=None):
+        if not self.max_bytes:
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            meta = self._read_meta(path) if _DATASET_ID.match(name) else None
+            if meta is not None:
+                entries.append((os.path.getmtime(os.path.join(path, 'meta.json')), name, _disk_bytes(path)))
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name != keep:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                total -= size
+
+
+dataset_store = DatasetStore(settings.DATASET_DIR, settings.DATASET_MAX_BYTES)
@@ -0,0 +1,208 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+import settings
+
+_HISTORY_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clientes (
+    cliente_id PRIMARY KEY,
+    frequencia_compras INTEGER NOT NULL,
+    total_gasto REAL NOT NULL,
+    ultima_compra INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campanhas (
+    campanha TEXT PRIMARY KEY,
+    valor_compra REAL NOT NULL,
+    frequencia_compras INTEGER NOT NULL,
+    total_gasto REAL NOT NULL,
+    total_gasto_sq REAL NOT NULL,
+    transacoes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campanha_clientes (
+    campanha TEXT NOT NULL,
+    cliente_id NOT NULL,
+    PRIMARY KEY (campanha, cliente_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS clv (
+    cliente_id NOT NULL,
+    total_gasto REAL NOT NULL,
+    PRIMARY KEY (cliente_id, total_gasto)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lotes (
+    seq INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    linhas INTEGER NOT NULL,
+    revision TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class HistoryNotFound(Exception):
+    pass
+
+
+class InvalidHistoryName(ValueError):
+    pass
+
+
+def check_history_name(name):
+    if not _HISTORY_NAME.match(name or ''):
+        raise InvalidHistoryName("Nome de histórico inválido (use letras, números, '_' ou '-')")
+    return name
+
+
+def _rows(frame, columns):
+    # Valores Python nativos (o sqlite3 não aceita os escalares do numpy)
+    return list(zip(*(frame[column].tolist() for column in columns)))
+
+
+class AggregateStore:
+    """Históricos de transações guardados já agregados, um arquivo SQLite por nome.
+
+    As tabelas têm o mesmo estado de ``ingest.TransactionAggregates`` (máximos por
+    cliente, somas por campanha, pares distintos e primeiras transações de alto
+    valor), então acrescentar um lote custa o tempo de agregar as linhas novas e
+    um upsert proporcional ao número de clientes do lote, nunca o histórico inteiro.
+    Cada lote é identificado pelo SHA-256 do arquivo: reenviar o mesmo arquivo não
+    conta as transações duas vezes.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, f"{check_history_name(name)}.sqlite")
+
+    def _connect(self, path):
+        conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # WAL: análises continuam lendo enquanto um lote é gravado
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _open(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            raise HistoryNotFound(f"Histórico não encontrado: {name}")
+        return self._connect(path)
+
+    def names(self):
+        try:
+            entries = sorted(os.listdir(self.root))
+        except FileNotFoundError:
+            return []
+        return [entry[:-len('.sqlite')] for entry in entries
+                if entry.endswith('.sqlite') and _HISTORY_NAME.match(entry[:-len('.sqlite')])]
+
+    def _info(self, conn, name):
+        lotes, linhas, revision = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(linhas), 0), "
+            "(SELECT revision FROM lotes ORDER BY seq DESC LIMIT 1) FROM lotes"
+        ).fetchone()
+        return {
+            'name': name,
+            'revision': revision,
+            'lotes': lotes,
+            'transacoes': linhas,
+            'clientes': conn.execute("SELECT COUNT(*) FROM clientes").fetchone()[0],
+            'campanhas': conn.execute("SELECT COUNT(*) FROM campanhas").fetchone()[0],
+            'bytes': os.path.getsize(self._path(name)),
+        }
+
+    def info(self, name):
+        conn = self._open(name)
+        try:
+            return self._info(conn, name)
+        finally:
+            conn.close()
+
+    def append(self, name, path, digest):
+        # Executado no pool de workers: agrega o lote fora da transação e só então grava
+        # (ingest e pandas são importados aqui para não pesar na inicialização do servidor)
+        from ingest import aggregate_transacoes
+
+        agregados = aggregate_transacoes(path)
+        os.makedirs(self.root, exist_ok=True)
+        conn = self._connect(self._path(name))
+        try:
+            conn.executescript(_SCHEMA)
+            # BEGIN IMMEDIATE serializa os lotes concorrentes do mesmo histórico
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                duplicate = conn.execute("SELECT 1 FROM lotes WHERE sha256 = ?", (digest,)).fetchone() is not None
+                if not duplicate:
+                    self._write(conn, agregados, digest)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            info = self._info(conn, name)
+        finally:
+            conn.close()
+        info['lote'] = {'sha256': digest, 'transacoes': agregados.rows, 'duplicado': duplicate}
+        return info
+
+    def _write(self, conn, agregados, digest):
+        clientes = agregados.clientes.rename_axis('cliente_id').reset_index()
+        conn.executemany(
+            "INSERT INTO clientes VALUES (?, ?, ?, ?) ON CONFLICT(cliente_id) DO UPDATE SET "
+            "frequencia_compras = max(frequencia_compras, excluded.frequencia_compras), "
+            "total_gasto = max(total_gasto, excluded.total_gasto), "
+            "ultima_compra = max(ultima_compra, excluded.ultima_compra)",
+            _rows(clientes, ['cliente_id', 'frequencia_compras', 'total_gasto', 'ultima_compra']),
+        )
+
+        campanhas = agregados.campanhas.rename_axis('campanha').reset_index()
+        conn.executemany(
+            "INSERT INTO campanhas VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(campanha) DO UPDATE SET "
+            "valor_compra = valor_compra + excluded.valor_compra, "
+            "frequencia_compras = frequencia_compras + excluded.frequencia_compras, "
+            "total_gasto = total_gasto + excluded.total_gasto, "
+            "total_gasto_sq = total_gasto_sq + excluded.total_gasto_sq, "
+            "transacoes = transacoes + excluded.transacoes",
+            _rows(campanhas, ['campanha', 'valor_compra', 'frequencia_compras', 'total_gasto', 'total_gasto_sq', 'transacoes']),
+        )
+
+        conn.executemany("INSERT OR IGNORE INTO campanha_clientes VALUES (?, ?)",
+                         _rows(agregados.campanha_clientes, ['campanha', 'cliente_id']))
+        conn.executemany("INSERT OR IGNORE INTO clv VALUES (?, ?)",
+                         _rows(agregados.clv, ['cliente_id', 'total_gasto']))
+
+        # A revisão encadeia os hashes dos lotes: identifica o conteúdo do histórico
+        previous = conn.execute("SELECT revision FROM lotes ORDER BY seq DESC LIMIT 1").fetchone()
+        revision = hashlib.sha256(f"{previous[0] if previous else ''}:{digest}".encode()).hexdigest()
+        conn.execute(
+            "INSERT INTO lotes (sha256, linhas, revision, created_at) VALUES (?, ?, ?, ?)",
+            (digest, agregados.rows, revision, time.time()),
+        )
+
+    def load(self, name):
+        # Lê o histórico como TransactionAggregates, em uma única transação de leitura
+        import pandas as pd
+        from ingest import TransactionAggregates
+
+        conn = self._open(name)
+        try:
+            conn.execute("BEGIN")
+            info = self._info(conn, name)
+            if not info['lotes']:
+                raise HistoryNotFound(f"Histórico vazio: {name}")
+            agregados = TransactionAggregates()
+            agregados.rows = info['transacoes']
+            agregados.clientes = pd.read_sql_query("SELECT * FROM clientes", conn, index_col='cliente_id')
+            agregados.campanhas = pd.read_sql_query("SELECT * FROM campanhas", conn, index_col='campanha')
+            agregados.campanha_clientes = pd.read_sql_query("SELECT campanha, cliente_id FROM campanha_clientes", conn)
+            agregados.clv = pd.read_sql_query("SELECT cliente_id, total_gasto FROM clv", conn)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return agregados, info
+
+
+history_store = AggregateStore(settings.HISTORY_DIR)
@@ -0,0 +1,158 @@
+import pandas as pd
+
+import settings
+from params import InvalidTransacoes
+
+# Apenas as colunas usadas pelo pipeline, com tipos compactos. Valores em reais ficam em
+# float64: em float32 os centavos se perdem a partir de ~131 mil (2^17).
+# cliente_id fica com o tipo inferido pelo pandas (numérico ou texto, conforme o arquivo).
+TRANSACOES_DTYPES = {
+    'frequencia_compras': 'int32',
+    'total_gasto': 'float64',
+    'ultima_compra': 'int32',
+    'campanha': 'category',
+    'valor_compra': 'float64',
+}
+TRANSACOES_COLUMNS = ['cliente_id', *TRANSACOES_DTYPES]
+
+# Atributos das campanhas usados no ROI e na regressão
+CAMPANHAS_COLUMNS = ['nome_campanha', 'custo_campanha', 'alcance', 'conversao']
+
+
+def read_transacoes(path, chunksize=None):
+    with pd.read_csv(
+        path,
+        usecols=TRANSACOES_COLUMNS,
+        dtype=TRANSACOES_DTYPES,
+        chunksize=chunksize or settings.INGEST_CHUNK_ROWS,
+    ) as reader:
+        yield from pin_cliente_id(reader)
+
+
+def _cliente_id_kind(values):
+    return 'numeric' if values.dtype.kind in 'iuf' else 'str'
+
+
+def _as_str(values):
+    # Ids numéricos como texto; floats inteiros (colunas com ausentes) sem o ".0"
+    if values.dtype.kind == 'f':
+        integral = values.dropna()
+        if (integral == integral.round()).all():
+            values = values.astype('Int64')
+    return values.astype(str).where(values.notna())
+
+
+def pin_cliente_id(chunks):
+    # O pandas infere o tipo de cliente_id em cada bloco. O tipo do primeiro bloco vale para
+    # todos: ids de texto convertem os blocos numéricos seguintes para texto (123 e "123" são o
+    # mesmo cliente); ids numéricos não aceitam texto depois (o índice misturaria int e str)
+    kind = None
+    for chunk in chunks:
+        values = chunk['cliente_id']
+        if kind is None:
+            kind = _cliente_id_kind(values)
+        if kind == 'str':
+            chunk['cliente_id'] = _as_str(values)
+        elif _cliente_id_kind(values) == 'str':
+            try:
+                chunk['cliente_id'] = pd.to_numeric(values)
+            except ValueError:
+                raise InvalidTransacoes(
+                    "cliente_id é numérico no início do arquivo e tem valores não numéricos depois")
+        yield chunk
+
+
+def read_campanhas(path):
+    # Indexada pelo nome: os atributos são buscados por campanha, sem merge
+    campanhas = pd.read_csv(path, usecols=CAMPANHAS_COLUMNS)
+    return campanhas.drop_duplicates('nome_campanha').set_index('nome_campanha')
+
+
+class TransactionAggregates:
+    """Agregados por cliente e por campanha construídos bloco a bloco.
+
+    O tamanho do estado depende do número de clientes distintos (e de pares
+    cliente/campanha), nunca do número de linhas de transações.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        # Por cliente: máximos de frequência, gasto total e dias desde a última compra
+        self.clientes = None
+        # Por campanha: somas usadas no ROI e na regressão
+        self.campanhas = None
+        # Pares distintos (campanha, cliente_id) para contar clientes únicos por campanha
+        self.campanha_clientes = None
+        # Pares distintos (cliente_id, total_gasto) usados no CLV
+        self.clv = None
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        chunk = chunk.assign(frequencia_compras=chunk['frequencia_compras'].astype('int64'))
+
+        clientes = chunk.groupby('cliente_id').agg({
+            'frequencia_compras': 'max',
+            'total_gasto': 'max',
+            'ultima_compra': 'max'
+        })
+
+        campanha = chunk['campanha'].astype(object)
+        campanhas = chunk.assign(
+            campanha=campanha,
+            transacoes=1,
+            total_gasto_sq=chunk['total_gasto'] ** 2,
+        ).groupby('campanha').agg({
+            'valor_compra': 'sum',
+            'frequencia_compras': 'sum',
+            'total_gasto': 'sum',
+            'total_gasto_sq': 'sum',
+            'transacoes': 'sum'
+        })
+
+        campanha_clientes = pd.DataFrame({'campanha': campanha, 'cliente_id': chunk['cliente_id']}).drop_duplicates()
+        clv = chunk[['cliente_id', 'total_gasto']].drop_duplicates()
+
+        self._combine(clientes, campanhas, campanha_clientes, clv)
+
+    def merge(self, other):
+        self.rows += other.rows
+        self._combine(other.clientes, other.campanhas, other.campanha_clientes, other.clv)
+
+    def _combine(self, clientes, campanhas, campanha_clientes, clv):
+        if clientes is None:
+            return
+        if self.clientes is None:
+            self.clientes = clientes
+            self.campanhas = campanhas
+            self.campanha_clientes = campanha_clientes
+            self.clv = clv
+            return
+        self.clientes = pd.concat([self.clientes, clientes]).groupby(level=0).max()
+        self.campanhas = pd.concat([self.campanhas, campanhas]).groupby(level=0).sum()
+        self.campanha_clientes = pd.concat([self.campanha_clientes, campanha_clientes]).drop_duplicates()
+        self.clv = pd.concat([self.clv, clv]).drop_duplicates()
+
+    def clientes_frame(self):
+        # Equivalente a transacoes.groupby('cliente_id').agg(...).reset_index()
+        return self.clientes.sort_index().reset_index()
+
+    def campanhas_frame(self):
+        # Equivalente a transacoes.groupby('campanha').agg(...) com cliente_id = clientes únicos
+        # Somas de valores em centavos: o arredondamento deixa o resultado independente da divisão em blocos/lotes
+        campanhas = self.campanhas.round({'valor_compra': 2, 'total_gasto': 2})
+        campanhas['cliente_id'] = self.campanha_clientes.groupby('campanha')['cliente_id'].nunique()
+        return campanhas.sort_index().rename_axis('campanha').reset_index()
+
+
+def aggregate_transacoes(path, chunksize=None):
+    return aggregate_chunks(read_transacoes(path, chunksize))
+
+
+def aggregate_chunks(chunks):
+    # Blocos do CSV ou de um dataset colunar (ver datasets.py)
+    aggregates = TransactionAggregates()
+    for chunk in chunks:
+        aggregates.update(chunk)
+    if aggregates.clientes is None:
+        raise InvalidTransacoes("Arquivo de transações vazio")
+    return aggregates
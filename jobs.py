@@ -0,0 +1,169 @@
+import abc
+import threading
+import time
+import uuid
+
+import settings
+from params import STAGES
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+
+class JobNotFound(Exception):
+    pass
+
+
+class JobStore(abc.ABC):
+    """Interface dos armazenamentos de jobs.
+
+    Um backend em arquivo ou SQLite só precisa implementar estes métodos;
+    os jobs são dicionários simples (ver ``new_job``).
+    """
+
+    @abc.abstractmethod
+    def create(self):
+        ...
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        ...
+
+    @abc.abstractmethod
+    def update(self, job_id, **fields):
+        ...
+
+    @abc.abstractmethod
+    def set_stage(self, job_id, stage):
+        ...
+
+    @abc.abstractmethod
+    def purge_expired(self):
+        ...
+
+
+def new_job(ttl):
+    now = time.time()
+    return {
+        'id': uuid.uuid4().hex,
+        'status': QUEUED,
+        'stage': None,
+        'stages': {stage: 'pending' for stage in STAGES},
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': now + ttl,
+        'error': None,
+        'result': None,
+        'report_id': None,
+    }
+
+
+def job_status(job):
+    # Representação pública do job (sem o resultado, que tem rota própria)
+    stages = job['stages']
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'stages': [{'name': name, 'status': status} for name, status in stages.items()],
+        'progress': round(sum(status == 'done' for status in stages.values()) / len(stages), 2),
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+        'error': job['error'],
+    }
+
+
+def _expired(job, now):
+    # Jobs na fila ou executando não expiram, por mais que demorem: o TTL conta da conclusão
+    return job['status'] in (DONE, ERROR) and job['expires_at'] < now
+
+
+class MemoryJobStore(JobStore):
+    """Jobs mantidos em memória no processo do servidor, com expiração por TTL.
+
+    O resultado de um job concluído fica no cache de resultados (o job guarda só o
+    ``report_id``). Só os resultados que não couberam no cache ficam no próprio job,
+    e apenas os ``max_results`` mais recentes. Acima de ``max_jobs`` os jobs
+    concluídos mais antigos são removidos antes do TTL.
+    """
+
+    def __init__(self, ttl, max_jobs=1000, max_results=4):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.max_results = max_results
+        self._jobs = {}
+        # O progresso chega pela thread que drena a fila dos workers
+        self._lock = threading.Lock()
+
+    def create(self):
+        self.purge_expired()
+        job = new_job(self.ttl)
+        with self._lock:
+            self._jobs[job['id']] = job
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or _expired(job, time.time()):
+                raise JobNotFound(job_id)
+            return dict(job, stages=dict(job['stages']))
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise JobNotFound(job_id)
+            job.update(fields)
+            job['updated_at'] = time.time()
+            if job['status'] in (DONE, ERROR):
+                # O TTL conta a partir da conclusão
+                job['expires_at'] = job['updated_at'] + self.ttl
+                if job['status'] == DONE:
+                    job['stages'] = {stage: 'done' for stage in job['stages']}
+            if fields.get('result') is not None:
+                self._trim_results()
+
+    def _trim_results(self):
+        # Mantém só os max_results resultados guardados mais recentes (chamado com o lock)
+        holding = sorted((job for job in self._jobs.values() if job['result'] is not None),
+                         key=lambda job: job['updated_at'])
+        for job in holding[:max(0, len(holding) - self.max_results)]:
+            job['result'] = None
+
+    def set_stage(self, job_id, stage):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] in (DONE, ERROR):
+                return
+            # Estágios anteriores ao atual são considerados concluídos
+            for name in job['stages']:
+                if name == stage:
+                    break
+                job['stages'][name] = 'done'
+            job['stages'][stage] = 'running'
+            job['stage'] = stage
+            job['status'] = RUNNING
+            job['updated_at'] = time.time()
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if _expired(job, now)]:
+                del self._jobs[job_id]
+            # Acima do limite saem os concluídos mais antigos (os em andamento são limitados pelo pool)
+            finished = sorted((job for job in self._jobs.values() if job['status'] in (DONE, ERROR)),
+                              key=lambda job: job['updated_at'])
+            for job in finished[:max(0, len(self._jobs) - self.max_jobs + 1)]:
+                del self._jobs[job['id']]
+
+
+def create_job_store():
+    if settings.JOBS_BACKEND == "memory":
+        return MemoryJobStore(settings.JOBS_TTL, settings.JOBS_MAX, settings.JOBS_MAX_RESULTS)
+    raise ValueError(f"Backend de jobs desconhecido: {settings.JOBS_BACKEND}")
+
+
+store = create_job_store()
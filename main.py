@@ -1,20 +1,38 @@
-from fastapi import FastAPI, Request, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import io
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, Depends
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+try:
+    # Brotli é opcional; sem o pacote as respostas são comprimidas só com gzip
+    from brotli_asgi import BrotliMiddleware as CompressionMiddleware
+except ImportError:
+    from starlette.middleware.gzip import GZipMiddleware as CompressionMiddleware
+from typing import Optional
+import asyncio
 import base64
-import seaborn as sns
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
-from sklearn.linear_model import LinearRegression
-import uvicorn
+import dataclasses
+import html
+import json
+import math
 import os
 
+import clustering
+import jobs
+import metrics
+import serialize
+import settings
+import tasks
+from registry import model_registry, check_model_name, ModelNotFound, InvalidModelName
+from cache import cache_key, result_cache
+from client_index import client_index, InvalidClientQuery, ReportNotIndexed
+from datasets import dataset_store, DatasetNotFound, InvalidDatasetId
+from history import history_store, check_history_name, HistoryNotFound, InvalidHistoryName
+from params import AnalysisParams, ANALYSIS_MODES, CHART_FORMATS, InvalidParams, InvalidTransacoes, MODEL_MODES, PIPELINE_VERSION
+from params import check_finite, check_quantile, parse_n_clusters
+from template import Template
+from uploads import spool_upload, remove_files
+from worker_pool import pool, analysis_ticket, run_with_progress, PoolSaturated, ClientLimitExceeded, ExceedsMemoryBudget
+
 # Armazenar o HTML diretamente como uma string para evitar problemas com sistema de arquivos no Vercel
 INDEX_HTML = """
 <!DOCTYPE html>
@@ -203,6 +221,11 @@ INDEX_HTML = """
                     <input type="file" id="file-campanhas" name="file_campanhas" accept=".csv" onchange="updateFileName(this, 'file-name-campanhas')">
                 </div>
                 
+                <div class="form-group">
+                    <label><input type="checkbox" name="mode" value="preview"> Prévia rápida (amostra das transações, resultados aproximados)</label>
+                    <label><input type="checkbox" name="continue_exact" value="true"> Continuar com a análise completa em segundo plano</label>
+                </div>
+
                 <button type="submit" class="btn" onclick="showLoading()">Analisar Dados</button>
             </form>
             
@@ -289,235 +312,800 @@ INDEX_HTML = """
     </script>
 </body>
 </html>
-    """)
+    """
 
-app = FastAPI()
+def chart_data_uri(body, chart_format):
+    return f"data:{CHART_FORMATS[chart_format]};base64,{base64.b64encode(body).decode()}"
 
-@app.get("/", response_class=HTMLResponse)
-async def get_index(request: Request):
-    return HTMLResponse(content=INDEX_HTML)
+# Pontos de inserção do relatório no INDEX_HTML: (trecho original, trecho com '{}' para o valor)
+REPORT_TEMPLATE = Template(INDEX_HTML, {
+    'results_section': ('id="results-section" class="results-section hidden"', 'id="results-section" class="results-section{}"'),
+    'clusters': ('id="cluster-chart" class="chart" src=""', 'id="cluster-chart" class="chart" src="{}"'),
+    'campaign_spend': ('id="campaign-chart-1" class="chart" src=""', 'id="campaign-chart-1" class="chart" src="{}"'),
+    'campaign_roi': ('id="campaign-chart-2" class="chart" src=""', 'id="campaign-chart-2" class="chart" src="{}"'),
+    'regression': ('id="regression-chart" class="chart" src=""', 'id="regression-chart" class="chart" src="{}"'),
+    'clv': ('id="clv-chart" class="chart" src=""', 'id="clv-chart" class="chart" src="{}"'),
+    'preview_notice': ('Resultados da Análise</h2>', 'Resultados da Análise</h2>{}'),
+    'cluster_info': ('id="cluster-info">', 'id="cluster-info">{}'),
+    'regression_info': ('id="regression-info">', 'id="regression-info">{}'),
+    'high_value_clients': ('id="high-value-clients">', 'id="high-value-clients">{}'),
+    'recommendations': ('id="recommendations">', 'id="recommendations">{}'),
+})
+
+def render_preview_notice(preview):
+    if not preview:
+        return ''
+    if preview['exact']:
+        return "<p><em>Entrada pequena: a prévia analisou todas as transações (resultado exato).</em></p>"
+    threshold = preview['clv']['threshold']
+    clientes = preview['clientes_estimados']
+    parts = [f"""
+    <div class="cluster-info">
+        <h4>Prévia aproximada</h4>
+        <p>Amostra de {preview['rows_sampled']} de ~{preview['rows_total']} transações ({preview['fraction']:.1%}),
+        calculada em {preview['seconds']:.1f} s. Os valores abaixo são estimativas.</p>
+        <p>Clientes estimados: ~{clientes['estimate']:.0f} (entre {clientes['lower']:.0f} e {clientes['upper']:.0f}).</p>
+        <p>Limiar de CLV: entre R$ {threshold['lower']:.2f} e R$ {threshold['upper']:.2f} (95%).</p>
+        <table><tr><th>Campanha</th><th>Total gasto ± (95%)</th><th>ROI estimado ± (95%)</th></tr>
+    """]
+    for campaign in preview['campaigns']:
+        roi_se = campaign['roi_estimado_se']
+        parts.append(f"<tr><td>{html.escape(str(campaign['campanha']))}</td>")
+        parts.append(f"<td>R$ {1.96 * campaign['total_gasto_se']:.2f}</td>")
+        parts.append(f"<td>{'—' if roi_se is None else f'{1.96 * roi_se:.4f}'}</td></tr>")
+    parts.append("</table>")
+    job = preview.get('exact_job')
+    if job and job.get('id'):
+        parts.append(f"<p>Análise completa em andamento: <a href=\"{job['status_url']}\">{job['status_url']}</a></p>")
+    elif job:
+        parts.append(f"<p>A análise completa não pôde ser iniciada: {html.escape(job['error'])}</p>")
+    parts.append("</div>")
+    return ''.join(parts)
+
+def render_report(results, report_id=None):
+    # Com um report_id os gráficos são referenciados por URL (cacheáveis pelo navegador/CDN);
+    # sem ele (resultado fora do cache) voltam a ser embutidos como data URI
+    chart_format = results['chart_format']
+    if report_id is not None:
+        chart_srcs = {name: f"/reports/{report_id}/charts/{name}.{chart_format}" for name in results['charts']}
+    else:
+        chart_srcs = {name: chart_data_uri(body, chart_format) for name, body in results['charts'].items()}
 
-@app.post("/analyze", response_class=HTMLResponse)
-async def analyze_data(
-    request: Request,
-    file_transacoes: UploadFile = File(...),
-    file_campanhas: UploadFile = File(...)
-):
-    # Ler arquivos CSV
-    transacoes_content = await file_transacoes.read()
-    campanhas_content = await file_campanhas.read()
-    
-    transacoes = pd.read_csv(io.BytesIO(transacoes_content))
-    campanhas = pd.read_csv(io.BytesIO(campanhas_content))
-    
-    # Resultados da análise
-    results = {}
-    
-    # 1. Clusterização de Clientes
-    clientes = transacoes.groupby('cliente_id').agg({
-        'frequencia_compras': 'max',
-        'total_gasto': 'max',
-        'ultima_compra': 'max'
-    }).reset_index()
-    
-    scaler = StandardScaler()
-    clientes_scaled = scaler.fit_transform(clientes[['frequencia_compras', 'total_gasto', 'ultima_compra']])
-    
-    kmeans = KMeans(n_clusters=3, random_state=42)
-    clientes['cluster'] = kmeans.fit_predict(clientes_scaled)
-    
-    pca = PCA(n_components=2)
-    clientes[['pca1', 'pca2']] = pca.fit_transform(clientes_scaled)
-    
-    # Gráfico de clusters
-    plt.figure(figsize=(10, 6))
-    sns.scatterplot(data=clientes, x='pca1', y='pca2', hue='cluster', palette='Set2')
-    plt.title('Clusters de Clientes')
-    
-    cluster_img = io.BytesIO()
-    plt.savefig(cluster_img, format='png', bbox_inches='tight')
-    cluster_img.seek(0)
-    cluster_img_b64 = base64.b64encode(cluster_img.read()).decode()
-    results['cluster_chart'] = f"data:image/png;base64,{cluster_img_b64}"
-    plt.close()
-    
-    # Diagnóstico por cluster
-    cluster_diagnostico = clientes.groupby('cluster')[['frequencia_compras', 'total_gasto', 'ultima_compra']].mean().round(2)
-    results['cluster_info'] = []
-    
-    for idx, row in cluster_diagnostico.iterrows():
-        cluster_type = ""
-        if row['frequencia_compras'] > 12 and row['total_gasto'] > 5000:
-            cluster_type = "Cliente fiel e de alto valor"
-        elif row['ultima_compra'] > 250:
-            cluster_type = "Cliente inativo"
-        else:
-            cluster_type = "Cliente de valor médio e recorrência moderada"
-        
-        results['cluster_info'].append({
-            'cluster': idx,
-            'type': cluster_type,
-            'frequencia': row['frequencia_compras'],
-            'gasto': row['total_gasto'],
-            'ultima_compra': row['ultima_compra']
-        })
-    
-    # Merge dos clusters nos dados de transações
-    transacoes = pd.merge(transacoes, clientes[['cliente_id', 'cluster']], on='cliente_id', how='left')
-    
-    # 2. Análise de Preferência por Campanhas
-    preferencia_campanhas = transacoes.groupby('campanha').agg({
-        'cliente_id': 'nunique',
-        'valor_compra': 'sum',
-        'frequencia_compras': 'sum',
-        'total_gasto': 'sum'
-    }).reset_index()
-    
-    preferencia_campanhas = pd.merge(preferencia_campanhas, 
-                                     campanhas, 
-                                     left_on='campanha', 
-                                     right_on='nome_campanha', 
-                                     how='left')
-    
-    preferencia_campanhas['gasto_medio_por_cliente'] = preferencia_campanhas['total_gasto'] / preferencia_campanhas['cliente_id']
-    preferencia_campanhas['roi_estimado'] = preferencia_campanhas['total_gasto'] / preferencia_campanhas['custo_campanha']
-    
-    # Gráfico de gasto médio por cliente por campanha
-    plt.figure(figsize=(12, 6))
-    sns.barplot(data=preferencia_campanhas, x='campanha', y='gasto_medio_por_cliente')
-    plt.title('Gasto Médio por Cliente por Campanha')
-    plt.xticks(rotation=45)
-    
-    campaign_chart1_img = io.BytesIO()
-    plt.savefig(campaign_chart1_img, format='png', bbox_inches='tight')
-    campaign_chart1_img.seek(0)
-    campaign_chart1_img_b64 = base64.b64encode(campaign_chart1_img.read()).decode()
-    results['campaign_chart1'] = f"data:image/png;base64,{campaign_chart1_img_b64}"
-    plt.close()
-    
-    # Gráfico de ROI estimado por campanha
-    plt.figure(figsize=(12, 6))
-    sns.barplot(data=preferencia_campanhas, x='campanha', y='roi_estimado')
-    plt.title('ROI Estimado por Campanha')
-    plt.xticks(rotation=45)
-    
-    campaign_chart2_img = io.BytesIO()
-    plt.savefig(campaign_chart2_img, format='png', bbox_inches='tight')
-    campaign_chart2_img.seek(0)
-    campaign_chart2_img_b64 = base64.b64encode(campaign_chart2_img.read()).decode()
-    results['campaign_chart2'] = f"data:image/png;base64,{campaign_chart2_img_b64}"
-    plt.close()
-    
-    # 3. Regressão Linear para avaliar impacto das campanhas
-    transacoes_reg = transacoes.merge(campanhas, left_on='campanha', right_on='nome_campanha', how='left')
-    features = ['custo_campanha', 'alcance', 'conversao']
-    X = transacoes_reg[features]
-    y = transacoes_reg['total_gasto']
-    
-    reg_model = LinearRegression()
-    reg_model.fit(X, y)
-    coef_df = pd.DataFrame({'Variavel': features, 'Coeficiente': reg_model.coef_})
-    
-    plt.figure(figsize=(12, 6))
-    sns.barplot(data=coef_df, x='Variavel', y='Coeficiente')
-    plt.title('Impacto das Campanhas no Total Gasto')
-    plt.ylabel('Coeficiente da Regressão')
-    
-    regression_img = io.BytesIO()
-    plt.savefig(regression_img, format='png', bbox_inches='tight')
-    regression_img.seek(0)
-    regression_img_b64 = base64.b64encode(regression_img.read()).decode()
-    results['regression_chart'] = f"data:image/png;base64,{regression_img_b64}"
-    plt.close()
-    
-    results['regression_info'] = coef_df.sort_values(by='Coeficiente', ascending=False).to_dict('records')
-    
-    # 4. Análise de CLV (Customer Lifetime Value)
-    clientes_clv = transacoes[['cliente_id', 'total_gasto']].drop_duplicates()
-    clientes_clv.rename(columns={'total_gasto': 'clv'}, inplace=True)
-    
-    thresh_clv = clientes_clv['clv'].quantile(0.75)
-    clientes_clv['segmento_valor'] = clientes_clv['clv'].apply(lambda x: 'Alto Valor' if x >= thresh_clv else 'Demais')
-    
-    plt.figure(figsize=(12, 6))
-    sns.histplot(data=clientes_clv, x='clv', hue='segmento_valor', bins=30, kde=True, palette='Set2')
-    plt.title('Distribuição do CLV por Segmento')
-    plt.xlabel('Customer Lifetime Value')
-    plt.ylabel('Frequência')
-    
-    clv_img = io.BytesIO()
-    plt.savefig(clv_img, format='png', bbox_inches='tight')
-    clv_img.seek(0)
-    clv_img_b64 = base64.b64encode(clv_img.read()).decode()
-    results['clv_chart'] = f"data:image/png;base64,{clv_img_b64}"
-    plt.close()
-    
-    # 5. Clientes de Alto Valor (gasto total >= 60000)
-    clientes_alto_gasto = transacoes[transacoes['total_gasto'] >= 60000]
-    results['high_value_clients'] = clientes_alto_gasto.to_dict('records')
-    
-    # 6. Recomendações de Marketing
-    results['recommendations'] = [
-        "Priorizar campanhas com ROI elevado, como aquelas que entregaram maior retorno por real investido.",
-        "Reavaliar ou reformular campanhas com ROI baixo, focando em novos formatos ou incentivos como brindes, frete grátis, etc.",
-        "Investir mais em campanhas com alto gasto médio por cliente, pois indicam maior valor percebido.",
-        "Oferecer experiências exclusivas e personalizadas para clientes de alto valor, como eventos VIP ou convites para lançamentos de produtos.",
-        "Criar um programa de fidelidade premium com recompensas e benefícios exclusivos.",
-        "Desenvolver um sistema de recomendação de produtos baseado no histórico de compra de cada cliente."
-    ]
-    
-    # Construir o HTML de resposta dinamicamente
-    result_html = INDEX_HTML.replace('id="results-section" class="results-section hidden"', 'id="results-section" class="results-section"')
-    
-    # Injetar imagens nos pontos corretos
-    result_html = result_html.replace('id="cluster-chart" class="chart" src=""', 
-                                     f'id="cluster-chart" class="chart" src="{results["cluster_chart"]}"')
-    result_html = result_html.replace('id="campaign-chart-1" class="chart" src=""', 
-                                     f'id="campaign-chart-1" class="chart" src="{results["campaign_chart1"]}"')
-    result_html = result_html.replace('id="campaign-chart-2" class="chart" src=""', 
-                                     f'id="campaign-chart-2" class="chart" src="{results["campaign_chart2"]}"')
-    result_html = result_html.replace('id="regression-chart" class="chart" src=""', 
-                                     f'id="regression-chart" class="chart" src="{results["regression_chart"]}"')
-    result_html = result_html.replace('id="clv-chart" class="chart" src=""', 
-                                     f'id="clv-chart" class="chart" src="{results["clv_chart"]}"')
-    
     # Adicionar informações de clusters
-    cluster_info_html = ""
+    cluster_info_html = []
     for info in results['cluster_info']:
-        cluster_info_html += f"""
+        cluster_info_html.append(f"""
         <div class="cluster-info">
             <h4>Cluster {info['cluster']}: {info['type']}</h4>
             <p>Frequência média de compras: {info['frequencia']}</p>
             <p>Gasto total médio: R$ {info['gasto']:.2f}</p>
             <p>Dias desde última compra (média): {info['ultima_compra']}</p>
         </div>
-        """
-    result_html = result_html.replace('id="cluster-info">', f'id="cluster-info">{cluster_info_html}')
-    
+        """)
+
     # Adicionar informações de regressão
-    regression_info_html = "<table><tr><th>Variável</th><th>Coeficiente</th></tr>"
+    with_stderr = any(info.get('ErroPadrao') is not None for info in results['regression_info'])
+    regression_info_html = ["<table><tr><th>Variável</th><th>Coeficiente</th>"]
+    regression_info_html.append("<th>Erro padrão</th></tr>" if with_stderr else "</tr>")
     for info in results['regression_info']:
-        regression_info_html += f"<tr><td>{info['Variavel']}</td><td>{info['Coeficiente']:.4f}</td></tr>"
-    regression_info_html += "</table>"
-    result_html = result_html.replace('id="regression-info">', f'id="regression-info">{regression_info_html}')
-    
+        regression_info_html.append(f"<tr><td>{info['Variavel']}</td><td>{info['Coeficiente']:.4f}</td>")
+        regression_info_html.append(f"<td>{info['ErroPadrao']:.4f}</td></tr>" if with_stderr else "</tr>")
+    regression_info_html.append("</table>")
+
     # Adicionar clientes de alto valor
+    high_value_html = []
     if results['high_value_clients']:
-        high_value_html = "<table><tr><th>Cliente ID</th><th>Total Gasto</th><th>Frequência</th><th>Última Compra</th></tr>"
+        high_value_html.append("<table><tr><th>Cliente ID</th><th>Total Gasto</th><th>Frequência</th><th>Última Compra</th></tr>")
         for client in results['high_value_clients'][:10]:  # Limitando a 10 para não sobrecarregar
-            high_value_html += f"<tr><td>{client['cliente_id']}</td><td>R$ {client['total_gasto']:.2f}</td>"
-            high_value_html += f"<td>{client['frequencia_compras']}</td><td>{client['ultima_compra']} dias</td></tr>"
-        high_value_html += "</table>"
-        result_html = result_html.replace('id="high-value-clients">', f'id="high-value-clients">{high_value_html}')
-    
+            high_value_html.append(f"<tr><td>{html.escape(str(client['cliente_id']))}</td><td>R$ {client['total_gasto']:.2f}</td>")
+            high_value_html.append(f"<td>{client['frequencia_compras']}</td><td>{client['ultima_compra']} dias</td></tr>")
+        high_value_html.append("</table>")
+    if report_id is not None:
+        # Todos os clientes, paginados e ordenados pelo índice do relatório (ver client_index.py)
+        clients_url = f"/reports/{report_id}/clients?min_gasto={results['high_value_min_spend']:g}&sort=-total_gasto"
+        high_value_html.append(f'<p><a href="{html.escape(clients_url)}">Ver todos os clientes de alto valor</a></p>')
+
+    # Aviso e margens de erro da prévia aproximada (mode=preview)
+    preview_html = render_preview_notice(results.get('preview'))
+
     # Adicionar recomendações
-    recommendations_html = "<ul>"
+    recommendations_html = ["<ul>"]
     for rec in results['recommendations']:
-        recommendations_html += f"<li>{rec}</li>"
-    recommendations_html += "</ul>"
-    result_html = result_html.replace('id="recommendations">', f'id="recommendations">{recommendations_html}')
-    
-    return HTMLResponse(content=result_html)
+        recommendations_html.append(f"<li>{rec}</li>")
+    recommendations_html.append("</ul>")
+
+    # Montar a página em uma única passada sobre o template
+    return REPORT_TEMPLATE.render(
+        preview_notice=preview_html,
+        cluster_info=''.join(cluster_info_html),
+        regression_info=''.join(regression_info_html),
+        high_value_clients=''.join(high_value_html),
+        recommendations=''.join(recommendations_html),
+        **chart_srcs,
+    )
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+app.add_middleware(metrics.MetricsMiddleware, server_timing=settings.SERVER_TIMING, profiling=settings.PROFILING_ENABLED)
+
+# Métricas lidas do pool e do cache de resultados a cada coleta de /metrics
+metrics.registry.register(metrics.Gauge(
+    'analysis_in_flight', 'Análises executando no pool', function=lambda: pool.running))
+metrics.registry.register(metrics.Gauge(
+    'analysis_queued', 'Análises aguardando na fila do pool', function=lambda: pool.queued))
+metrics.registry.register(metrics.Gauge(
+    'analysis_memory_reserved_bytes', 'Memória estimada das análises executando', function=lambda: pool.reserved))
+metrics.registry.register(metrics.Gauge(
+    'analysis_memory_budget_bytes', 'Orçamento de memória das análises (0 = sem limite)', function=lambda: pool.memory_budget))
+metrics.registry.register(metrics.Gauge(
+    'analysis_clients_active', 'Clientes com análises executando ou na fila', function=lambda: len(pool.clients())))
+metrics.registry.register(metrics.Counter(
+    'result_cache_hits_total', 'Acertos do cache de resultados', function=lambda: result_cache.stats()['hits']))
+metrics.registry.register(metrics.Counter(
+    'result_cache_misses_total', 'Falhas do cache de resultados', function=lambda: result_cache.stats()['misses']))
+metrics.registry.register(metrics.Counter(
+    'result_cache_evictions_total', 'Remoções do cache de resultados', function=lambda: result_cache.stats()['evictions']))
+metrics.registry.register(metrics.Gauge(
+    'result_cache_bytes', 'Bytes em memória no cache de resultados', function=lambda: result_cache.stats()['bytes']))
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    metrics.ANALYSES_REJECTED.inc(reason='saturated')
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado com outras análises, tente novamente em instantes."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(ClientLimitExceeded)
+async def client_limit_handler(request: Request, exc: ClientLimitExceeded):
+    metrics.ANALYSES_REJECTED.inc(reason='client_limit')
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Muitas análises simultâneas deste cliente; aguarde as anteriores terminarem."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(ExceedsMemoryBudget)
+async def memory_budget_handler(request: Request, exc: ExceedsMemoryBudget):
+    metrics.ANALYSES_REJECTED.inc(reason='memory_budget')
+    return JSONResponse(status_code=413, content={"detail": "Arquivo grande demais para a memória disponível para análises."})
+
+@app.exception_handler(MemoryError)
+async def memory_error_handler(request: Request, exc: MemoryError):
+    # A análise passou do limite de memória do worker (ver settings.ANALYSIS_WORKER_MEMORY_LIMIT)
+    metrics.ANALYSES_REJECTED.inc(reason='worker_memory')
+    return JSONResponse(status_code=413, content={"detail": "A análise excedeu a memória disponível no worker."})
+
+@app.exception_handler(jobs.JobNotFound)
+async def job_not_found_handler(request: Request, exc: jobs.JobNotFound):
+    return JSONResponse(status_code=404, content={"detail": "Job não encontrado ou expirado."})
+
+@app.exception_handler(clustering.ClusteringError)
+async def clustering_error_handler(request: Request, exc: clustering.ClusteringError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(InvalidParams)
+async def invalid_params_handler(request: Request, exc: InvalidParams):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(InvalidTransacoes)
+async def invalid_transacoes_handler(request: Request, exc: InvalidTransacoes):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(ModelNotFound)
+async def model_not_found_handler(request: Request, exc: ModelNotFound):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+@app.exception_handler(InvalidModelName)
+async def invalid_model_name_handler(request: Request, exc: InvalidModelName):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(DatasetNotFound)
+async def dataset_not_found_handler(request: Request, exc: DatasetNotFound):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+@app.exception_handler(InvalidDatasetId)
+async def invalid_dataset_id_handler(request: Request, exc: InvalidDatasetId):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(HistoryNotFound)
+async def history_not_found_handler(request: Request, exc: HistoryNotFound):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+@app.exception_handler(InvalidHistoryName)
+async def invalid_history_name_handler(request: Request, exc: InvalidHistoryName):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+# Progresso publicado pelos workers atualiza o estágio dos jobs
+pool.on_progress = jobs.store.set_stage
+
+@app.on_event("startup")
+def warm_pool():
+    # Sobe os workers e importa o pipeline em segundo plano (ver settings.PRELOAD)
+    if settings.PRELOAD:
+        pool.warm()
+
+@app.on_event("shutdown")
+def shutdown_pool():
+    pool.shutdown()
+
+@app.get("/", response_class=HTMLResponse)
+async def get_index(request: Request):
+    return HTMLResponse(content=INDEX_HTML)
+
+# Formatos de gráfico que podem ser embutidos no relatório HTML (JSON é só para APIs)
+HTML_CHART_FORMATS = ('png', 'svg')
+
+def check_chart_format(chart_format):
+    if chart_format not in HTML_CHART_FORMATS:
+        raise HTTPException(status_code=400, detail=f"chart_format deve ser um de: {', '.join(HTML_CHART_FORMATS)}")
+
+def analysis_params(
+    n_clusters: str = Form('3'),
+    k_method: str = Form('silhouette'),
+    cluster_algorithm: str = Form('auto'),
+    model_mode: str = Form('fit'),
+    model_name: Optional[str] = Form(None),
+    model_version: Optional[int] = Form(None),
+    regression_se: bool = Form(False),
+    loyal_min_frequency: float = Form(12.0),
+    loyal_min_spend: float = Form(5000.0),
+    inactive_min_days: float = Form(250.0),
+    clv_quantile: float = Form(0.75),
+    high_value_min_spend: float = Form(60000.0)
+):
+    # Parâmetros da análise (clusterização e modelos) comuns a /analyze, /api/analyze e /jobs.
+    # n_clusters="auto" escolhe k por silhouette ou cotovelo em uma amostra.
+    n_clusters, auto_k = parse_n_clusters(n_clusters)
+    if k_method not in clustering.K_METHODS:
+        raise HTTPException(status_code=400, detail=f"k_method deve ser um de: {', '.join(clustering.K_METHODS)}")
+    if cluster_algorithm not in clustering.ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"cluster_algorithm deve ser um de: {', '.join(clustering.ALGORITHMS)}")
+    if model_mode not in MODEL_MODES:
+        raise HTTPException(status_code=400, detail=f"model_mode deve ser um de: {', '.join(MODEL_MODES)}")
+    if model_mode != 'fit':
+        if not model_name:
+            raise HTTPException(status_code=400, detail=f"model_mode={model_mode} requer model_name")
+        # Resolve "mais recente" aqui: a versão explícita entra na chave do cache
+        model_version = model_registry.resolve(model_name, model_version)
+    elif model_name:
+        check_model_name(model_name)
+    thresholds = {
+        'loyal_min_frequency': loyal_min_frequency,
+        'loyal_min_spend': loyal_min_spend,
+        'inactive_min_days': inactive_min_days,
+        'high_value_min_spend': high_value_min_spend,
+    }
+    for name, value in thresholds.items():
+        check_finite(name, value)
+    check_quantile('clv_quantile', clv_quantile)
+    return AnalysisParams(
+        n_clusters=n_clusters,
+        auto_k=auto_k,
+        k_method=k_method,
+        cluster_algorithm=cluster_algorithm,
+        model_mode=model_mode,
+        model_name=model_name or None,
+        model_version=model_version if model_mode != 'fit' else None,
+        regression_se=regression_se,
+        clv_quantile=clv_quantile,
+        **thresholds,
+    )
+
+def preview_options(
+    mode: str = Form('exact'),
+    preview_seconds: Optional[float] = Form(None),
+    continue_exact: bool = Form(False)
+):
+    # mode=preview: resultado aproximado sobre uma amostra, dentro de preview_seconds (ver preview.py);
+    # continue_exact=true inicia também a análise completa como job. None no modo exato
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"mode deve ser um de: {', '.join(ANALYSIS_MODES)}")
+    if mode == 'exact':
+        return None
+    if preview_seconds is not None and not (math.isfinite(preview_seconds) and preview_seconds > 0):
+        raise HTTPException(status_code=400, detail="preview_seconds deve ser um número positivo")
+    return {'seconds': preview_seconds or settings.PREVIEW_SECONDS, 'continue_exact': continue_exact}
+
+def check_preview(params, preview):
+    # A prévia só ajusta modelos novos e não os registra (o ajuste sobre a amostra é aproximado)
+    if preview is not None and (params.model_mode != 'fit' or params.model_name):
+        raise HTTPException(status_code=400, detail="mode=preview não aceita model_mode nem model_name")
+
+def cache_params(params):
+    return dataclasses.asdict(params)
+
+def uses_result_cache(params):
+    # Análises que registram uma nova versão de modelo sempre executam o pipeline
+    return params.model_mode == 'score' or not params.model_name
+
+def client_id(request):
+    # Cliente (time) que faz o pedido, para os limites por cliente do pool
+    return request.headers.get(settings.ANALYSIS_CLIENT_HEADER) or (request.client.host if request.client else None)
+
+def upload_ticket(request, paths, interactive=True):
+    # A memória estimada segue o tamanho das transações (o primeiro arquivo)
+    return analysis_ticket(client_id(request), os.path.getsize(paths[0]), interactive=interactive)
+
+def preview_ticket(request, paths):
+    # A prévia lê no máximo PREVIEW_SAMPLE_ROWS linhas (~100 bytes cada no CSV), qualquer que seja a entrada
+    input_bytes = min(os.path.getsize(paths[0]), settings.PREVIEW_SAMPLE_ROWS * 100)
+    return analysis_ticket(client_id(request), input_bytes)
+
+async def spool(upload):
+    # Copia o upload para disco em blocos, sem carregar o arquivo inteiro em memória
+    path, digest = await run_in_threadpool(spool_upload, upload.file)
+    metrics.UPLOAD_BYTES.inc(os.path.getsize(path))
+    return path, digest
+
+async def spool_uploads(*uploads, params=None):
+    # Devolve os caminhos, os hashes e a chave do cache de resultados (hash do conteúdo + parâmetros)
+    spooled = [await spool(upload) for upload in uploads]
+    paths = [path for path, _ in spooled]
+    digests = [digest for _, digest in spooled]
+    return paths, digests, cache_key(digests, params, version=PIPELINE_VERSION)
+
+def clientes_key(report_id):
+    # A tabela por cliente tem entrada própria no cache (ver store_results)
+    return f"{report_id}.clientes"
+
+def _store_results(key, results):
+    # O relatório e a tabela por cliente ficam em entradas separadas: as rotas do relatório e
+    # dos gráficos leem o cache no event loop e não desserializam a tabela (que cresce com o
+    # número de clientes). Devolve False se o relatório não coube no cache
+    report = {name: value for name, value in results.items() if name != 'clientes'}
+    if not result_cache.put(key, report):
+        return False
+    result_cache.put(clientes_key(key), results['clientes'])
+    return True
+
+async def store_results(key, results):
+    # O pickle do resultado roda fora do event loop
+    return await run_in_threadpool(_store_results, key, results)
+
+async def cached_clientes(report_id):
+    clientes = await run_in_threadpool(result_cache.peek, clientes_key(report_id))
+    if clientes is None:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado ou expirado.")
+    return clientes
+
+def cached_result(key, params, kind='upload'):
+    # Com ?profile=1 o pipeline sempre executa, para que haja o que medir
+    if not uses_result_cache(params) or metrics.profiling_requested():
+        return None
+    results = result_cache.get(key)
+    if results is not None:
+        metrics.record_cache_hit(kind)
+    return results
+
+async def run_pipeline(fn, *args, kind='upload', ticket=None):
+    # Executa a análise no pool; as medições de cada estágio voltam com o resultado
+    if metrics.profiling_requested():
+        results, report = await pool.submit(metrics.profiled_call, fn, *args, ticket=ticket)
+        metrics.attach_profile(report)
+    else:
+        results = await pool.submit(fn, *args, ticket=ticket)
+    metrics.record_analysis(results['timings'], kind=kind)
+    return results
+
+async def analyze_uploads(request, file_transacoes, file_campanhas, params, preview=None):
+    # Ler arquivos CSV
+    paths, digests, key = await spool_uploads(file_transacoes, file_campanhas, params=cache_params(params))
+
+    # A análise é CPU-bound: roda no pool para não bloquear o event loop.
+    # Uploads idênticos reaproveitam o resultado em cache e pulam o pipeline inteiro
+    # (exceto quando a análise registra uma nova versão de modelo).
+    keep_files = False
+    try:
+        results = cached_result(key, params)
+        if results is None and preview is not None:
+            # Prévias não entram no cache (nem têm relatório endereçável): só o resultado exato
+            results = await run_pipeline(
+                tasks.run_preview, *paths, params, digests[0], preview['seconds'],
+                kind='preview', ticket=preview_ticket(request, paths))
+            if preview['continue_exact'] and not results['preview']['exact']:
+                try:
+                    job = start_job(request, paths, digests, key, params)
+                except (PoolSaturated, ClientLimitExceeded, ExceedsMemoryBudget) as exc:
+                    results['preview']['exact_job'] = {'error': str(exc) or exc.__class__.__name__}
+                else:
+                    # Os arquivos passam a ser do job (removidos quando ele termina)
+                    keep_files = True
+                    results['preview']['exact_job'] = job
+            return results, None
+        if results is None:
+            # O hash das transações identifica o dataset colunar (lido ou criado pelo worker)
+            results = await run_pipeline(
+                tasks.run_analysis, *paths, params, digests[0], ticket=upload_ticket(request, paths))
+            if not await store_results(key, results):
+                # Resultado não coube no cache: sem relatório endereçável, os gráficos vão embutidos
+                return results, None
+    finally:
+        if not keep_files:
+            remove_files(*paths)
+
+    # A chave do cache identifica o relatório e os gráficos servidos por /reports/{id}
+    return results, key
+
+@app.post("/analyze", response_class=HTMLResponse)
+async def analyze_data(
+    request: Request,
+    file_transacoes: UploadFile = File(...),
+    file_campanhas: UploadFile = File(...),
+    chart_format: str = Form('png'),
+    params: AnalysisParams = Depends(analysis_params),
+    preview: Optional[dict] = Depends(preview_options)
+):
+    check_chart_format(chart_format)
+    check_preview(params, preview)
+    params = dataclasses.replace(params, chart_format=chart_format)
+    results, report_id = await analyze_uploads(request, file_transacoes, file_campanhas, params, preview)
+    return HTMLResponse(content=render_report(results, report_id=report_id))
+
+async def run_job(job_id, future, paths, key):
+    try:
+        results = await future
+        metrics.record_analysis(results['timings'])
+        # O resultado fica no cache; só o que não coube nele é guardado no job
+        report_id = key if await store_results(key, results) else None
+        fields = dict(status=jobs.DONE, result=None if report_id else results, report_id=report_id)
+    except Exception as exc:
+        fields = dict(status=jobs.ERROR, error=str(exc) or exc.__class__.__name__)
+    finally:
+        remove_files(*paths)
+    try:
+        jobs.store.update(job_id, **fields)
+    except jobs.JobNotFound:
+        # Job removido durante a análise; o resultado, se coube, continua no cache
+        pass
+
+def start_job(request, paths, digests, key, params):
+    # Análise completa em segundo plano (POST /jobs e mode=preview com continue_exact).
+    # Jobs são o caminho dos lotes grandes: ficam atrás dos pedidos síncronos pequenos.
+    # Iniciado, o job remove os arquivos ao terminar
+    job = jobs.store.create()
+    try:
+        future = pool.start(
+            run_with_progress, job['id'], tasks.run_analysis, *paths, params, digests[0],
+            ticket=upload_ticket(request, paths, interactive=False),
+        )
+    except (PoolSaturated, ClientLimitExceeded, ExceedsMemoryBudget) as exc:
+        jobs.store.update(job['id'], status=jobs.ERROR, error=str(exc))
+        raise
+    asyncio.create_task(run_job(job['id'], future, paths, key))
+    return {"id": job['id'], "status": job['status'], "status_url": f"/jobs/{job['id']}"}
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    request: Request,
+    file_transacoes: UploadFile = File(...),
+    file_campanhas: UploadFile = File(...),
+    chart_format: str = Form('png'),
+    params: AnalysisParams = Depends(analysis_params)
+):
+    check_chart_format(chart_format)
+    params = dataclasses.replace(params, chart_format=chart_format)
+    paths, digests, key = await spool_uploads(file_transacoes, file_campanhas, params=cache_params(params))
+
+    results = cached_result(key, params)
+    if results is not None:
+        # Mesmos arquivos já analisados: o job nasce concluído, sem passar pelo pool
+        remove_files(*paths)
+        job = jobs.store.create()
+        jobs.store.update(job['id'], status=jobs.DONE, report_id=key)
+        return {"id": job['id'], "status": jobs.DONE, "status_url": f"/jobs/{job['id']}"}
+
+    try:
+        return start_job(request, paths, digests, key, params)
+    except (PoolSaturated, ClientLimitExceeded, ExceedsMemoryBudget):
+        remove_files(*paths)
+        raise
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return jobs.job_status(jobs.store.get(job_id))
+
+@app.get("/jobs/{job_id}/result", response_class=HTMLResponse)
+async def get_job_result(job_id: str, format: str = 'html'):
+    if format not in ('html', 'json'):
+        raise HTTPException(status_code=400, detail="format deve ser html ou json")
+    job = jobs.store.get(job_id)
+    if job['status'] == jobs.ERROR:
+        raise HTTPException(status_code=500, detail=f"A análise falhou: {job['error']}")
+    if job['status'] != jobs.DONE:
+        raise HTTPException(status_code=409, detail="A análise ainda não foi concluída.")
+    results = job['result']
+    if results is None and job['report_id'] is not None:
+        results = result_cache.peek(job['report_id'])
+    if results is None:
+        raise HTTPException(status_code=410, detail="O resultado do job expirou; envie a análise novamente.")
+    if format == 'json':
+        return api_response(results, job['report_id'])
+    return HTMLResponse(content=render_report(results, report_id=job['report_id']))
+
+def api_response(results, report_id):
+    chart_format = results['chart_format']
+    if chart_format == 'json':
+        chart_entries = {name: json.loads(body) for name, body in results['charts'].items()}
+    elif report_id is not None:
+        chart_entries = {name: f"/reports/{report_id}/charts/{name}.{chart_format}" for name in results['charts']}
+    else:
+        chart_entries = {name: chart_data_uri(body, chart_format) for name, body in results['charts'].items()}
+
+    links = None
+    if report_id is not None:
+        links = {'report': f"/api/reports/{report_id}", 'clientes': f"/api/reports/{report_id}/clientes"}
+
+    summary = serialize.results_summary(results, charts=chart_entries or None, links=links)
+    summary['report_id'] = report_id
+    return Response(content=serialize.dumps(summary), media_type="application/json")
+
+def api_chart_format(charts_format):
+    # Por padrão nenhum gráfico é renderizado; charts=png|svg|json os inclui na resposta
+    if charts_format != 'none' and charts_format not in CHART_FORMATS:
+        raise HTTPException(status_code=400, detail=f"charts deve ser none ou um de: {', '.join(CHART_FORMATS)}")
+    return None if charts_format == 'none' else charts_format
+
+@app.post("/api/analyze")
+async def api_analyze(
+    request: Request,
+    file_transacoes: UploadFile = File(...),
+    file_campanhas: UploadFile = File(...),
+    charts_format: str = Form('none', alias='charts'),
+    params: AnalysisParams = Depends(analysis_params),
+    preview: Optional[dict] = Depends(preview_options)
+):
+    check_preview(params, preview)
+    params = dataclasses.replace(params, chart_format=api_chart_format(charts_format))
+    results, report_id = await analyze_uploads(request, file_transacoes, file_campanhas, params, preview)
+    return api_response(results, report_id)
+
+@app.get("/api/reports/{report_id}")
+async def api_get_report(report_id: str):
+    results = result_cache.peek(report_id)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado ou expirado.")
+    return api_response(results, report_id)
+
+@app.get("/api/reports/{report_id}/clientes")
+async def api_get_report_clientes(report_id: str, format: str = 'json'):
+    if format not in serialize.TABLE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format deve ser um de: {', '.join(serialize.TABLE_FORMATS)}")
+    clientes = await cached_clientes(report_id)
+    try:
+        body = await run_in_threadpool(serialize.encode_table, clientes, format)
+    except serialize.UnsupportedFormat as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+    return Response(content=body, media_type=serialize.TABLE_FORMATS[format])
+
+# Construções em andamento das tabelas por cliente: pedidos simultâneos esperam a mesma
+_client_index_builds = {}
+
+async def ensure_client_index(request, report_id):
+    # A tabela indexada é criada no pool na primeira consulta ao relatório
+    if client_index.exists(report_id):
+        return
+    build = _client_index_builds.get(report_id)
+    if build is None:
+        results = result_cache.peek(report_id)
+        if results is None:
+            raise HTTPException(status_code=404, detail="Relatório não encontrado ou expirado.")
+        clientes = await cached_clientes(report_id)
+        if client_index.exists(report_id) or report_id in _client_index_builds:
+            # Outro pedido começou (ou terminou) a construção enquanto a tabela era lida
+            return await ensure_client_index(request, report_id)
+        ticket = analysis_ticket(client_id(request), int(clientes.memory_usage(deep=True).sum()))
+        build = asyncio.ensure_future(pool.submit(
+            tasks.build_client_index, report_id, clientes, results['clv_threshold'], ticket=ticket))
+        _client_index_builds[report_id] = build
+        build.add_done_callback(lambda _: _client_index_builds.pop(report_id, None))
+    await asyncio.shield(build)
+
+@app.get("/reports/{report_id}/clients")
+async def get_report_clients(
+    request: Request,
+    report_id: str,
+    cluster: Optional[int] = None,
+    segmento: Optional[str] = None,
+    min_gasto: Optional[float] = None,
+    max_gasto: Optional[float] = None,
+    sort: str = '-total_gasto',
+    page: int = 1,
+    page_size: int = settings.CLIENT_PAGE_SIZE
+):
+    # Clientes do relatório (um por cliente_id), filtrados, ordenados e paginados
+    if page < 1:
+        raise HTTPException(status_code=400, detail="page deve ser maior ou igual a 1")
+    if not 1 <= page_size <= settings.CLIENT_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"page_size deve estar entre 1 e {settings.CLIENT_PAGE_MAX}")
+    for name, value in (('min_gasto', min_gasto), ('max_gasto', max_gasto)):
+        if value is not None and not math.isfinite(value):
+            raise HTTPException(status_code=400, detail=f"{name} deve ser um número finito")
+    await ensure_client_index(request, report_id)
+    try:
+        total, clientes = await run_in_threadpool(
+            client_index.query, report_id, cluster=cluster, segmento=segmento, min_gasto=min_gasto,
+            max_gasto=max_gasto, sort=sort, page=page, page_size=page_size)
+    except InvalidClientQuery as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except ReportNotIndexed:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado ou expirado.")
+
+    pages = max(1, math.ceil(total / page_size))
+    links = {}
+    for name, target in (('prev', page - 1), ('next', page + 1)):
+        if 1 <= target <= pages:
+            links[name] = str(request.url.include_query_params(page=target))
+    return Response(content=serialize.dumps({
+        'report_id': report_id,
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'pages': pages,
+        'sort': sort,
+        'clientes': clientes,
+        'links': links,
+    }), media_type="application/json")
+
+@app.get("/reports/{report_id}/charts/{filename}")
+async def get_report_chart(request: Request, report_id: str, filename: str):
+    name, _, extension = filename.rpartition('.')
+    results = result_cache.peek(report_id)
+    if results is None or extension != results['chart_format'] or name not in results['charts']:
+        raise HTTPException(status_code=404, detail="Gráfico não encontrado ou expirado.")
+
+    # O id do relatório já é derivado do conteúdo: o gráfico nunca muda para a mesma URL
+    etag = f'"{report_id}-{name}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if extension == 'png':
+        # PNG já é comprimido; evita recomprimir no middleware
+        headers["Content-Encoding"] = "identity"
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=results['charts'][name], media_type=CHART_FORMATS[extension], headers=headers)
+
+@app.get("/models")
+async def list_models():
+    return await run_in_threadpool(model_registry.models)
+
+@app.get("/models/{model_name}")
+async def get_model(model_name: str):
+    versions = await run_in_threadpool(model_registry.versions, model_name)
+    if not versions:
+        raise ModelNotFound(f"Modelo não encontrado: {model_name}")
+    return {"name": model_name, "versions": versions}
+
+@app.get("/history")
+async def list_histories():
+    return {"histories": await run_in_threadpool(history_store.names)}
+
+@app.get("/history/{history_name}")
+async def get_history(history_name: str):
+    return await run_in_threadpool(history_store.info, history_name)
+
+@app.post("/history/{history_name}/transacoes")
+async def append_history(request: Request, history_name: str, file_transacoes: UploadFile = File(...)):
+    # Acrescenta um lote de transações ao histórico (criado no primeiro lote)
+    check_history_name(history_name)
+    path, digest = await spool(file_transacoes)
+    try:
+        info = await pool.submit(
+            history_store.append, history_name, path, digest,
+            ticket=upload_ticket(request, [path], interactive=False),
+        )
+    finally:
+        remove_files(path)
+    if not info['lote']['duplicado']:
+        metrics.ROWS_PROCESSED.inc(info['lote']['transacoes'], kind='history')
+    return info
+
+def history_cache_key(history_name, revision, campanhas_digest, params):
+    return cache_key([f"history:{history_name}:{revision}", campanhas_digest], cache_params(params), version=PIPELINE_VERSION)
+
+@app.post("/history/{history_name}/analyze")
+async def analyze_history(
+    request: Request,
+    history_name: str,
+    file_campanhas: UploadFile = File(...),
+    charts_format: str = Form('none', alias='charts'),
+    params: AnalysisParams = Depends(analysis_params)
+):
+    # Análise sobre os agregados do histórico: o custo não depende do número de transações
+    params = dataclasses.replace(params, chart_format=api_chart_format(charts_format))
+    info = await run_in_threadpool(history_store.info, history_name)
+    path, digest = await spool(file_campanhas)
+    key = history_cache_key(history_name, info['revision'], digest, params)
+    try:
+        results = cached_result(key, params, kind='history')
+        if results is None:
+            ticket = analysis_ticket(client_id(request), info['bytes'])
+            results = await run_pipeline(
+                tasks.run_history_analysis, history_name, path, params, kind='history', ticket=ticket)
+            # Um lote gravado no meio tempo muda a revisão: a chave segue o que o worker leu
+            key = history_cache_key(history_name, results['history']['revision'], digest, params)
+            if not await store_results(key, results):
+                key = None
+    finally:
+        remove_files(path)
+    return api_response(results, key)
+
+@app.get("/datasets")
+async def list_datasets():
+    return {"datasets": await run_in_threadpool(dataset_store.datasets)}
+
+@app.get("/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    return await run_in_threadpool(dataset_store.info, dataset_id)
+
+@app.post("/datasets")
+async def create_dataset(
+    request: Request,
+    file_transacoes: UploadFile = File(...),
+    file_campanhas: Optional[UploadFile] = File(None),
+):
+    # Converte o CSV de transações para o formato colunar; o id é o hash do conteúdo.
+    # O CSV de campanhas, se enviado, fica guardado com o dataset
+    path, digest = await spool(file_transacoes)
+    try:
+        info = await pool.submit(
+            dataset_store.convert, path, digest, ticket=upload_ticket(request, [path], interactive=False))
+    finally:
+        remove_files(path)
+    if info['created']:
+        metrics.ROWS_PROCESSED.inc(info['rows'], kind='dataset')
+    if file_campanhas is not None:
+        path, campanhas_digest = await spool(file_campanhas)
+        try:
+            meta = await run_in_threadpool(dataset_store.attach_campanhas, digest, path, campanhas_digest)
+        finally:
+            remove_files(path)
+        info['campanhas_sha256'] = meta['campanhas_sha256']
+    return info
+
+@app.post("/datasets/{dataset_id}/analyze")
+async def analyze_dataset(
+    request: Request,
+    dataset_id: str,
+    file_campanhas: Optional[UploadFile] = File(None),
+    charts_format: str = Form('none', alias='charts'),
+    params: AnalysisParams = Depends(analysis_params)
+):
+    # Mesma análise de /api/analyze sobre um dataset já convertido, sem reenviar as transações.
+    # Sem file_campanhas usa o CSV de campanhas guardado com o dataset. Só os estágios
+    # afetados pelos parâmetros são recalculados (ver pipeline_cache.py)
+    params = dataclasses.replace(params, chart_format=api_chart_format(charts_format))
+    info = await run_in_threadpool(dataset_store.info, dataset_id)
+    if file_campanhas is not None:
+        path, digest = await spool(file_campanhas)
+    else:
+        path, digest = await run_in_threadpool(dataset_store.campanhas, dataset_id)
+        if path is None:
+            raise HTTPException(status_code=400, detail="Envie file_campanhas: o dataset não tem campanhas guardadas")
+    # Mesma chave de um upload com o mesmo CSV de transações: os resultados são compartilhados
+    key = cache_key([dataset_id, digest], cache_params(params), version=PIPELINE_VERSION)
+    try:
+        results = cached_result(key, params, kind='dataset')
+        if results is None:
+            # Estimada pelo tamanho do CSV original, como um upload do mesmo arquivo
+            ticket = analysis_ticket(client_id(request), info.get('csv_bytes') or info['bytes'])
+            results = await run_pipeline(
+                tasks.run_dataset_analysis, dataset_id, path, params, kind='dataset', ticket=ticket)
+            if not await store_results(key, results):
+                key = None
+    finally:
+        if file_campanhas is not None:
+            remove_files(path)
+    return api_response(results, key)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    # Formato texto do Prometheus
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/health")
 async def health_check():
@@ -525,5 +1113,7 @@ async def health_check():
 
 # Código para iniciar localmente (não usado no Vercel)
 if __name__ == "__main__":
+    import uvicorn
+
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
@@ -0,0 +1,378 @@
+import contextvars
+import cProfile
+import io
+import pstats
+import resource
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+
+# Intervalos dos histogramas: segundos (estágios e análises) e bytes (memória)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(2 ** 20 * 4 ** i for i in range(7))  # 1 MiB .. 4 GiB
+
+# O Starlette acrescenta o charset=utf-8
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Métricas sem rótulos podem ser lidas de uma função a cada coleta (ex.: contadores do cache)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: rótulos esperados {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, **extra):
+        return dict(zip(self.labelnames, key), **extra)
+
+    def samples(self):
+        if self.function is not None:
+            return [(self.name, {}, self.function())]
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", self._labels(key, le=_format_value(bound)), count))
+                samples.append((f"{self.name}_count", self._labels(key), counts[-1]))
+                samples.append((f"{self.name}_sum", self._labels(key), total))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    'analysis_stage_seconds', 'Duração de cada estágio do pipeline de análise', ['stage']))
+ANALYSIS_SECONDS = registry.register(Histogram(
+    'analysis_seconds', 'Duração total das análises executadas (sem acertos de cache)', ['kind']))
+ANALYSIS_PEAK_MEMORY = registry.register(Histogram(
+    'analysis_peak_memory_delta_bytes', 'Pico de memória (RSS) do worker durante a análise acima do uso no início',
+    ['kind'], buckets=BYTES_BUCKETS))
+ROWS_PROCESSED = registry.register(Counter(
+    'analysis_rows_processed_total', 'Linhas de transações lidas', ['kind']))
+UPLOAD_BYTES = registry.register(Counter(
+    'upload_bytes_total', 'Bytes recebidos em uploads de CSV'))
+ANALYSES = registry.register(Counter(
+    'analyses_total', 'Análises por origem do resultado', ['kind', 'source']))
+ANALYSES_REJECTED = registry.register(Counter(
+    'analyses_rejected_total', 'Pedidos recusados pelo escalonador do pool', ['reason']))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    'http_requests_in_flight', 'Requisições HTTP em andamento'))
+
+
+def peak_rss_bytes():
+    # ru_maxrss está em KiB no Linux e em bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _vm_hwm_bytes():
+    # Pico de RSS desde o último reset (VmHWM, em KiB); None fora do Linux
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# Pico de memória por análise: desligado quando as análises rodam em threads do próprio
+# servidor (ver worker_pool), onde o processo é compartilhado por análises concorrentes
+_measure_peak_memory = True
+
+
+def disable_peak_memory():
+    global _measure_peak_memory
+    _measure_peak_memory = False
+
+
+def reset_peak_rss():
+    """Recomeça a medição do pico de memória; devolve o RSS atual (ou o pico acumulado).
+
+    No Linux, "5" em /proc/self/clear_refs volta o VmHWM ao RSS atual, e
+    ``peak_rss_bytes_since_reset`` mede só o pico desde então. Sem isso (outros
+    sistemas, /proc sem permissão de escrita) vale o ru_maxrss, que é o pico de toda a
+    vida do processo: depois de uma análise grande, as seguintes no mesmo worker
+    registram aumento zero.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return peak_rss_bytes()
+    return _vm_hwm_bytes() or peak_rss_bytes()
+
+
+def peak_rss_bytes_since_reset():
+    return _vm_hwm_bytes() or peak_rss_bytes()
+
+
+class StageClock:
+    """Callback de progresso que também mede cada estágio (executado no worker).
+
+    Repassa o estágio ao callback original e, em ``finish``, devolve as durações
+    e o pico de memória do processo durante a análise acima do uso no início (ver
+    ``reset_peak_rss``; None com ``disable_peak_memory``); o servidor registra as
+    métricas ao receber o resultado.
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.stages = {}
+        self._current = None
+        self._started = self._stage_started = time.perf_counter()
+        self._peak_rss = reset_peak_rss() if _measure_peak_memory else None
+
+    def __call__(self, stage):
+        now = time.perf_counter()
+        if self._current is not None:
+            self.stages[self._current] = self.stages.get(self._current, 0.0) + now - self._stage_started
+        self._current, self._stage_started = stage, now
+        if stage is not None and self.progress is not None:
+            self.progress(stage)
+
+    def finish(self, **extra):
+        self(None)
+        return dict(
+            stages=self.stages,
+            seconds=time.perf_counter() - self._started,
+            peak_memory_delta=None if self._peak_rss is None
+            else max(0, peak_rss_bytes_since_reset() - self._peak_rss),
+            **extra,
+        )
+
+
+# Métricas por requisição: Server-Timing e o perfil de depuração (ver MetricsMiddleware)
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+_request_profile = contextvars.ContextVar('request_profile', default=None)
+
+
+def start_request(profile=False):
+    timings = []
+    profile_holder = {} if profile else None
+    return _request_timings.set(timings), _request_profile.set(profile_holder), timings, profile_holder
+
+
+def end_request(tokens):
+    _request_timings.reset(tokens[0])
+    _request_profile.reset(tokens[1])
+
+
+def add_server_timing(name, seconds=None, description=None):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds, description))
+
+
+def server_timing_header(timings):
+    parts = []
+    for name, seconds, description in timings:
+        part = name
+        if seconds is not None:
+            part += f";dur={seconds * 1000:.1f}"
+        if description:
+            part += f';desc="{description}"'
+        parts.append(part)
+    return ', '.join(parts)
+
+
+def profiling_requested():
+    return _request_profile.get() is not None
+
+
+def attach_profile(report):
+    holder = _request_profile.get()
+    if holder is not None:
+        holder['report'] = report
+
+
+def record_analysis(timings, kind='upload'):
+    # Registra as medições devolvidas pelo worker junto com o resultado
+    for stage, seconds in timings['stages'].items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        add_server_timing(stage, seconds)
+    ANALYSIS_SECONDS.observe(timings['seconds'], kind=kind)
+    if timings['peak_memory_delta'] is not None:
+        ANALYSIS_PEAK_MEMORY.observe(timings['peak_memory_delta'], kind=kind)
+    ROWS_PROCESSED.inc(timings.get('rows', 0), kind=kind)
+    ANALYSES.inc(kind=kind, source='pipeline')
+
+
+def record_cache_hit(kind='upload'):
+    ANALYSES.inc(kind=kind, source='cache')
+    add_server_timing('cache', description='hit')
+
+
+def profile_report(profiler, limit=40):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+def profiled_call(fn, *args, **kwargs):
+    # Executado no worker: devolve (resultado, relatório em texto).
+    # Usa o pyinstrument se estiver instalado (opcional); senão, o cProfile.
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn, *args, **kwargs)
+        return result, profile_report(profiler)
+    profiler = Profiler()
+    profiler.start()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profiler.stop()
+    return result, profiler.output_text(unicode=True)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: requisições em andamento, Server-Timing e perfil de depuração.
+
+    Com ``profiling`` ativo, ``?profile=1`` troca a resposta pelo relatório do
+    profiler: o da análise, quando ela roda no pool (ver ``profiled_call``), ou o
+    do próprio processo do servidor nas demais rotas.
+    """
+
+    def __init__(self, app, server_timing=False, profiling=False):
+        self.app = app
+        self.server_timing = server_timing
+        self.profiling = profiling
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        profile = self.profiling and query.get('profile', [''])[-1] in ('1', 'true')
+        tokens = start_request(profile)
+        timings, holder = tokens[2], tokens[3]
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if self.server_timing and message['type'] == 'http.response.start':
+                timings.append(('total', time.perf_counter() - started, None))
+                headers = list(message.get('headers', [])) + [(b'server-timing', server_timing_header(timings).encode())]
+                message = dict(message, headers=headers)
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            if profile:
+                await self._profiled(scope, receive, send_with_timing, holder)
+            else:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            end_request(tokens[:2])
+
+    async def _profiled(self, scope, receive, send, holder):
+        async def discard(message):
+            pass
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.disable()
+        body = (holder.get('report') or profile_report(profiler)).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/plain; charset=utf-8'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
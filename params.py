@@ -0,0 +1,86 @@
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+# Definições da análise usadas pelo servidor. Este módulo não importa pandas,
+# scikit-learn nem matplotlib: eles só são carregados pelos workers do pipeline.
+
+# Versão do pipeline; incrementar quando os resultados mudarem (invalida o cache de resultados)
+PIPELINE_VERSION = 12
+
+# Estágios do pipeline, na ordem em que são executados (usados no progresso dos jobs)
+STAGES = ('load', 'clustering', 'campaigns', 'regression', 'clv', 'render')
+
+# Modos dos modelos: ajustar do zero, só aplicar (score) uma versão registrada
+# ou atualizar a clusterização dela com os novos dados (gera uma nova versão)
+MODEL_MODES = ('fit', 'score', 'update')
+
+# Modos da análise síncrona: exata ou prévia aproximada sobre uma amostra (ver preview.py)
+ANALYSIS_MODES = ('exact', 'preview')
+
+# Formatos dos gráficos e seus content types
+CHART_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'json': 'application/json',
+}
+
+
+class InvalidParams(ValueError):
+    pass
+
+
+class InvalidTransacoes(ValueError):
+    # Arquivo de transações que não pode ser analisado (vazio, cliente_id com tipos misturados)
+    pass
+
+
+@dataclass(frozen=True)
+class AnalysisParams:
+    chart_format: Optional[str] = 'png'
+    n_clusters: int = 3
+    auto_k: bool = False
+    k_method: str = 'silhouette'
+    cluster_algorithm: str = 'auto'
+    model_mode: str = 'fit'
+    # Modelo do registro: usado em score/update e, nos modos fit/update, para registrar uma nova versão
+    model_name: Optional[str] = None
+    # Versão usada em score/update (resolvida para um número antes de chegar ao worker)
+    model_version: Optional[int] = None
+    # Inclui os erros padrão dos coeficientes da regressão
+    regression_se: bool = False
+    # Limiares dos rótulos dos clusters, comparados com as médias de cada cluster
+    loyal_min_frequency: float = 12.0
+    loyal_min_spend: float = 5000.0
+    inactive_min_days: float = 250.0
+    # Quantil do CLV a partir do qual o cliente é do segmento "Alto Valor"
+    clv_quantile: float = 0.75
+    # Gasto total mínimo das transações listadas como de clientes de alto valor
+    high_value_min_spend: float = 60000.0
+
+
+# Validação dos parâmetros comum ao servidor (main.analysis_params) e à CLI (batch.py)
+N_CLUSTERS_MIN = 2
+N_CLUSTERS_MAX = 50
+
+
+def parse_n_clusters(value):
+    # "auto" ou um inteiro na faixa; devolve (n_clusters, auto_k)
+    if value == 'auto':
+        return 3, True
+    if not (value.isdigit() and N_CLUSTERS_MIN <= int(value) <= N_CLUSTERS_MAX):
+        raise InvalidParams(
+            f"n_clusters deve ser 'auto' ou um inteiro entre {N_CLUSTERS_MIN} e {N_CLUSTERS_MAX}")
+    return int(value), False
+
+
+def check_finite(name, value):
+    if not math.isfinite(value):
+        raise InvalidParams(f"{name} deve ser um número finito")
+    return value
+
+
+def check_quantile(name, value):
+    if not 0 <= value <= 1:
+        raise InvalidParams(f"{name} deve estar entre 0 e 1")
+    return value
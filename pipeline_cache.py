@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from params import PIPELINE_VERSION
+
+
+class StageCache:
+    """Saídas dos estágios caros do pipeline de um dataset, guardadas em disco.
+
+    Cada saída fica em ``<directory>/<estágio>-<chave>.pkl``. A chave é o hash dos
+    parâmetros de que o estágio depende e das chaves dos estágios anteriores
+    (``after``), então uma mudança só invalida o que vem depois dela: outro
+    número de clusters refaz a clusterização, mas reaproveita os agregados, a
+    escala e o PCA. Os limiares (rótulos dos clusters, quantil do CLV, gasto de
+    alto valor) não entram em nenhum estágio guardado: o que depende deles é
+    barato e é recalculado a cada análise.
+
+    Com ``directory=None`` nada é guardado (uploads sem dataset): os estágios são
+    sempre calculados. Executado nos workers; gravações concorrentes da mesma
+    chave são inofensivas (o conteúdo é o mesmo e a troca do arquivo é atômica).
+    """
+
+    def __init__(self, directory=None, max_variants=8):
+        self.directory = directory
+        self.max_variants = max_variants
+        self.keys = {}
+        # Estágio -> 'hit' ou 'computed' (devolvido nos resultados)
+        self.status = {}
+
+    def key(self, stage, params=None, after=()):
+        payload = {
+            'stage': stage,
+            'params': params or {},
+            'after': [self.keys.get(name) for name in after],
+            'version': PIPELINE_VERSION,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, f"{stage}-{key}.pkl")
+
+    def get(self, stage, compute, params=None, after=()):
+        key = self.keys[stage] = self.key(stage, params, after)
+        if self.directory is not None:
+            path = self._path(stage, key)
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+            else:
+                # O mtime marca o último uso (ver _prune)
+                os.utime(path)
+                self.status[stage] = 'hit'
+                return value
+        value = compute()
+        self.put(stage, value, params, after)
+        return value
+
+    def put(self, stage, value, params=None, after=()):
+        key = self.keys[stage] = self.key(stage, params, after)
+        self.status[stage] = 'computed'
+        if self.directory is None:
+            return
+        # Falhar ao guardar (ex.: disco cheio) não derruba a análise
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self._path(stage, key))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            self._prune(stage)
+        except OSError:
+            pass
+
+    def _prune(self, stage):
+        # Mantém as max_variants saídas do estágio usadas mais recentemente
+        prefix = f"{stage}-"
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith('.pkl'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        for _, path in sorted(entries, reverse=True)[self.max_variants:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
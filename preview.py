@@ -0,0 +1,361 @@
+"""Prévia aproximada da análise (mode=preview), calculada sobre uma amostra das transações.
+
+A amostra é estratificada por campanha: cada uma recebe linhas proporcionais ao
+tamanho, com um mínimo por campanha. Com o upload já convertido em dataset, o
+tamanho de cada campanha é contado na coluna de códigos (ver
+columnar.ColumnReader.sample_by_campanha). Direto do CSV, os blocos do arquivo
+são lidos em ordem sorteada até o fim ou até a parte do tempo reservada à
+leitura, guardando uma amostra limitada de cada campanha (ver sample_csv); se o
+prazo vencer antes do fim, os tamanhos são estimados pela parte lida.
+
+Os totais por campanha são ponderados pelo tamanho estimado de cada estrato. A
+clusterização e o PCA são ajustados em no máximo PREVIEW_CLUSTER_CLIENTES
+clientes da amostra. O resto do pipeline é o mesmo da análise completa
+(analysis.analyze_aggregates). ``results['preview']`` traz os erros padrão e os
+intervalos de 95% das estimativas. São aproximados: a amostra por linhas
+favorece clientes com mais transações, e os blocos do CSV não são independentes.
+"""
+import io
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import settings
+from analysis import HIGH_VALUE_LIMIT, _no_progress, analyze_aggregates, run_analysis, run_dataset_analysis
+from datasets import dataset_store
+from ingest import TRANSACOES_COLUMNS, TRANSACOES_DTYPES, aggregate_chunks, pin_cliente_id
+from metrics import StageClock
+from params import AnalysisParams, InvalidTransacoes
+
+# Quantil da normal para os intervalos de 95%
+Z_95 = 1.959964
+CLV_BINS = 30
+# Blocos do CSV interpretados por chamada ao read_csv na prévia
+_BATCH_BLOCKS = 16
+
+
+def _read_block(f, start, block_bytes, data_start):
+    # Linhas que começam em [start, start + block_bytes): cada linha do arquivo
+    # pertence a um único bloco, então os blocos sorteados não se sobrepõem
+    partial = start > data_start
+    f.seek(start - 1 if partial else start)
+    # Folga para a última linha, que pode passar do fim do bloco
+    data = f.read(block_bytes + 1 + 64 * 1024)
+    first = data.find(b'\n') + 1 if partial else 0
+    limit = block_bytes + (1 if partial else 0)
+    if (partial and first == 0) or first >= limit:
+        return b''
+    end = data.find(b'\n', limit - 1)
+    return data[first:] if end < 0 else data[first:end + 1]
+
+
+def estimate_rows(path, block_bytes=None):
+    # Linhas estimadas pelo tamanho médio das linhas do início do arquivo
+    block_bytes = block_bytes or settings.PREVIEW_BLOCK_BYTES
+    with open(path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        head = f.read(block_bytes)
+    if not head:
+        return 0
+    return (os.path.getsize(path) - data_start) * max(1, head.count(b'\n')) / len(head)
+
+
+def _scan_blocks(f, order, names, block_bytes, data_start, deadline, scanned):
+    # Lê os blocos na ordem dada, _BATCH_BLOCKS por vez (um read_csv por lote), até o fim da
+    # lista ou do prazo; acumula em `scanned` os bytes e as linhas lidas
+    for batch in range(0, len(order), _BATCH_BLOCKS):
+        if scanned['rows'] and time.perf_counter() >= deadline:
+            return
+        data = b''.join(
+            _read_block(f, data_start + int(block) * block_bytes, block_bytes, data_start)
+            for block in order[batch:batch + _BATCH_BLOCKS]
+        )
+        scanned['bytes'] += len(data)
+        if not data.strip():
+            continue
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=names,
+                            usecols=TRANSACOES_COLUMNS, dtype=TRANSACOES_DTYPES)
+        scanned['rows'] += len(frame)
+        yield frame
+
+
+def _smallest_keys(frame, limit):
+    # Em cada campanha, as `limit` linhas de menor chave (limit: número ou Series por campanha)
+    frame = frame.sort_values('_chave')
+    rank = frame.groupby('campanha', dropna=False, sort=False).cumcount().to_numpy()
+    if isinstance(limit, pd.Series):
+        limit = limit.reindex(frame['campanha']).to_numpy()
+    return frame[rank < limit]
+
+
+def sample_csv(path, target_rows, min_rows, deadline, rng, block_bytes=None):
+    # Amostra estratificada por campanha direto do CSV. Os blocos são lidos em ordem sorteada
+    # (o primeiro antes: o tipo de cliente_id é o do início do arquivo) até o fim do arquivo
+    # ou do prazo. Cada linha recebe uma chave aleatória e cada campanha guarda só as
+    # target_rows de menor chave (amostra uniforme dentro da campanha, memória limitada). No
+    # fim, cada campanha fica com linhas proporcionais ao tamanho, com ao menos min_rows, como
+    # em columnar.ColumnReader.sample_by_campanha. Devolve a amostra, o total de linhas e o
+    # tamanho de cada campanha com o erro padrão: exatos se o arquivo foi lido até o fim,
+    # senão estimados pela parte lida
+    block_bytes = block_bytes or settings.PREVIEW_BLOCK_BYTES
+    names = pd.read_csv(path, nrows=0).columns.tolist()
+    size = os.path.getsize(path)
+    scanned = {'bytes': 0, 'rows': 0}
+    counts = pd.Series(dtype='int64')
+    buffer = None
+    trim_at = 4 * target_rows
+    with open(path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        n_blocks = max(1, math.ceil((size - data_start) / block_bytes))
+        order = rng.permutation(n_blocks)
+        order = np.concatenate(([0], order[order != 0]))
+        frames = _scan_blocks(f, order, names, block_bytes, data_start, deadline, scanned)
+        for frame in pin_cliente_id(frames):
+            frame['campanha'] = frame['campanha'].astype(object)
+            frame['_chave'] = rng.random(len(frame))
+            counts = counts.add(frame['campanha'].value_counts(dropna=False), fill_value=0)
+            buffer = frame if buffer is None else pd.concat([buffer, frame], ignore_index=True)
+            if len(buffer) > trim_at:
+                buffer = _smallest_keys(buffer, target_rows)
+                trim_at = max(trim_at, 2 * len(buffer))
+    if not scanned['rows']:
+        raise InvalidTransacoes("Arquivo de transações vazio")
+
+    complete = scanned['bytes'] >= size - data_start
+    total_rows = scanned['rows'] if complete else (size - data_start) * scanned['rows'] / scanned['bytes']
+    share = counts / scanned['rows']
+    wanted = np.maximum(target_rows * share, min_rows).round()
+    sample = _smallest_keys(buffer, wanted)
+    sample = sample.drop(columns='_chave').reset_index(drop=True)
+    sample['campanha'] = sample['campanha'].astype('category')
+
+    # Linhas sem campanha entram na amostra, mas não são um estrato das campanhas
+    named = share[share.index.notna()]
+    strata_sizes = named * total_rows
+    if complete:
+        strata_sizes_se = pd.Series(0.0, index=named.index)
+    else:
+        strata_sizes_se = total_rows * np.sqrt(named * (1 - named) / scanned['rows'])
+    return sample, total_rows, strata_sizes, strata_sizes_se
+
+
+def _distinct_estimate(counts, ratio):
+    # Clientes distintos na população a partir de quantas vezes cada um apareceu na amostra
+    # (cada linha amostrada com probabilidade q = 1/ratio). Estimativa pelos momentos:
+    # sum(C(c, 2)) / q² estima os pares de transações do mesmo cliente na população e,
+    # supondo 1 + Poisson(lam) transações por cliente, isso dá lam e N / (1 + lam)
+    # clientes. Limites: os clientes vistos e ratio clientes por cliente visto uma única vez
+    seen = len(counts)
+    singletons = int((counts == 1).sum())
+    rows = ratio * counts.sum()
+    pairs = (counts * (counts - 1) / 2).sum() * ratio ** 2 / rows
+    lam = (2 * pairs - 2 + math.sqrt((2 - 2 * pairs) ** 2 + 8 * pairs)) / 2
+    upper = ratio * singletons + seen - singletons
+    return {
+        'estimate': min(max(rows / (1 + lam), seen), upper),
+        'lower': seen,
+        'upper': upper,
+    }
+
+
+class SampleAggregates:
+    """Agregados estimados de uma amostra de transações, ponderados por campanha.
+
+    Mesma interface de ingest.TransactionAggregates usada por
+    analysis.analyze_aggregates. ``strata_sizes`` tem o número de transações de
+    cada campanha e ``strata_sizes_se`` o erro padrão dele (zero quando é exato).
+    """
+
+    def __init__(self, sample, total_rows, rng, strata_sizes, strata_sizes_se=None):
+        self.sample = aggregate_chunks([sample])
+        self.rows = len(sample)
+        self.total_rows = total_rows
+        self.clv = self.sample.clv
+        self.rng = rng
+
+        campanhas = self.sample.campanhas
+        n = campanhas['transacoes'].astype('float64')
+        self.strata_sizes = strata_sizes.astype('float64').reindex(n.index)
+        if strata_sizes_se is None:
+            self.strata_sizes_se = pd.Series(0.0, index=n.index)
+        else:
+            self.strata_sizes_se = strata_sizes_se.astype('float64').reindex(n.index)
+        self.weights = self.strata_sizes / n
+
+        # Vezes que cada cliente aparece na amostra, no total e em cada campanha
+        campanha = sample['campanha'].astype(object)
+        self.clientes_counts = sample.groupby('cliente_id').size()
+        per_campanha = pd.DataFrame({'campanha': campanha, 'cliente_id': sample['cliente_id']}).value_counts()
+        self.campanha_clientes = {
+            name: _distinct_estimate(counts.to_numpy(), self.weights[name])
+            for name, counts in per_campanha.groupby(level=0)
+        }
+
+    def clientes_frame(self):
+        # No máximo PREVIEW_CLUSTER_CLIENTES clientes, sempre com os de maior gasto da amostra
+        # (a lista de alto valor da análise sai deles, ver analysis.HIGH_VALUE_LIMIT)
+        clientes = self.sample.clientes_frame()
+        if len(clientes) > settings.PREVIEW_CLUSTER_CLIENTES:
+            keep = np.zeros(len(clientes), dtype=bool)
+            keep[self.rng.choice(len(clientes), size=settings.PREVIEW_CLUSTER_CLIENTES, replace=False)] = True
+            keep[np.argsort(-clientes['total_gasto'].to_numpy(), kind='stable')[:HIGH_VALUE_LIMIT]] = True
+            clientes = clientes[keep]
+        return clientes.reset_index(drop=True)
+
+    def campanhas_frame(self):
+        campanhas = self.sample.campanhas_frame().set_index('campanha')
+        weights = self.weights.reindex(campanhas.index)
+        for column in ('valor_compra', 'frequencia_compras', 'total_gasto', 'total_gasto_sq'):
+            campanhas[column] = campanhas[column] * weights
+        campanhas['transacoes'] = self.strata_sizes.reindex(campanhas.index)
+        campanhas['cliente_id'] = [self.campanha_clientes[name]['estimate'] for name in campanhas.index]
+        return campanhas.reset_index()
+
+    def campaign_errors(self):
+        # Erro padrão do total gasto de cada campanha: variância dentro do estrato (com a
+        # correção de população finita) e, sem os tamanhos exatos, a incerteza do tamanho
+        campanhas = self.sample.campanhas
+        n = campanhas['transacoes'].astype('float64')
+        size = self.strata_sizes
+        mean = campanhas['total_gasto'] / n
+        variance = ((campanhas['total_gasto_sq'] - campanhas['total_gasto'] ** 2 / n) / (n - 1).clip(lower=1)).clip(lower=0)
+        fpc = (1 - n / size).clip(lower=0)
+        total_se = np.sqrt(size ** 2 * variance / n * fpc + (mean * self.strata_sizes_se) ** 2)
+        return {
+            name: {
+                'transacoes_se': float(self.strata_sizes_se[name]),
+                'total_gasto_se': float(total_se[name]),
+                'amostra': int(n[name]),
+            }
+            for name in campanhas.index
+        }
+
+    def clientes_estimate(self):
+        return _distinct_estimate(self.clientes_counts.to_numpy(), self.total_rows / max(1, self.rows))
+
+
+def clv_estimates(values, quantile, total):
+    # Intervalo do quantil pelas estatísticas de ordem da amostra (sem supor a distribuição)
+    # e histograma escalado para o total estimado de clientes, com o erro de cada barra
+    values = np.sort(np.asarray(values, dtype='float64'))
+    n = len(values)
+    spread = Z_95 * math.sqrt(n * quantile * (1 - quantile))
+    lower = values[max(0, math.floor(n * quantile - spread))]
+    upper = values[min(n - 1, math.ceil(n * quantile + spread))]
+    counts, edges = np.histogram(values, bins=CLV_BINS)
+    share = counts / n
+    return {
+        'threshold': {'lower': float(lower), 'upper': float(upper), 'confidence': 0.95},
+        'histogram': {
+            'edges': edges.tolist(),
+            'counts': (share * total).round().tolist(),
+            'se': (total * np.sqrt(share * (1 - share) / n)).round().tolist(),
+        },
+    }
+
+
+def cluster_errors(clientes):
+    # Proporção de cada cluster e erro padrão das médias, sobre os clientes amostrados
+    n = len(clientes)
+    errors = []
+    for cluster, group in clientes.groupby('cluster'):
+        share = len(group) / n
+        sem = group[['frequencia_compras', 'total_gasto', 'ultima_compra']].sem().fillna(0)
+        errors.append({
+            'cluster': int(cluster),
+            'amostra': len(group),
+            'proporcao': share,
+            'proporcao_se': math.sqrt(share * (1 - share) / n),
+            'frequencia_se': float(sem['frequencia_compras']),
+            'gasto_se': float(sem['total_gasto']),
+            'ultima_compra_se': float(sem['ultima_compra']),
+        })
+    return errors
+
+
+def _exact(results, source, started, seconds):
+    # Entrada pequena: a amostra seria o arquivo inteiro, então a prévia já é o resultado exato
+    results['preview'] = {
+        'exact': True,
+        'source': source,
+        'time_budget': seconds,
+        'seconds': time.perf_counter() - started,
+    }
+    return results
+
+
+def run_preview(transacoes_path, campanhas_path, params=AnalysisParams(), dataset_id=None, seconds=None,
+                progress=_no_progress):
+    # Executado no pool de workers. O prazo limita a leitura da amostra (a parte mais cara);
+    # as demais etapas trabalham sobre um número limitado de linhas e clientes
+    started = time.perf_counter()
+    seconds = seconds or settings.PREVIEW_SECONDS
+    target = settings.PREVIEW_SAMPLE_ROWS
+    # Sementes derivadas do conteúdo: o mesmo arquivo dá a mesma prévia
+    rng = np.random.default_rng(int(dataset_id[:16], 16) if dataset_id else None)
+
+    if dataset_id is not None and dataset_store.exists(dataset_id):
+        source = 'dataset'
+        total_rows = dataset_store.info(dataset_id)['rows']
+        if total_rows <= target:
+            return _exact(run_dataset_analysis(dataset_id, campanhas_path, params, progress), source, started, seconds)
+    else:
+        source = 'csv'
+        if estimate_rows(transacoes_path) <= target:
+            results = run_analysis(transacoes_path, campanhas_path, params, dataset_id, progress)
+            return _exact(results, source, started, seconds)
+
+    clock = StageClock(progress)
+    clock('load')
+    if source == 'dataset':
+        sample, strata_sizes = dataset_store.sample_by_campanha(
+            dataset_id, target, settings.PREVIEW_STRATUM_MIN_ROWS, rng)
+        strata_sizes_se = None
+    else:
+        deadline = started + seconds * settings.PREVIEW_LOAD_SHARE
+        sample, total_rows, strata_sizes, strata_sizes_se = sample_csv(
+            transacoes_path, target, settings.PREVIEW_STRATUM_MIN_ROWS, deadline, rng)
+
+    agregados = SampleAggregates(sample, total_rows, rng, strata_sizes, strata_sizes_se)
+    results = analyze_aggregates(agregados, campanhas_path, params, clock)
+
+    clientes = agregados.clientes_estimate()
+    campaign_errors = agregados.campaign_errors()
+    campaigns = []
+    for campaign in results['campaigns']:
+        errors = campaign_errors.get(campaign['campanha'], {})
+        total_se = errors.get('total_gasto_se', 0.0)
+        distinct = agregados.campanha_clientes.get(campaign['campanha'])
+        campaigns.append(dict(
+            campanha=campaign['campanha'],
+            amostra=errors.get('amostra', 0),
+            transacoes_se=errors.get('transacoes_se', 0.0),
+            total_gasto_se=total_se,
+            roi_estimado_se=campaign['roi_estimado'] * total_se / campaign['total_gasto'] if campaign['total_gasto'] else None,
+            clientes_min=distinct['lower'] if distinct else None,
+            clientes_max=distinct['upper'] if distinct else None,
+        ))
+    elapsed = time.perf_counter() - started
+    results['preview'] = {
+        'exact': False,
+        'source': source,
+        'rows_total': int(round(total_rows)),
+        'rows_sampled': agregados.rows,
+        'fraction': agregados.rows / total_rows,
+        'clientes_amostra': len(agregados.clientes_counts),
+        'clientes_clusterizados': len(results['clientes']),
+        'clientes_estimados': clientes,
+        'clv': clv_estimates(agregados.clv['total_gasto'], params.clv_quantile, clientes['estimate']),
+        'campaigns': campaigns,
+        'clusters': cluster_errors(results['clientes']),
+        'time_budget': seconds,
+        'seconds': elapsed,
+        'within_budget': elapsed <= seconds,
+    }
+    results['timings'] = clock.finish(rows=agregados.rows)
+    return results
@@ -0,0 +1,149 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import settings
+
+_MODEL_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+_VERSION_FILE = re.compile(r'^v(\d+)\.json$')
+
+
+class ModelNotFound(Exception):
+    pass
+
+
+class InvalidModelName(ValueError):
+    pass
+
+
+def check_model_name(name):
+    if not _MODEL_NAME.match(name or ''):
+        raise InvalidModelName("Nome de modelo inválido (use letras, números, '_' ou '-')")
+    return name
+
+
+class ModelRegistry:
+    """Registro local e versionado dos modelos da análise.
+
+    Cada versão de um modelo é um pacote (scaler + clusterização, PCA e regressão)
+    gravado com joblib em ``<root>/<nome>/v<N>.joblib``, com os metadados em
+    ``v<N>.json`` ao lado; o conjunto dos JSON forma o índice. Versões nunca são
+    sobrescritas: a reserva do número é feita criando o JSON com O_EXCL, o que
+    dispensa locks entre os processos do pool. Os pacotes carregados ficam em um
+    LRU em memória, por processo.
+    """
+
+    def __init__(self, root, cache_size=8):
+        self.root = root
+        self.cache_size = cache_size
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _model_dir(self, name):
+        return os.path.join(self.root, check_model_name(name))
+
+    def _read_metadata(self, path):
+        try:
+            with open(path) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Versões ainda sendo gravadas ficam de fora
+        return metadata if metadata.get('status') == 'ready' else None
+
+    def versions(self, name):
+        model_dir = self._model_dir(name)
+        try:
+            entries = os.listdir(model_dir)
+        except FileNotFoundError:
+            return []
+        versions = []
+        for entry in entries:
+            if _VERSION_FILE.match(entry):
+                metadata = self._read_metadata(os.path.join(model_dir, entry))
+                if metadata is not None:
+                    versions.append(metadata)
+        return sorted(versions, key=lambda metadata: metadata['version'])
+
+    def models(self):
+        try:
+            names = sorted(os.listdir(self.root))
+        except FileNotFoundError:
+            return {}
+        index = {}
+        for name in names:
+            if _MODEL_NAME.match(name):
+                versions = self.versions(name)
+                if versions:
+                    index[name] = versions
+        return index
+
+    def resolve(self, name, version=None):
+        # Sem versão explícita usa a mais recente; devolve o número da versão
+        versions = [metadata['version'] for metadata in self.versions(name)]
+        if not versions:
+            raise ModelNotFound(f"Modelo não encontrado: {name}")
+        if version is None:
+            return versions[-1]
+        if version not in versions:
+            raise ModelNotFound(f"Versão {version} do modelo {name} não encontrada")
+        return version
+
+    def load(self, name, version):
+        key = (name, version)
+        with self._lock:
+            bundle = self._loaded.get(key)
+            if bundle is not None:
+                self._loaded.move_to_end(key)
+                return bundle
+        import joblib
+
+        try:
+            bundle = joblib.load(os.path.join(self._model_dir(name), f"v{version}.joblib"))
+        except FileNotFoundError:
+            raise ModelNotFound(f"Versão {version} do modelo {name} não encontrada")
+        with self._lock:
+            self._loaded[key] = bundle
+            while len(self._loaded) > self.cache_size:
+                self._loaded.popitem(last=False)
+        return bundle
+
+    def register(self, name, bundle, metadata=None):
+        import joblib
+
+        model_dir = self._model_dir(name)
+        os.makedirs(model_dir, exist_ok=True)
+
+        # Reserva o próximo número de versão de forma atômica
+        version = max([0] + [int(m.group(1)) for m in map(_VERSION_FILE.match, os.listdir(model_dir)) if m])
+        while True:
+            version += 1
+            metadata_path = os.path.join(model_dir, f"v{version}.json")
+            try:
+                fd = os.open(metadata_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': version, 'status': 'pending'}, f)
+            break
+
+        bundle_path = os.path.join(model_dir, f"v{version}.joblib")
+        joblib.dump(bundle, f"{bundle_path}.tmp")
+        os.replace(f"{bundle_path}.tmp", bundle_path)
+
+        metadata = dict(metadata or {}, name=name, version=version, created_at=time.time(), status='ready')
+        with open(f"{metadata_path}.tmp", 'w') as f:
+            json.dump(metadata, f, default=str)
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+
+        with self._lock:
+            self._loaded[(name, version)] = bundle
+            while len(self._loaded) > self.cache_size:
+                self._loaded.popitem(last=False)
+        return version
+
+
+model_registry = ModelRegistry(settings.MODELS_DIR, settings.MODEL_CACHE_SIZE)
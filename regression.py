@@ -0,0 +1,131 @@
+import numpy as np
+
+# Valores singulares relativos abaixo deste limite são tratados como zero (colinearidade)
+_RCOND = 1e-10
+
+
+class RegressionStats:
+    """Estatísticas suficientes de uma regressão linear com intercepto.
+
+    Guarda apenas o número de observações, as médias e as somas de produtos
+    centrados (X'X e X'y em torno da média): o tamanho não depende do número de
+    linhas. Dois conjuntos se combinam com ``merge`` (fórmula de Chan), o que
+    permite acumular bloco a bloco ou por grupo.
+    """
+
+    def __init__(self, n_features):
+        self.n = 0.0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.sxx = np.zeros((n_features, n_features))
+        self.sxy = np.zeros(n_features)
+        self.syy = 0.0
+
+    @classmethod
+    def from_groups(cls, X, n, sum_y, sum_y2):
+        # Grupos com X constante (ex.: uma campanha): n linhas, soma e soma dos quadrados de y
+        X = np.asarray(X, dtype='float64')
+        n = np.asarray(n, dtype='float64')
+        sum_y = np.asarray(sum_y, dtype='float64')
+        sum_y2 = np.asarray(sum_y2, dtype='float64')
+        stats = cls(X.shape[1])
+        stats.n = n.sum()
+        if not stats.n:
+            return stats
+        stats.mean_x = n @ X / stats.n
+        stats.mean_y = sum_y.sum() / stats.n
+        dx = X - stats.mean_x
+        stats.sxx = (dx * n[:, None]).T @ dx
+        stats.sxy = dx.T @ (sum_y - n * stats.mean_y)
+        # Variação dentro de cada grupo + entre os grupos
+        within = np.clip(sum_y2 - sum_y ** 2 / np.where(n > 0, n, 1), 0, None).sum()
+        between = (n * (sum_y / np.where(n > 0, n, 1) - stats.mean_y) ** 2).sum()
+        stats.syy = within + between
+        return stats
+
+    @classmethod
+    def from_rows(cls, X, y):
+        X = np.asarray(X, dtype='float64')
+        y = np.asarray(y, dtype='float64')
+        stats = cls(X.shape[1])
+        stats.n = float(len(y))
+        if not len(y):
+            return stats
+        stats.mean_x = X.mean(axis=0)
+        stats.mean_y = y.mean()
+        dx = X - stats.mean_x
+        dy = y - stats.mean_y
+        stats.sxx = dx.T @ dx
+        stats.sxy = dx.T @ dy
+        stats.syy = dy @ dy
+        return stats
+
+    def merge(self, other):
+        if not other.n:
+            return self
+        if not self.n:
+            self.__dict__.update({key: np.copy(value) for key, value in other.__dict__.items()})
+            return self
+        n = self.n + other.n
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        weight = self.n * other.n / n
+        self.sxx = self.sxx + other.sxx + np.outer(dx, dx) * weight
+        self.sxy = self.sxy + other.sxy + dx * dy * weight
+        self.syy = self.syy + other.syy + dy * dy * weight
+        self.mean_x = self.mean_x + dx * other.n / n
+        self.mean_y = self.mean_y + dy * other.n / n
+        self.n = n
+        return self
+
+
+class LinearModel:
+    """Mínimos quadrados com intercepto ajustados a partir de ``RegressionStats``.
+
+    Mesmos coeficientes da LinearRegression do scikit-learn com os dados linha a
+    linha (interface compatível: ``coef_``, ``intercept_`` e ``predict``). As
+    variáveis são padronizadas antes da pseudo-inversa, para que escalas muito
+    diferentes (custo em reais, conversão em fração) não degradem a solução.
+    Com colinearidade (ex.: até 3 campanhas para 3 variáveis e o intercepto) há
+    infinitas soluções; a da variável padronizada é projetada para a de norma
+    mínima nas escalas originais, a mesma do scikit-learn (``rank_`` indica o caso).
+    """
+
+    def __init__(self):
+        self.coef_ = None
+        self.intercept_ = None
+        self.stderr_ = None
+        self.intercept_stderr_ = None
+        self.n_samples_ = 0
+        self.rank_ = 0
+
+    def fit_stats(self, stats):
+        scale = np.sqrt(np.diag(stats.sxx))
+        scale[scale == 0] = 1.0
+        corr = stats.sxx / np.outer(scale, scale)
+        corr_pinv = np.linalg.pinv(corr, rcond=_RCOND, hermitian=True)
+        self.coef_ = corr_pinv @ (stats.sxy / scale) / scale
+        self.n_samples_ = int(stats.n)
+        eigenvalues, eigenvectors = np.linalg.eigh(corr)
+        null = eigenvalues <= _RCOND * max(1.0, np.abs(eigenvalues).max())
+        self.rank_ = int((~null).sum())
+        if null.any():
+            # Direções em que os dados não determinam os coeficientes, nas escalas originais:
+            # sem a componente nelas, a solução é a de norma mínima (a do lstsq linha a linha)
+            basis, _ = np.linalg.qr(eigenvectors[:, null] / scale[:, None])
+            self.coef_ = self.coef_ - basis @ (basis.T @ self.coef_)
+        self.intercept_ = stats.mean_y - stats.mean_x @ self.coef_
+
+        # Erros padrão (MQO clássico): variância residual sobre os graus de liberdade
+        # (indefinidos quando há colinearidade: os coeficientes não são identificáveis)
+        dof = stats.n - self.rank_ - 1
+        if dof > 0 and self.rank_ == len(self.coef_):
+            rss = max(stats.syy - self.coef_ @ stats.sxy, 0.0)
+            sigma2 = rss / dof
+            cov = sigma2 * corr_pinv / np.outer(scale, scale)
+            self.stderr_ = np.sqrt(np.clip(np.diag(cov), 0, None))
+            self.intercept_stderr_ = float(np.sqrt(max(sigma2 / stats.n + stats.mean_x @ cov @ stats.mean_x, 0.0)))
+        return self
+
+    def predict(self, X):
+        return np.asarray(X, dtype='float64') @ self.coef_ + self.intercept_
@@ -0,0 +1,79 @@
+import io
+import json
+import math
+
+# Formatos de saída das tabelas grandes (ex.: clientes com cluster e PCA)
+TABLE_FORMATS = {
+    'json': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+def _finite(value):
+    # NaN e infinitos viram null (ex.: ROI de uma campanha ausente do CSV de campanhas);
+    # escalares e arrays do numpy/pandas viram tipos do Python (sem importar o numpy)
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if hasattr(value, 'tolist'):
+        return _finite(value.tolist())
+    return value
+
+
+def dumps(obj):
+    # JSON compacto (sem espaços) em bytes, sempre válido (allow_nan=False)
+    return json.dumps(_finite(obj), separators=(',', ':'), ensure_ascii=False, allow_nan=False).encode()
+
+
+def results_summary(results, charts=None, links=None):
+    # Estrutura pública dos resultados: tudo menos as tabelas grandes e os bytes dos gráficos
+    summary = {
+        'clientes': results['clientes_count'],
+        'history': results['history'],
+        'dataset': results['dataset'],
+        'clustering': results['clustering'],
+        'model': results['model'],
+        'cluster_info': results['cluster_info'],
+        'campaigns': results['campaigns'],
+        'regression_info': results['regression_info'],
+        'clv_threshold': results['clv_threshold'],
+        'high_value_clients': results['high_value_clients'],
+        'recommendations': results['recommendations'],
+        # Estimativas e margens de erro da prévia aproximada (ausente na análise exata)
+        'preview': results.get('preview'),
+    }
+    if charts is not None:
+        summary['charts'] = charts
+    if links is not None:
+        summary['links'] = links
+    return summary
+
+
+def encode_table(frame, fmt):
+    if fmt == 'json':
+        return frame.to_json(orient='records').encode()
+    if fmt not in TABLE_FORMATS:
+        raise UnsupportedFormat(f"Formato de tabela desconhecido: {fmt}")
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        # pyarrow é opcional: só é necessário para Arrow IPC e Parquet
+        raise UnsupportedFormat(f"O formato {fmt} requer o pacote pyarrow")
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = io.BytesIO()
+    if fmt == 'arrow':
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    return sink.getvalue()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+
+# Configuração lida das variáveis de ambiente (Vercel / execução local)
+
+# Executor da análise: "process" (usa vários núcleos) ou "thread". Na Vercel (variável VERCEL)
+# o padrão é "thread": o runtime não tem semáforos POSIX (/dev/shm), exigidos pelos processos
+ANALYSIS_EXECUTOR = os.environ.get("ANALYSIS_EXECUTOR") or ("thread" if os.environ.get("VERCEL") else "process")
+# Número de workers do pool de análise
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", os.cpu_count() or 1))
+# Quantas análises podem aguardar na fila além das que já estão executando
+ANALYSIS_MAX_QUEUE = int(os.environ.get("ANALYSIS_MAX_QUEUE", 4))
+# Segundos sugeridos ao cliente (Retry-After) quando o pool está saturado
+ANALYSIS_RETRY_AFTER = int(os.environ.get("ANALYSIS_RETRY_AFTER", 30))
+# Método de criação dos processos; "spawn" evita herdar threads do servidor
+ANALYSIS_START_METHOD = os.environ.get("ANALYSIS_START_METHOD", "spawn")
+
+
+def _available_memory():
+    # Memória física ou o limite do cgroup (contêineres), o que for menor
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        total = 8 * 1024 * 1024 * 1024
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            total = min(total, int(f.read()))
+    except (OSError, ValueError):
+        pass
+    return total
+
+
+# Orçamento de memória das análises executando ao mesmo tempo (bytes; padrão: metade da
+# memória disponível). A memória de cada análise é estimada pelo tamanho da entrada:
+# ANALYSIS_MEMORY_BASE + ANALYSIS_MEMORY_FACTOR * bytes do CSV (ver worker_pool.py)
+ANALYSIS_MEMORY_BUDGET = int(os.environ.get("ANALYSIS_MEMORY_BUDGET") or _available_memory() // 2)
+ANALYSIS_MEMORY_BASE = int(os.environ.get("ANALYSIS_MEMORY_BASE", 64 * 1024 * 1024))
+ANALYSIS_MEMORY_FACTOR = float(os.environ.get("ANALYSIS_MEMORY_FACTOR", 4))
+# Limite de memória de cada worker (bytes, 0 desativa; só no executor "process", Linux):
+# acima dele a análise falha com MemoryError em vez de o worker ser morto pelo sistema
+ANALYSIS_WORKER_MEMORY_LIMIT = int(os.environ.get("ANALYSIS_WORKER_MEMORY_LIMIT", 0))
+# Análises (executando ou na fila) por cliente; acima disso o pedido recebe HTTP 429 (0 = sem limite)
+ANALYSIS_CLIENT_MAX_ACTIVE = int(os.environ.get("ANALYSIS_CLIENT_MAX_ACTIVE", 2))
+# Cabeçalho que identifica o cliente (time); sem ele, vale o IP de origem
+ANALYSIS_CLIENT_HEADER = os.environ.get("ANALYSIS_CLIENT_HEADER", "X-Client-Id")
+# Entradas até este tamanho em pedidos síncronos têm prioridade sobre jobs e uploads maiores
+ANALYSIS_INTERACTIVE_MAX_BYTES = int(os.environ.get("ANALYSIS_INTERACTIVE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Backend do armazenamento de jobs assíncronos (POST /jobs); só "memory" por enquanto
+JOBS_BACKEND = os.environ.get("JOBS_BACKEND", "memory")
+# Tempo (segundos) que um job concluído continua disponível para consulta
+JOBS_TTL = int(os.environ.get("JOBS_TTL", 3600))
+# Jobs mantidos em memória e resultados de jobs que não couberam no cache de resultados
+JOBS_MAX = int(os.environ.get("JOBS_MAX", 1000))
+JOBS_MAX_RESULTS = int(os.environ.get("JOBS_MAX_RESULTS", 4))
+
+# Diretório dos arquivos temporários de upload (padrão: diretório temporário do sistema)
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR") or None
+# Tamanho dos blocos lidos do upload ao copiá-lo para disco
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", 1024 * 1024))
+# Linhas de transações processadas por bloco na leitura do CSV
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", 500_000))
+
+# Prévia aproximada (mode=preview): tempo alvo (segundos), parte dele para ler a amostra do CSV,
+# linhas amostradas, mínimo de linhas por campanha, clientes usados na clusterização e blocos do CSV
+PREVIEW_SECONDS = float(os.environ.get("PREVIEW_SECONDS", 5))
+PREVIEW_LOAD_SHARE = float(os.environ.get("PREVIEW_LOAD_SHARE", 0.5))
+PREVIEW_SAMPLE_ROWS = int(os.environ.get("PREVIEW_SAMPLE_ROWS", 100_000))
+PREVIEW_STRATUM_MIN_ROWS = int(os.environ.get("PREVIEW_STRATUM_MIN_ROWS", 2_000))
+PREVIEW_CLUSTER_CLIENTES = int(os.environ.get("PREVIEW_CLUSTER_CLIENTES", 20_000))
+PREVIEW_BLOCK_BYTES = int(os.environ.get("PREVIEW_BLOCK_BYTES", 64 * 1024))
+
+# Cache de resultados por conteúdo dos uploads: limite em memória (bytes, 0 desativa)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Diretório da camada em disco do cache (desativada se vazio) e seu limite em bytes
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR") or None
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Renderização dos gráficos: cache (bytes, por worker) e nº máximo de pontos do
+# gráfico de clusters no formato JSON
+CHART_CACHE_MAX_BYTES = int(os.environ.get("CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CHART_JSON_MAX_POINTS = int(os.environ.get("CHART_JSON_MAX_POINTS", 5000))
+
+# Cabeçalho Server-Timing com a duração de cada estágio da análise em cada resposta
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+# Permite ?profile=1 em qualquer rota (responde com o relatório do profiler); só para depuração
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+
+# Diretório base dos dados persistidos pelo servidor (modelos, agregados etc.)
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.join(tempfile.gettempdir(), "analise-clientes")
+# Registro de modelos versionados (scaler + clusterização, PCA e regressão)
+MODELS_DIR = os.environ.get("MODELS_DIR") or os.path.join(DATA_DIR, "models")
+# Matplotlib (lidos na importação do matplotlib, inclusive nos workers, que herdam o ambiente):
+# backend sem GUI e cache de fontes em um diretório gravável, para não ser reconstruído a cada início
+os.environ.setdefault("MPLBACKEND", "Agg")
+os.environ.setdefault("MPLCONFIGDIR", os.path.join(DATA_DIR, "matplotlib"))
+# Carrega pandas/scikit-learn/matplotlib em segundo plano logo após o servidor iniciar
+# (e aquece os workers), para que a primeira análise não pague as importações
+PRELOAD = os.environ.get("PRELOAD", "1").lower() in ("1", "true", "yes")
+
+# Históricos de transações já agregados (um SQLite por nome), atualizados por lotes
+HISTORY_DIR = os.environ.get("HISTORY_DIR") or os.path.join(DATA_DIR, "history")
+# Transações convertidas para o formato colunar (ver datasets.py), reaproveitadas entre análises
+DATASET_DIR = os.environ.get("DATASET_DIR") or os.path.join(DATA_DIR, "datasets")
+# Converte automaticamente os uploads analisados (o próximo upload idêntico não relê o CSV)
+DATASET_STORE = os.environ.get("DATASET_STORE", "1").lower() in ("1", "true", "yes")
+# Limite em disco dos datasets; acima dele os menos usados são removidos (0 = sem limite)
+DATASET_MAX_BYTES = int(os.environ.get("DATASET_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+# Variantes guardadas por estágio do pipeline em cada dataset (ex.: clusterizações com k diferentes)
+DATASET_STAGE_VARIANTS = int(os.environ.get("DATASET_STAGE_VARIANTS", 8))
+# Tabelas por cliente dos relatórios (SQLite indexado, ver client_index.py) e seu limite em disco
+CLIENT_INDEX_DIR = os.environ.get("CLIENT_INDEX_DIR") or os.path.join(DATA_DIR, "clients")
+CLIENT_INDEX_MAX_BYTES = int(os.environ.get("CLIENT_INDEX_MAX_BYTES", 1024 * 1024 * 1024))
+# Clientes por página em /reports/{id}/clients: padrão e máximo
+CLIENT_PAGE_SIZE = int(os.environ.get("CLIENT_PAGE_SIZE", 50))
+CLIENT_PAGE_MAX = int(os.environ.get("CLIENT_PAGE_MAX", 500))
+# Quantas versões de modelos cada worker mantém carregadas em memória (LRU)
+MODEL_CACHE_SIZE = int(os.environ.get("MODEL_CACHE_SIZE", 8))
+# A partir de quantos clientes o algoritmo "auto" usa MiniBatchKMeans
+CLUSTER_MINIBATCH_THRESHOLD = int(os.environ.get("CLUSTER_MINIBATCH_THRESHOLD", 200_000))
+CLUSTER_BATCH_SIZE = int(os.environ.get("CLUSTER_BATCH_SIZE", 4096))
+# Busca automática de k: intervalo testado e tamanho da amostra usada no silhouette/cotovelo
+CLUSTER_K_MIN = int(os.environ.get("CLUSTER_K_MIN", 2))
+CLUSTER_K_MAX = int(os.environ.get("CLUSTER_K_MAX", 8))
+CLUSTER_K_SAMPLE = int(os.environ.get("CLUSTER_K_SAMPLE", 10_000))
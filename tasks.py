@@ -0,0 +1,35 @@
+"""Pontos de entrada do pipeline executados no pool de workers.
+
+O servidor passa estas funções ao pool em vez das de analysis.py: referenciá-las
+não importa pandas, scikit-learn e matplotlib no processo do servidor. O
+pipeline é importado no worker, na primeira chamada (ou já na criação do worker,
+com settings.PRELOAD).
+"""
+
+# Módulos importados pelos workers ao serem criados (ver WorkerPool.warm)
+PIPELINE_MODULES = ('analysis', 'preview')
+
+
+def run_analysis(*args, **kwargs):
+    from analysis import run_analysis
+    return run_analysis(*args, **kwargs)
+
+
+def run_dataset_analysis(*args, **kwargs):
+    from analysis import run_dataset_analysis
+    return run_dataset_analysis(*args, **kwargs)
+
+
+def run_history_analysis(*args, **kwargs):
+    from analysis import run_history_analysis
+    return run_history_analysis(*args, **kwargs)
+
+
+def run_preview(*args, **kwargs):
+    from preview import run_preview
+    return run_preview(*args, **kwargs)
+
+
+def build_client_index(*args, **kwargs):
+    from client_index import client_index
+    return client_index.build(*args, **kwargs)
@@ -0,0 +1,35 @@
+class Template:
+    """Template HTML compilado uma única vez.
+
+    ``slots`` mapeia cada nome para um par (trecho original, trecho novo), onde o
+    trecho novo marca com ``{}`` o ponto de inserção do valor. O HTML é dividido
+    nesses pontos na construção, e ``render`` monta a página com um único join,
+    sem as cópias repetidas de vários ``str.replace`` encadeados.
+    """
+
+    def __init__(self, source, slots):
+        located = []
+        for name, (original, replacement) in slots.items():
+            if source.count(original) != 1:
+                raise ValueError(f"Trecho do slot '{name}' deve aparecer exatamente uma vez no template")
+            before, after = replacement.split('{}')
+            located.append((source.index(original), len(original), name, before, after))
+        located.sort()
+
+        self._static = []
+        self._names = []
+        position = 0
+        suffix = ''
+        for index, length, name, before, after in located:
+            self._static.append(suffix + source[position:index] + before)
+            self._names.append(name)
+            position = index + length
+            suffix = after
+        self._static.append(suffix + source[position:])
+
+    def render(self, **values):
+        parts = [self._static[0]]
+        for name, static in zip(self._names, self._static[1:]):
+            parts.append(values.get(name, ''))
+            parts.append(static)
+        return ''.join(parts)
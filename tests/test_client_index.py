@@ -0,0 +1,106 @@
+"""Consultas paginadas do ClientIndex (/reports/{id}/clients) sobre uma tabela pequena."""
+import os
+
+import pandas as pd
+import pytest
+
+from client_index import ClientIndex, InvalidClientQuery, ReportNotIndexed
+
+REPORT = 'a' * 64
+CLV_THRESHOLD = 500.0
+
+CLIENTES = pd.DataFrame({
+    'cliente_id': [101, 102, 103, 104, 105, 106],
+    'cluster': [0, 1, 0, 1, 0, 1],
+    'segmento': pd.Categorical(['Demais', 'Alto Valor', 'Alto Valor', 'Demais', 'Demais', 'Alto Valor']),
+    'total_gasto': [120.5, 900.0, 500.0, 499.99, 120.5, 1500.25],
+    'frequencia_compras': [3, 10, 7, 6, 2, 15],
+    'ultima_compra': [40, 5, 12, 30, 200, 1],
+    'pca1': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+    'pca2': [-0.1, -0.2, -0.3, -0.4, -0.5, -0.6],
+})
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ClientIndex(str(tmp_path))
+    info = index.build(REPORT, CLIENTES, CLV_THRESHOLD)
+    assert info['clientes'] == len(CLIENTES)
+    return index
+
+
+def _ids(rows):
+    return [row['cliente_id'] for row in rows]
+
+
+def test_rows_keep_the_analysis_values(index):
+    total, rows = index.query(REPORT, sort='cliente_id')
+    assert total == 6
+    assert rows[0] == {
+        'cliente_id': 101, 'cluster': 0, 'segmento': 'Demais', 'total_gasto': 120.5,
+        'frequencia_compras': 3, 'ultima_compra': 40, 'pca1': 0.1, 'pca2': -0.1,
+    }
+
+
+def test_filters(index):
+    assert _ids(index.query(REPORT, cluster=1, sort='cliente_id')[1]) == [102, 104, 106]
+    assert _ids(index.query(REPORT, min_gasto=120.5, max_gasto=500.0, sort='cliente_id')[1]) == [101, 103, 104, 105]
+    total, rows = index.query(REPORT, cluster=0, min_gasto=200.0)
+    assert (total, _ids(rows)) == (1, [103])
+
+
+def test_segmento_uses_the_clv_threshold(index):
+    # "Alto Valor" a partir do limiar, inclusive (500.0 entra, 499.99 não)
+    total, rows = index.query(REPORT, segmento='Alto Valor', sort='cliente_id')
+    assert (total, _ids(rows)) == (3, [102, 103, 106])
+    assert _ids(index.query(REPORT, segmento='Demais', sort='cliente_id')[1]) == [101, 104, 105]
+    assert _ids(index.query(REPORT, segmento='Demais', cluster=1)[1]) == [104]
+    with pytest.raises(InvalidClientQuery):
+        index.query(REPORT, segmento='Baixo Valor')
+
+
+def test_sort_direction(index):
+    # Empates (101 e 105 com o mesmo gasto) seguem a ordem de inserção, invertida na ordem decrescente
+    assert _ids(index.query(REPORT, sort='total_gasto')[1]) == [101, 105, 104, 103, 102, 106]
+    assert _ids(index.query(REPORT, sort='-total_gasto')[1]) == [106, 102, 103, 104, 105, 101]
+    assert _ids(index.query(REPORT, sort='-ultima_compra')[1]) == [105, 101, 104, 103, 102, 106]
+    assert _ids(index.query(REPORT)[1])[0] == 106
+    for sort in ('pca1', '-segmento', '--total_gasto'):
+        with pytest.raises(InvalidClientQuery):
+            index.query(REPORT, sort=sort)
+
+
+def test_pagination(index):
+    pages = [index.query(REPORT, sort='cliente_id', page=page, page_size=4) for page in (1, 2, 3)]
+    assert [total for total, _ in pages] == [6, 6, 6]
+    assert [_ids(rows) for _, rows in pages] == [[101, 102, 103, 104], [105, 106], []]
+    total, rows = index.query(REPORT, cluster=1, sort='-total_gasto', page=2, page_size=2)
+    assert (total, _ids(rows)) == (3, [104])
+
+
+def test_unknown_report(index):
+    with pytest.raises(ReportNotIndexed):
+        index.query('b' * 64)
+    with pytest.raises(ReportNotIndexed):
+        index.query('../x')
+    assert index.exists(REPORT)
+    assert not index.exists('b' * 64)
+
+
+def test_eviction_keeps_the_recently_queried(tmp_path):
+    reports = ['1' * 64, '2' * 64, '3' * 64]
+    index = ClientIndex(str(tmp_path))
+    sizes = [index.build(report, CLIENTES, CLV_THRESHOLD)['bytes'] for report in reports]
+    for age, report in enumerate(reports):
+        os.utime(os.path.join(str(tmp_path), f"{report}.sqlite"), (1000 + age, 1000 + age))
+    # A consulta atualiza o mtime: o primeiro relatório passa a ser o mais recente
+    index.query(reports[0])
+
+    index.max_bytes = sum(sizes) - 1
+    index.evict()
+    assert [index.exists(report) for report in reports] == [True, False, True]
+
+    # O relatório recém-construído nunca é removido, mesmo sozinho acima do limite
+    index.max_bytes = 1
+    index.build(reports[1], CLIENTES, CLV_THRESHOLD)
+    assert [index.exists(report) for report in reports] == [False, True, False]
@@ -0,0 +1,33 @@
+"""Clusterização: n_clusters inválido para os dados e o algoritmo dos modelos registrados."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import fit_clientes
+from clustering import CLUSTER_FEATURES, ClusteringError, ClusteringModel
+from params import AnalysisParams
+from pipeline_cache import StageCache
+
+
+def _clientes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.normal(size=(n, len(CLUSTER_FEATURES))), columns=CLUSTER_FEATURES)
+
+
+def test_more_clusters_than_clients():
+    with pytest.raises(ClusteringError, match='n_clusters=3'):
+        ClusteringModel(3).fit(_clientes(2))
+    _, labels = ClusteringModel(3).fit(_clientes(3))
+    assert sorted(labels) == [0, 1, 2]
+
+
+def test_registered_model_with_auto_can_be_updated():
+    model, *_ = fit_clientes(_clientes(50), AnalysisParams(model_name='modelo'), StageCache())
+    assert model.describe()['algorithm'] == 'minibatch'
+    model.partial_fit(_clientes(2, seed=1))
+
+    # Sem registro, "auto" continua escolhendo pelo número de clientes
+    model, *_ = fit_clientes(_clientes(50), AnalysisParams(), StageCache())
+    assert model.describe()['algorithm'] == 'kmeans'
+    with pytest.raises(ClusteringError):
+        model.partial_fit(_clientes(2, seed=1))
@@ -0,0 +1,32 @@
+"""Conversão de transações para o formato colunar (DatasetStore.convert)."""
+import hashlib
+
+import pytest
+
+import settings
+from datasets import DatasetStore
+from params import InvalidTransacoes
+
+HEADER = "cliente_id,frequencia_compras,total_gasto,ultima_compra,campanha,valor_compra\n"
+
+
+def _convert(tmp_path, rows):
+    path = tmp_path / 'transacoes.csv'
+    path.write_text(HEADER + rows)
+    store = DatasetStore(str(tmp_path / 'datasets'))
+    return store, store.convert(str(path), hashlib.sha256(path.read_bytes()).hexdigest())
+
+
+def test_convert(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'INGEST_CHUNK_ROWS', 2)
+    store, meta = _convert(tmp_path, "1,2,10.5,3,Natal,5.25\n2,1,7.0,9,Verao,7.0\n3,4,99.99,1,Natal,1.01\n")
+    assert meta['created'] and meta['rows'] == 3
+    assert [entry['id'] for entry in store.datasets()] == [meta['id']]
+
+
+def test_mixed_cliente_id_types_are_invalid_input(tmp_path, monkeypatch):
+    # O segundo bloco tem um id ausente: o pandas lê cliente_id como float, o primeiro como inteiro
+    monkeypatch.setattr(settings, 'INGEST_CHUNK_ROWS', 2)
+    with pytest.raises(InvalidTransacoes, match='cliente_id'):
+        _convert(tmp_path, "1,2,10.5,3,Natal,5.25\n2,1,7.0,9,Verao,7.0\n,4,99.99,1,Natal,1.01\n")
+    assert DatasetStore(str(tmp_path / 'datasets')).datasets() == []
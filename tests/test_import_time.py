@@ -0,0 +1,18 @@
+"""A importação do servidor não carrega o pipeline (ver benchmarks/import_time.py)."""
+import os
+import statistics
+
+from benchmarks.import_time import measure_once
+
+# Mesmo limite padrão do benchmark (--max-seconds)
+MAX_SECONDS = float(os.environ.get('IMPORT_TIME_MAX_SECONDS', '0.5'))
+
+
+def test_import_main_skips_heavy_modules():
+    loaded = measure_once()['loaded']
+    assert not loaded, f"módulos pesados carregados na importação de main: {', '.join(loaded)}"
+
+
+def test_import_main_time():
+    median = statistics.median(measure_once()['seconds'] for _ in range(3))
+    assert median <= MAX_SECONDS, f"import main levou {median:.3f} s (limite {MAX_SECONDS} s)"
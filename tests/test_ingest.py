@@ -0,0 +1,55 @@
+"""Os agregados de ingest não dependem da divisão do CSV em blocos."""
+import io
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from ingest import aggregate_transacoes
+
+CSV = """cliente_id,frequencia_compras,total_gasto,ultima_compra,campanha,valor_compra
+241,12,1138872.94,30,Natal,1999.99
+7,3,120.50,200,Verao,40.17
+241,12,1138872.94,10,Black Friday,350.01
+9,25,537187.91,5,Natal,812.33
+7,4,130.10,180,Natal,9.60
+11,1,406127.13,300,,77.70
+9,25,537187.91,2,Verao,0.01
+12,2,59999.99,90,Black Friday,123.45
+13,8,60000.00,60,Dia das Maes,456.78
+7,4,130.10,170,Verao,12.34
+"""
+
+
+@pytest.fixture
+def transacoes(tmp_path):
+    path = tmp_path / 'transacoes.csv'
+    path.write_text(CSV)
+    return str(path)
+
+
+def _frames(agregados):
+    return {
+        'clientes': agregados.clientes_frame(),
+        'campanhas': agregados.campanhas_frame(),
+        'clv': agregados.clv.sort_values(['cliente_id', 'total_gasto']).reset_index(drop=True),
+    }
+
+
+@pytest.mark.parametrize('chunksize', [1, 7])
+def test_same_result_for_any_chunk_size(transacoes, chunksize):
+    expected = _frames(aggregate_transacoes(transacoes, chunksize=len(CSV.splitlines())))
+    result = _frames(aggregate_transacoes(transacoes, chunksize=chunksize))
+    for name, frame in expected.items():
+        assert_frame_equal(result[name], frame, check_categorical=False, obj=name)
+
+
+def test_money_values_are_exact(transacoes):
+    clientes = aggregate_transacoes(transacoes, chunksize=1).clientes_frame().set_index('cliente_id')
+    assert clientes.loc[241, 'total_gasto'] == 1138872.94
+    assert clientes.loc[9, 'total_gasto'] == 537187.91
+    assert clientes.loc[11, 'total_gasto'] == 406127.13
+
+    expected = pd.read_csv(io.StringIO(CSV)).groupby('campanha')['valor_compra'].sum().round(2)
+    campanhas = aggregate_transacoes(transacoes, chunksize=7).campanhas_frame().set_index('campanha')
+    assert campanhas['valor_compra'].to_dict() == expected.to_dict()
@@ -0,0 +1,27 @@
+"""Validação dos parâmetros da análise, comum ao servidor e à CLI."""
+import math
+
+import pytest
+
+from params import InvalidParams, check_finite, check_quantile, parse_n_clusters
+
+
+def test_parse_n_clusters():
+    assert parse_n_clusters('auto') == (3, True)
+    assert parse_n_clusters('2') == (2, False)
+    assert parse_n_clusters('50') == (50, False)
+    for value in ('1', '51', '-3', '3.0', ''):
+        with pytest.raises(InvalidParams, match='n_clusters'):
+            parse_n_clusters(value)
+
+
+def test_check_finite_and_quantile():
+    assert check_finite('loyal_min_spend', -1.5) == -1.5
+    for value in (math.nan, math.inf):
+        with pytest.raises(InvalidParams, match='loyal_min_spend'):
+            check_finite('loyal_min_spend', value)
+    assert check_quantile('clv_quantile', 0) == 0
+    assert check_quantile('clv_quantile', 1.0) == 1.0
+    for value in (-0.01, 1.5, math.nan):
+        with pytest.raises(InvalidParams, match='clv_quantile'):
+            check_quantile('clv_quantile', value)
@@ -0,0 +1,84 @@
+"""A regressão por estatísticas suficientes dá os coeficientes da LinearRegression do scikit-learn."""
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from regression import LinearModel, RegressionStats
+
+CAMPANHAS = pd.DataFrame({
+    'custo_campanha': [10000.0, 250000.0, 40000.0, 90000.0, 15000.0],
+    'alcance': [5000.0, 80000.0, 20000.0, 30000.0, 9000.0],
+    'conversao': [0.02, 0.05, 0.031, 0.012, 0.044],
+})
+# Mesmas campanhas em escalas parecidas, para comparar com o scikit-learn com X'X singular
+CAMPANHAS_ESCALADAS = CAMPANHAS / [10000.0, 10000.0, 0.01]
+
+
+def _transacoes(n_campanhas, campanhas=CAMPANHAS, seed=0):
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(50, 200, n_campanhas)
+    grupo = np.repeat(np.arange(n_campanhas), sizes)
+    gasto = rng.normal(1000.0 * (grupo + 1), 300.0)
+    return campanhas.to_numpy()[grupo], gasto, grupo
+
+
+def _from_groups(X, y, grupo):
+    # Como em analysis.py: uma linha por campanha, com n, soma e soma dos quadrados do gasto
+    gasto = pd.Series(y).groupby(grupo)
+    X_grupos = pd.DataFrame(X).groupby(grupo).first()
+    return RegressionStats.from_groups(X_grupos, gasto.size(), gasto.sum(), (gasto.apply(lambda g: (g ** 2).sum())))
+
+
+def _minimum_norm(X, y):
+    # Solução de norma mínima dos dados centrados, calculada direto pela pseudo-inversa
+    # (a LinearRegression usa o lstsq, instável quando X'X é singular e as escalas diferem muito)
+    Xc = X - X.mean(axis=0)
+    coef = np.linalg.pinv(Xc, rcond=1e-12) @ (y - y.mean())
+    return coef, y.mean() - X.mean(axis=0) @ coef
+
+
+@pytest.mark.parametrize('n_campanhas', [4, 5])
+def test_full_rank_matches_sklearn(n_campanhas):
+    X, y, grupo = _transacoes(n_campanhas)
+    expected = LinearRegression().fit(X, y)
+    for stats in (RegressionStats.from_rows(X, y), _from_groups(X, y, grupo)):
+        model = LinearModel().fit_stats(stats)
+        assert model.rank_ == 3
+        np.testing.assert_allclose(model.coef_, expected.coef_, rtol=1e-6)
+        assert model.intercept_ == pytest.approx(expected.intercept_, rel=1e-6)
+        assert model.stderr_ is not None
+
+
+@pytest.mark.parametrize('n_campanhas', [2, 3])
+def test_rank_deficient_matches_sklearn(n_campanhas):
+    # Uma linha por campanha (sem linhas repetidas): o lstsq do scikit-learn devolve a
+    # solução de norma mínima, que é a mesma das estatísticas suficientes
+    X = CAMPANHAS_ESCALADAS.to_numpy()[:n_campanhas]
+    y = 1000.0 * np.arange(1, n_campanhas + 1) + 7.0
+    expected = LinearRegression().fit(X, y)
+    model = LinearModel().fit_stats(RegressionStats.from_rows(X, y))
+    assert model.rank_ == n_campanhas - 1
+    np.testing.assert_allclose(model.coef_, expected.coef_, rtol=1e-6)
+    assert model.intercept_ == pytest.approx(expected.intercept_, rel=1e-6)
+    assert model.stderr_ is None
+
+
+@pytest.mark.parametrize('n_campanhas', [2, 3])
+def test_rank_deficient_minimum_norm_with_real_scales(n_campanhas):
+    X, y, grupo = _transacoes(n_campanhas)
+    coef, intercept = _minimum_norm(X, y)
+    model = LinearModel().fit_stats(_from_groups(X, y, grupo))
+    assert model.rank_ == n_campanhas - 1
+    # Tolerância relativa à norma: a componente de 'conversao' (~1e-7) fica no nível do arredondamento
+    np.testing.assert_allclose(model.coef_, coef, rtol=0, atol=1e-8 * np.linalg.norm(coef))
+    assert model.intercept_ == pytest.approx(intercept, rel=1e-6)
+    # Com uma variável por grupo, a previsão de cada campanha é a média do gasto nela
+    np.testing.assert_allclose(model.predict(X), pd.Series(y).groupby(grupo).transform('mean'), rtol=1e-6)
+
+
+def test_merge_equals_single_pass():
+    X, y, _ = _transacoes(5)
+    merged = RegressionStats.from_rows(X[:100], y[:100]).merge(RegressionStats.from_rows(X[100:], y[100:]))
+    single = RegressionStats.from_rows(X, y)
+    np.testing.assert_allclose(LinearModel().fit_stats(merged).coef_, LinearModel().fit_stats(single).coef_, rtol=1e-9)
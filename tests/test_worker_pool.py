@@ -0,0 +1,167 @@
+"""Escalonador do WorkerPool (executor de threads): prioridade, memória, limites e pool quebrado."""
+import asyncio
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import metrics
+from worker_pool import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    ClientLimitExceeded,
+    ExceedsMemoryBudget,
+    PoolSaturated,
+    Ticket,
+    WorkerPool,
+)
+
+
+def _pool(**kwargs):
+    kwargs.setdefault('max_workers', 1)
+    kwargs.setdefault('max_queue', 10)
+    return WorkerPool('thread', **kwargs)
+
+
+def _wait(gate, result=None):
+    # Ocupa um worker até o teste liberar o gate
+    assert gate.wait(timeout=5)
+    return result
+
+
+def _fail(gate):
+    assert gate.wait(timeout=5)
+    raise BrokenProcessPool("worker morreu")
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=10))
+
+
+def test_queue_follows_priority_then_client_then_arrival():
+    async def scenario():
+        pool = _pool()
+        gate = threading.Event()
+        order = []
+        try:
+            blocker = pool.start(_wait, gate, ticket=Ticket('z'))
+            futures = [
+                pool.start(order.append, label, ticket=Ticket(client, priority=priority))
+                for label, client, priority in [
+                    ('a1', 'a', PRIORITY_BULK),
+                    ('a2', 'a', PRIORITY_BULK),
+                    ('b1', 'b', PRIORITY_BULK),
+                    ('c1', 'c', PRIORITY_INTERACTIVE),
+                    ('c2', 'c', PRIORITY_INTERACTIVE),
+                ]
+            ]
+            assert pool.running == 1 and pool.queued == 5
+            gate.set()
+            await asyncio.gather(blocker, *futures)
+        finally:
+            pool.shutdown()
+        return order
+
+    # Interativos antes dos jobs; entre os jobs, 'b' passa à frente da segunda tarefa de 'a'
+    assert _run(scenario()) == ['c1', 'c2', 'a1', 'b1', 'a2']
+
+
+def test_memory_budget_holds_the_head_of_the_queue():
+    async def scenario():
+        pool = _pool(max_workers=3, memory_budget=100)
+        first, second, third = threading.Event(), threading.Event(), threading.Event()
+        try:
+            with pytest.raises(ExceedsMemoryBudget):
+                pool.start(_wait, first, ticket=Ticket(cost=101))
+
+            running = pool.start(_wait, first, ticket=Ticket(cost=60))
+            large = pool.start(_wait, second, ticket=Ticket(cost=60))
+            # Caberia no orçamento, mas espera a tarefa grande à frente dela
+            small = pool.start(_wait, third, ticket=Ticket(cost=30))
+            assert (pool.running, pool.queued, pool.reserved) == (1, 2, 60)
+
+            first.set()
+            await running
+            assert (pool.running, pool.queued, pool.reserved) == (2, 0, 90)
+            second.set()
+            third.set()
+            await asyncio.gather(large, small)
+            assert (pool.running, pool.reserved) == (0, 0)
+        finally:
+            pool.shutdown()
+
+    _run(scenario())
+
+
+def test_client_limit_and_saturation():
+    async def scenario():
+        pool = _pool(max_queue=2, client_limit=2)
+        gate = threading.Event()
+        try:
+            futures = [pool.start(_wait, gate, ticket=Ticket('a')) for _ in range(2)]
+            with pytest.raises(ClientLimitExceeded) as exc:
+                pool.start(_wait, gate, ticket=Ticket('a'))
+            assert exc.value.client == 'a'
+            assert pool.clients() == {'a': 2}
+
+            # Um worker ocupado e a fila (2 vagas) com uma tarefa de 'a' e uma de 'b'
+            futures.append(pool.start(_wait, gate, ticket=Ticket('b')))
+            with pytest.raises(PoolSaturated):
+                pool.start(_wait, gate, ticket=Ticket('c'))
+            assert pool.clients() == {'a': 2, 'b': 1}
+
+            gate.set()
+            await asyncio.gather(*futures)
+            assert pool.clients() == {}
+            assert await pool.start(_wait, gate, 'ok', ticket=Ticket('a')) == 'ok'
+        finally:
+            pool.shutdown()
+
+    _run(scenario())
+
+
+def test_broken_pool_discards_only_its_own_executor():
+    async def scenario():
+        pool = _pool(max_workers=2)
+        first, second, third = threading.Event(), threading.Event(), threading.Event()
+        try:
+            failing = pool.start(_fail, first)
+            late = pool.start(_fail, second)
+            broken = pool._executor
+
+            first.set()
+            with pytest.raises(BrokenProcessPool):
+                await failing
+            assert pool._executor is None
+
+            # O próximo pedido recria o executor; a falha atrasada do pool antigo não o derruba
+            fresh = pool.start(_wait, third, 'ok')
+            current = pool._executor
+            assert current is not None and current is not broken
+            second.set()
+            with pytest.raises(BrokenProcessPool):
+                await late
+            assert pool._executor is current
+
+            third.set()
+            assert await fresh == 'ok'
+        finally:
+            pool.shutdown()
+
+    _run(scenario())
+
+
+def test_thread_executor_skips_peak_memory(monkeypatch):
+    # O VmHWM é do processo inteiro: com threads ele não mede uma análise isolada
+    monkeypatch.setattr(metrics, '_measure_peak_memory', True)
+
+    async def scenario():
+        pool = _pool()
+        try:
+            return await pool.start(lambda: metrics.StageClock().finish())
+        finally:
+            pool.shutdown()
+
+    timings = _run(scenario())
+    assert timings['peak_memory_delta'] is None
+    metrics.record_analysis(timings)
@@ -0,0 +1,29 @@
+import hashlib
+import os
+import tempfile
+
+import settings
+
+
+def spool_upload(upload_file, chunk_size=None):
+    # Copia o upload em blocos para um arquivo temporário que os workers conseguem abrir,
+    # calculando o hash do conteúdo no mesmo passo (chave do cache de resultados)
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_BYTES
+    digest = hashlib.sha256()
+    upload_file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix='.csv', dir=settings.UPLOAD_DIR, delete=False) as dest:
+        while True:
+            chunk = upload_file.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dest.write(chunk)
+    return dest.name, digest.hexdigest()
+
+
+def remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
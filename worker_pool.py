@@ -0,0 +1,337 @@
+import asyncio
+import functools
+import heapq
+import importlib
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+
+import metrics
+import settings
+import tasks
+
+
+# Prioridades da fila: menor executa antes
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+class PoolSaturated(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Pool de análise saturado")
+        self.retry_after = retry_after
+
+
+class ClientLimitExceeded(Exception):
+    def __init__(self, client, retry_after):
+        super().__init__(f"Limite de análises simultâneas atingido para o cliente {client}")
+        self.client = client
+        self.retry_after = retry_after
+
+
+class ExceedsMemoryBudget(Exception):
+    def __init__(self, cost, budget):
+        super().__init__(f"Memória estimada da análise ({cost} bytes) acima do orçamento ({budget} bytes)")
+        self.cost = cost
+        self.budget = budget
+
+
+class Ticket(NamedTuple):
+    """Quem pede a tarefa, quanta memória ela deve usar e sua prioridade (ver WorkerPool.start)."""
+    client: str = None
+    cost: int = 0
+    priority: int = PRIORITY_INTERACTIVE
+
+
+def memory_estimate(input_bytes):
+    # Memória estimada de uma análise a partir do tamanho da entrada (CSV ou dataset)
+    return settings.ANALYSIS_MEMORY_BASE + int(input_bytes * settings.ANALYSIS_MEMORY_FACTOR)
+
+
+def analysis_ticket(client, input_bytes, interactive=True):
+    # Pedidos síncronos pequenos passam à frente de jobs e de uploads grandes
+    small = input_bytes <= settings.ANALYSIS_INTERACTIVE_MAX_BYTES
+    priority = PRIORITY_INTERACTIVE if interactive and small else PRIORITY_BULK
+    return Ticket(client, memory_estimate(input_bytes), priority)
+
+
+class _Task:
+    def __init__(self, fn, args, ticket, future):
+        self.fn = fn
+        self.args = args
+        self.ticket = ticket
+        self.future = future
+        # Executor que recebeu a tarefa (ver WorkerPool._discard_executor)
+        self.executor = None
+
+
+# Fila de progresso herdada pelos workers (ver _init_worker)
+_progress_queue = None
+
+
+def _import_modules(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _limit_memory(max_bytes):
+    # Uma alocação acima do limite levanta MemoryError na análise, em vez de o
+    # sistema matar o worker (RLIMIT_DATA: heap e mapeamentos anônimos, Linux)
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_DATA, (max_bytes, max_bytes))
+    except (ImportError, AttributeError, ValueError, OSError):
+        pass
+
+
+def _init_worker(progress_queue, preload=(), memory_limit=0):
+    global _progress_queue
+    _progress_queue = progress_queue
+    if memory_limit:
+        _limit_memory(memory_limit)
+    # Importa o pipeline na criação do worker, e não na primeira análise
+    _import_modules(preload)
+
+
+def _release_on_memory_error(fn, *args):
+    # Executado no worker com limite de memória: a MemoryError devolvida ao servidor
+    # não leva o traceback, que manteria vivos os arrays da análise enquanto o
+    # resultado é serializado (e a serialização também falharia por falta de memória)
+    try:
+        return fn(*args)
+    except MemoryError as exc:
+        message = str(exc)
+    raise MemoryError(message)
+
+
+def report_progress(job_id, stage):
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, stage))
+
+
+def run_with_progress(job_id, fn, *args):
+    # Executado dentro do worker: fn recebe um callback que publica o estágio atual
+    return fn(*args, progress=functools.partial(report_progress, job_id))
+
+
+class WorkerPool:
+    """Pool limitado que executa a análise (CPU-bound) fora do event loop.
+
+    As tarefas passam por um escalonador antes de chegar ao executor. Cada uma
+    traz um ``Ticket``: o cliente que a pediu, a memória estimada e a prioridade.
+    Uma tarefa só é enviada ao executor se houver um worker livre e se a memória
+    reservada pelas que estão executando, somada à dela, couber em ``memory_budget``.
+    As demais aguardam em uma fila de prioridade: primeiro a prioridade, depois
+    quantas tarefas o cliente já tinha no pool (clientes diferentes se
+    intercalam) e, por fim, a ordem de chegada. Sem lugar na fila, o pedido é
+    recusado na hora (PoolSaturated); acima de ``client_limit`` tarefas de um
+    mesmo cliente, também (ClientLimitExceeded).
+    """
+
+    def __init__(self, kind, max_workers, max_queue, retry_after=30, start_method="spawn", preload=(),
+                 memory_budget=0, client_limit=0, worker_memory_limit=0):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Executor de análise desconhecido: {kind}")
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self.start_method = start_method
+        self.preload = tuple(preload)
+        # 0 desativa o orçamento de memória e o limite por cliente
+        self.memory_budget = memory_budget
+        self.client_limit = client_limit
+        self.worker_memory_limit = worker_memory_limit
+        self.running = 0
+        self.reserved = 0
+        self.on_progress = None
+        self._executor = None
+        self._progress_queue = None
+        self._waiting = []
+        self._sequence = itertools.count()
+        # Cliente -> tarefas executando ou na fila
+        self._clients = {}
+
+    @property
+    def queued(self):
+        return len(self._waiting)
+
+    @property
+    def in_flight(self):
+        return self.running + self.queued
+
+    def clients(self):
+        return dict(self._clients)
+
+    def _get_executor(self):
+        # Criado sob demanda para não pagar o custo dos processos em GET / e /health
+        if self._executor is None and self.kind == "process":
+            try:
+                self._start_progress_listener()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=(self._progress_queue, self.preload, self.worker_memory_limit),
+                )
+            except (OSError, ImportError):
+                # Sem semáforos POSIX (ex.: /dev/shm ausente em runtimes serverless): usa threads
+                self._stop_progress_listener()
+                self.kind = "thread"
+        if self._executor is None:
+            self._start_progress_listener()
+            if self.kind == "thread":
+                # Sem preload aqui: a importação bloquearia o event loop (ver warm). O pico de
+                # memória não é medido: o VmHWM é do servidor inteiro, não de uma análise
+                _init_worker(self._progress_queue)
+                metrics.disable_peak_memory()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="analysis"
+                )
+        return self._executor
+
+    def _start_progress_listener(self):
+        if self._progress_queue is not None:
+            return
+        if self.kind == "process":
+            self._progress_queue = multiprocessing.get_context(self.start_method).Queue()
+        else:
+            self._progress_queue = queue.Queue()
+        threading.Thread(
+            target=self._drain_progress, args=(self._progress_queue,),
+            name="analysis-progress", daemon=True,
+        ).start()
+
+    def _stop_progress_listener(self):
+        progress_queue, self._progress_queue = self._progress_queue, None
+        if progress_queue is not None:
+            progress_queue.put(None)
+
+    def _drain_progress(self, progress_queue):
+        while True:
+            item = progress_queue.get()
+            if item is None:
+                return
+            if self.on_progress is not None:
+                self.on_progress(*item)
+
+    def _fits(self, ticket):
+        if self.running >= self.max_workers:
+            return False
+        return not self.memory_budget or self.reserved + ticket.cost <= self.memory_budget
+
+    def start(self, fn, *args, ticket=None):
+        # Chamado apenas a partir do event loop, então os contadores não precisam de lock.
+        # A vaga (no executor ou na fila) é reservada de forma síncrona, antes de qualquer await.
+        ticket = ticket or Ticket()
+        if self.memory_budget and ticket.cost > self.memory_budget:
+            raise ExceedsMemoryBudget(ticket.cost, self.memory_budget)
+        active = self._clients.get(ticket.client, 0)
+        if ticket.client is not None and self.client_limit and active >= self.client_limit:
+            raise ClientLimitExceeded(ticket.client, self.retry_after)
+
+        task = _Task(fn, args, ticket, asyncio.get_running_loop().create_future())
+        if not self._waiting and self._fits(ticket):
+            self._run(task)
+        elif len(self._waiting) < self.max_queue:
+            heapq.heappush(self._waiting, (ticket.priority, active, next(self._sequence), task))
+            self._dispatch()
+        else:
+            raise PoolSaturated(self.retry_after)
+        self._clients[ticket.client] = active + 1
+        return task.future
+
+    def _dispatch(self):
+        # A tarefa à frente da fila espera até caber, mesmo que outras menores coubessem:
+        # sem isso uma análise grande nunca executaria com o pool sempre ocupado
+        while self._waiting and self._fits(self._waiting[0][-1].ticket):
+            task = heapq.heappop(self._waiting)[-1]
+            if task.future.cancelled():
+                # Pedido abandonado enquanto aguardava (ex.: cliente desconectou)
+                self._release_client(task.ticket.client)
+            else:
+                self._run(task)
+
+    def _run(self, task):
+        fn, args = task.fn, task.args
+        if self.kind == "process" and self.worker_memory_limit:
+            fn, args = _release_on_memory_error, (fn, *args)
+        loop = asyncio.get_running_loop()
+        task.executor = self._get_executor()
+        try:
+            future = loop.run_in_executor(task.executor, fn, *args)
+        except BrokenProcessPool:
+            # Um worker morreu sem tarefa em andamento; recria o pool
+            self._discard_executor(task.executor)
+            task.executor = self._get_executor()
+            future = loop.run_in_executor(task.executor, fn, *args)
+        self.running += 1
+        self.reserved += task.ticket.cost
+        future.add_done_callback(functools.partial(self._on_done, task))
+
+    def _release_client(self, client):
+        remaining = self._clients.pop(client, 0) - 1
+        if remaining > 0:
+            self._clients[client] = remaining
+
+    def _on_done(self, task, future):
+        self.running -= 1
+        self.reserved -= task.ticket.cost
+        self._release_client(task.ticket.client)
+        if future.cancelled():
+            task.future.cancel()
+        elif not task.future.done():
+            if future.exception() is not None:
+                task.future.set_exception(future.exception())
+            else:
+                task.future.set_result(future.result())
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            # Um worker morreu (ex.: OOM); descarta o pool para o próximo pedido recriá-lo
+            self._discard_executor(task.executor)
+        self._dispatch()
+
+    def warm(self):
+        # Chamado no startup do servidor: cria os workers e importa o pipeline em segundo
+        # plano. No modo process cada tarefa sobe um worker, que importa os módulos no
+        # initializer; no modo thread basta importar uma vez, em uma das threads.
+        executor = self._get_executor()
+        if self.kind == "process":
+            return [executor.submit(os.getpid) for _ in range(self.max_workers)]
+        return [executor.submit(_import_modules, self.preload)]
+
+    async def submit(self, fn, *args, ticket=None):
+        return await self.start(fn, *args, ticket=ticket)
+
+    def _discard_executor(self, executor):
+        # Só o executor em uso: as tarefas de um pool quebrado terminam uma a uma, e as
+        # últimas não podem derrubar o pool novo, já recriado para os pedidos seguintes
+        if executor is not None and executor is self._executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        waiting, self._waiting = self._waiting, []
+        for *_, task in waiting:
+            task.future.cancel()
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._stop_progress_listener()
+
+
+pool = WorkerPool(
+    settings.ANALYSIS_EXECUTOR,
+    settings.ANALYSIS_WORKERS,
+    settings.ANALYSIS_MAX_QUEUE,
+    retry_after=settings.ANALYSIS_RETRY_AFTER,
+    start_method=settings.ANALYSIS_START_METHOD,
+    preload=tasks.PIPELINE_MODULES if settings.PRELOAD else (),
+    memory_budget=settings.ANALYSIS_MEMORY_BUDGET,
+    client_limit=settings.ANALYSIS_CLIENT_MAX_ACTIVE,
+    worker_memory_limit=settings.ANALYSIS_WORKER_MEMORY_LIMIT,
+)